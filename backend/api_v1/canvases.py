@@ -23,6 +23,7 @@ Canvas Sharing & Access:
 
 Drawing Operations:
 - GET /api/v1/canvases/<id>/strokes - Get drawing strokes
+- GET /api/v1/canvases/<id>/strokes/since - Get strokes and markers after a cursor
 - POST /api/v1/canvases/<id>/strokes - Submit new stroke
 - DELETE /api/v1/canvases/<id>/strokes - Clear all strokes
 
@@ -54,6 +55,7 @@ from routes.rooms import (
     transfer_ownership,
     leave_room,
     get_strokes,
+    get_strokes_since,
     post_stroke,
     room_undo,
     room_redo,
@@ -90,6 +92,8 @@ canvases_v1_bp.add_url_rule('/<canvasId>/leave', 'leave_canvas',
 
 canvases_v1_bp.add_url_rule('/<canvasId>/strokes', 'get_strokes', 
                             adapt_canvas_to_room(get_strokes), methods=['GET'])
+canvases_v1_bp.add_url_rule('/<canvasId>/strokes/since', 'get_strokes_since', 
+                            adapt_canvas_to_room(get_strokes_since), methods=['GET'])
 canvases_v1_bp.add_url_rule('/<canvasId>/strokes', 'post_stroke', 
                             adapt_canvas_to_room(post_stroke), methods=['POST'])
 canvases_v1_bp.add_url_rule('/<canvasId>/strokes', 'clear_strokes', 
@@ -35,6 +35,9 @@ from services.db import redis_client
 from services.canvas_counter import get_canvas_draw_count
 from services.graphql_service import commit_transaction_via_graphql
 from services.graphql_retry_worker import start_retry_worker, stop_retry_worker
+from services.room_snapshot import start_snapshot_worker, stop_snapshot_worker
+from services.commit_outbox import start_commit_workers, stop_commit_workers
+from services.room_activity import start_activity_flusher, stop_activity_flusher
 from config import *
 
 app = Flask(__name__)
@@ -227,9 +230,21 @@ app.register_blueprint(analytics_bp)
 # Worker sleeps 2 seconds on startup to ensure Redis/MongoDB are ready
 start_retry_worker()
 
+# Rebuild room snapshots invalidated by undo/redo/cut/clear in the background
+start_snapshot_worker()
+
+# Drain the ResilientDB commit outbox filled by the room stroke/marker routes
+start_commit_workers()
+
+# Flush debounced rooms.updatedAt activity to Mongo every few seconds
+start_activity_flusher()
+
 # Register cleanup on shutdown
 import atexit
 atexit.register(stop_retry_worker)
+atexit.register(stop_snapshot_worker)
+atexit.register(stop_commit_workers)
+atexit.register(stop_activity_flusher)
 
 if __name__ == '__main__':
     if not redis_client.exists('res-canvas-draw-count'):
@@ -0,0 +1,90 @@
+"""
+Throughput benchmark for services.parallel_decrypt.
+
+Encrypts a synthetic private-room history and decrypts it with
+parallel_map() at increasing worker counts, reporting strokes per second
+against the sequential baseline. Each item does what the read paths do per
+stroke: base64-decode the bundle, AES-GCM decrypt, json.loads.
+
+The room key is generated locally (AESGCM directly, the same primitive
+crypto_service uses) so the benchmark needs no master key, Mongo or Redis.
+
+Run from backend/:
+  python -m benchmarks.parallel_decrypt_benchmark [--strokes N] [--workers 1,2,4,8]
+"""
+import argparse
+import base64
+import json
+import os
+import time
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from services.parallel_decrypt import parallel_map
+
+
+def _stroke(i):
+  return {
+    "id": f"stroke-{i}",
+    "user": "alice",
+    "color": "#336699",
+    "lineWidth": 4,
+    "pathData": [[x, x * 2] for x in range(256)],
+    "ts": 1700000000000 + i,
+  }
+
+
+def sample_history(n, room_key):
+  aes = AESGCM(room_key)
+  docs = []
+  for i in range(n):
+    nonce = os.urandom(12)
+    ct = aes.encrypt(nonce, json.dumps(_stroke(i)).encode(), None)
+    docs.append({"roomId": "r1", "ts": 1700000000000 + i,
+                 "blob": {"nonce": base64.b64encode(nonce).decode(), "ct": base64.b64encode(ct).decode()}})
+  return docs
+
+
+def _decoder(room_key):
+  aes = AESGCM(room_key)
+
+  def decode(doc):
+    blob = doc["blob"]
+    raw = aes.decrypt(base64.b64decode(blob["nonce"]), base64.b64decode(blob["ct"]), None)
+    return json.loads(raw)
+  return decode
+
+
+def _best_seconds(fn, repeat=3):
+  best = None
+  for _ in range(repeat):
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+def run(strokes=20000, workers=(1, 2, 4, 8)):
+  """Return {"cpus": int, "strokes": int, "results": {workers: {"strokes_per_s", "speedup"}}}."""
+  room_key = AESGCM.generate_key(bit_length=256)
+  docs = sample_history(strokes, room_key)
+  decode = _decoder(room_key)
+
+  baseline = _best_seconds(lambda: [decode(d) for d in docs])
+  results = {"sequential": {"strokes_per_s": round(strokes / baseline), "speedup": 1.0}}
+  for w in workers:
+    out = []
+    elapsed = _best_seconds(lambda: out.append(parallel_map(decode, docs, workers=w)))
+    assert [s["id"] for s in out[-1][:3]] == ["stroke-0", "stroke-1", "stroke-2"]
+    results[w] = {"strokes_per_s": round(strokes / elapsed), "speedup": round(baseline / elapsed, 2)}
+  return {"cpus": os.cpu_count(), "strokes": strokes, "results": results}
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--strokes", type=int, default=20000)
+  parser.add_argument("--workers", default="1,2,4,8")
+  args = parser.parse_args()
+  counts = tuple(int(w) for w in args.workers.split(",") if w)
+  print(json.dumps(run(args.strokes, counts), indent=2))
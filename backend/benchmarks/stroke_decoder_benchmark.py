@@ -0,0 +1,129 @@
+"""
+Micro-benchmark for services.stroke_decoder.
+
+Times decode_stroke() against the hand-rolled cascade the read paths used
+before (try every shape, json.loads each layer, deep-normalize $numberLong
+wrappers) over representative documents of each plaintext storage shape.
+
+Run from backend/:
+  python -m benchmarks.stroke_decoder_benchmark [--rounds N]
+"""
+import argparse
+import json
+import time
+
+from services.stroke_decoder import decode_stroke, coerce_ts
+
+
+def _stroke(i=1):
+  return {
+    "id": f"stroke-{i}",
+    "drawingId": f"drawing-{i}",
+    "user": "alice",
+    "color": "#336699",
+    "lineWidth": 4,
+    "pathData": [[x, x * 2] for x in range(64)],
+    "timestamp": {"$numberLong": str(1700000000000 + i)},
+    "brushStyle": "round",
+    "metadata": {"brushType": "normal", "brushParams": {}},
+  }
+
+
+def sample_documents():
+  """One representative document per plaintext storage shape."""
+  stroke = _stroke()
+  return {
+    "stroke": {"roomId": "r1", "ts": 1700000000001, "stroke": stroke},
+    "transactions": {"transactions": [{"value": {"asset": {"data": {"roomId": "r1", "stroke": stroke}}}}]},
+    "asset": {"asset": {"data": {"roomId": "r1", "value": json.dumps(stroke)}}},
+    "value": {"value": json.dumps(json.dumps(stroke))},
+  }
+
+
+def _normalize_numberlong(o):
+  if isinstance(o, dict):
+    if "$numberLong" in o:
+      return int(o["$numberLong"])
+    return {k: _normalize_numberlong(v) for k, v in o.items()}
+  if isinstance(o, list):
+    return [_normalize_numberlong(x) for x in o]
+  return o
+
+
+def legacy_decode(doc):
+  """The pre-decoder cascade, kept here as the baseline."""
+  stroke_data = None
+  if "transactions" in doc and doc["transactions"]:
+    try:
+      asset_data = doc["transactions"][0]["value"]["asset"]["data"]
+      if "stroke" in asset_data:
+        stroke_data = asset_data["stroke"]
+    except (KeyError, IndexError, TypeError):
+      pass
+  if stroke_data is None:
+    if "stroke" in doc:
+      stroke_data = doc["stroke"]
+    elif "asset" in doc and "data" in doc["asset"]:
+      if "stroke" in doc["asset"]["data"]:
+        stroke_data = doc["asset"]["data"]["stroke"]
+      elif "value" in doc["asset"]["data"]:
+        stroke_data = json.loads(doc["asset"]["data"].get("value", "{}"))
+    elif "value" in doc:
+      try:
+        stroke_data = json.loads(doc["value"])
+        if isinstance(stroke_data, str):
+          stroke_data = json.loads(stroke_data)
+      except Exception:
+        stroke_data = None
+  if not isinstance(stroke_data, dict):
+    return None
+  stroke_data = _normalize_numberlong(stroke_data)
+  try:
+    st_ts = int(stroke_data.get("ts") or stroke_data.get("timestamp"))
+  except Exception:
+    st_ts = None
+  stroke_data["ts"] = st_ts
+  return stroke_data
+
+
+def current_decode(doc):
+  stroke_data = decode_stroke(doc)
+  if stroke_data is None:
+    return None
+  stroke_data["ts"] = coerce_ts(stroke_data.get("ts") or stroke_data.get("timestamp"))
+  return stroke_data
+
+
+def _time_per_doc_us(fn, doc, rounds, repeat=3):
+  # Decoders write ts in place, so every call gets its own pre-built copy
+  raw = json.dumps(doc)
+  best = None
+  for _ in range(repeat):
+    copies = [json.loads(raw) for _ in range(rounds)]
+    t0 = time.perf_counter()
+    for d in copies:
+      fn(d)
+    elapsed = time.perf_counter() - t0
+    best = elapsed if best is None else min(best, elapsed)
+  return best / rounds * 1e6
+
+
+def run(rounds=5000):
+  """Return {shape: {"legacy_us": float, "decoder_us": float, "speedup": float}}."""
+  results = {}
+  for shape, doc in sample_documents().items():
+    legacy_us = _time_per_doc_us(legacy_decode, doc, rounds)
+    decoder_us = _time_per_doc_us(current_decode, doc, rounds)
+    results[shape] = {
+      "legacy_us": round(legacy_us, 3),
+      "decoder_us": round(decoder_us, 3),
+      "speedup": round(legacy_us / decoder_us, 2) if decoder_us else None,
+    }
+  return results
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--rounds", type=int, default=5000)
+  args = parser.parse_args()
+  print(json.dumps(run(args.rounds), indent=2))
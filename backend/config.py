@@ -14,6 +14,13 @@ SIGNER_PRIVATE_KEY = os.getenv("SIGNER_PRIVATE_KEY")
 RECIPIENT_PUBLIC_KEY = SIGNER_PUBLIC_KEY
 
 GRAPHQL_URL = os.getenv("RESILIENTDB_GRAPHQL_URI")
+
+# GraphQL client: pooled keep-alive session, timeouts and circuit breaker
+GRAPHQL_POOL_SIZE = int(os.getenv("GRAPHQL_POOL_SIZE", "16"))
+GRAPHQL_CONNECT_TIMEOUT = float(os.getenv("GRAPHQL_CONNECT_TIMEOUT", "3.05"))
+GRAPHQL_READ_TIMEOUT = float(os.getenv("GRAPHQL_READ_TIMEOUT", "15"))
+GRAPHQL_BREAKER_THRESHOLD = int(os.getenv("GRAPHQL_BREAKER_THRESHOLD", "5"))  # consecutive failures before opening
+GRAPHQL_BREAKER_RESET_SECS = float(os.getenv("GRAPHQL_BREAKER_RESET_SECS", "30"))  # open period before a probe
 MONGO_URI = os.getenv("MONGO_ATLAS_URI")
 DB_NAME = "canvasCache"
 COLLECTION_NAME = "strokes"
@@ -22,6 +22,7 @@ import asyncio
 import json
 import logging
 import ssl
+from collections import deque
 from typing import Optional
 
 import httpx
@@ -54,6 +55,13 @@ class ResilientPythonCache(AsyncIOEventEmitter):
         self.is_closing: bool = False
         self.reconnect_attempts: int = 0
         self.mongo_client = None
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+        # One sync pass at a time owns current_block_number; triggers that
+        # arrive while it runs are folded into another pass
+        self._sync_lock = asyncio.Lock()
+        self._sync_pending: bool = False
+        self._pushed_blocks: list = []
 
         self.initialize_endpoints()
 
@@ -107,84 +115,142 @@ class ResilientPythonCache(AsyncIOEventEmitter):
     async def fetch_and_sync_initial_blocks(self):
         try:
             last_block = await self.collection.find_one({}, sort=[("id", -1)])
-            self.current_block_number = last_block['id'] if last_block and 'id' in last_block else 0
-
-            batch_size = 100
-            concurrency_limit = 5
-
-            batch_ranges = []
-            blocks_fetched = True
-
-            async with httpx.AsyncClient(verify=False) as client:
-                while blocks_fetched:
-                    min_seq = self.current_block_number + 1
-                    max_seq = min_seq + batch_size - 1
-
-                    url = f"{self.http_endpoint}/{min_seq}/{max_seq}"
-                    logger.info(f"Checking for blocks from {min_seq} to {max_seq}")
-                    response  = await client.get(url)
-                    logger.info(f"Response Status Code {response.status_code}")
-                    if response.status_code != 200:
-                        logger.error(f"Invalid response status from {url}: {response.status_code}")
-                        blocks = None
-                    else:
-                        try:
-                            blocks = response.json()
-                        except Exception as e:
-                            logger.error(f"Invalid JSON response from {url}: {e}")
-                            blocks = None
-
-                    if isinstance(blocks, list) and blocks:
-                        self.current_block_number = max(block.get('id', 0) for block in blocks)
-                        batch_ranges.append({'min_seq': min_seq, 'max_seq': max_seq})
-                    else:
-                        blocks_fetched = False
+            async with self._sync_lock:
+                self.current_block_number = last_block['id'] if last_block and 'id' in last_block else 0
+                synced = await self.sync_blocks()
+                # Pushes and triggers that arrived meanwhile found the lock held
+                await self.run_pending_passes()
 
-            if not batch_ranges:
+            if not synced:
                 logger.info("No new blocks to sync.")
-                return
-
-            logger.info(f"Total batches to fetch: {len(batch_ranges)}")
-
-            semaphore = asyncio.Semaphore(concurrency_limit)
-            tasks = [self.fetch_and_sync_batch(batch['min_seq'], batch['max_seq'], semaphore)
-                     for batch in batch_ranges]
-            await asyncio.gather(*tasks)
 
         except Exception as e:
             logger.error("Error fetching initial blocks:")
             logger.error(e)
             raise ResilientPythonCacheError(str(e)) from e
 
-    async def fetch_and_sync_batch(self, min_seq: int, max_seq: int, semaphore: asyncio.Semaphore):
-        async with semaphore:
-            try:
-                async with httpx.AsyncClient(verify=False) as client:
-                    url = f"{self.http_endpoint}/{min_seq}/{max_seq}"
-                    logger.info(f"Fetching blocks from {min_seq} to {max_seq}")
-                    response = await client.get(url)
-                    blocks = response.json()
-
-                if isinstance(blocks, list) and blocks:
-                    processed_blocks = self.process_blocks(blocks)
-                    bulk_ops = [
-                        UpdateOne(
-                            {'id': block['id']},
-                            {'$set': block},
-                            upsert=True
-                        ) for block in processed_blocks
-                    ]
-
-                    if bulk_ops:
-                        result = await self.collection.bulk_write(bulk_ops)
-                        logger.info(f"Blocks {min_seq} to {max_seq} synced: "
-                                    f"Inserted {result.upserted_count}, Modified {result.modified_count}")
-                        self.emit('data', processed_blocks)  # Emit 'data' event with new blocks
-                else:
-                    logger.info(f"No blocks fetched for range {min_seq} to {max_seq}")
-            except Exception as e:
-                logger.error(f"Error fetching blocks from {min_seq} to {max_seq}:")
-                logger.error(e)
+    def _get_http_client(self) -> httpx.AsyncClient:
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(verify=False)
+        return self.http_client
+
+    async def fetch_blocks(self, min_seq: int, max_seq: int) -> list:
+        """GET one block range. An error status or body reads as no blocks."""
+        url = f"{self.http_endpoint}/{min_seq}/{max_seq}"
+        logger.info(f"Fetching blocks from {min_seq} to {max_seq}")
+        response = await self._get_http_client().get(url)
+        if response.status_code != 200:
+            logger.error(f"Invalid response status from {url}: {response.status_code}")
+            return []
+        try:
+            blocks = response.json()
+        except Exception as e:
+            logger.error(f"Invalid JSON response from {url}: {e}")
+            return []
+        return blocks if isinstance(blocks, list) else []
+
+    def contiguous_run(self, blocks: list) -> list:
+        """The blocks that continue directly from current_block_number, in order."""
+        by_id = {block['id']: block for block in blocks if block['id'] > self.current_block_number}
+        run = []
+        next_id = self.current_block_number + 1
+        while next_id in by_id:
+            run.append(by_id[next_id])
+            next_id += 1
+        return run
+
+    async def store_blocks(self, blocks: list):
+        """
+        Upsert blocks, emit 'data' and advance current_block_number. Caller
+        holds the sync lock and passes a contiguous_run().
+        """
+        processed_blocks = self.process_blocks(blocks)
+        bulk_ops = [
+            UpdateOne(
+                {'id': block['id']},
+                {'$set': block},
+                upsert=True
+            ) for block in processed_blocks
+        ]
+        if not bulk_ops:
+            return
+
+        result = await self.collection.bulk_write(bulk_ops, ordered=False)
+        min_id = min(block['id'] for block in processed_blocks)
+        max_id = max(block['id'] for block in processed_blocks)
+        logger.info(f"Blocks {min_id} to {max_id} synced: "
+                    f"Inserted {result.upserted_count}, Modified {result.modified_count}")
+        self.current_block_number = max(self.current_block_number, max_id)
+        self.emit('data', processed_blocks)  # Emit 'data' event with new blocks
+
+    async def sync_blocks(self) -> int:
+        """
+        Fetch and store every block after current_block_number. Caller holds
+        the sync lock. Returns the number of blocks stored.
+
+        Each range of batch_size blocks is fetched exactly once. Up to
+        fetch_concurrency range requests are kept in flight while the
+        previous range is written to MongoDB, and ranges are stored strictly
+        in order. Only the run of blocks that continues from
+        current_block_number is stored, so a gap inside a range ends the pass
+        and is fetched again by the next one. The window starts
+        at one request and doubles while ranges come back full, so an idle
+        chain costs a single GET per pass. A short or empty range means the
+        head was reached; speculative requests past it are cancelled.
+        """
+        batch_size = self.resilient_db_config.batch_size
+        max_in_flight = max(1, self.resilient_db_config.fetch_concurrency)
+        window = 1
+        next_seq = self.current_block_number + 1
+        in_flight = deque()
+        synced = 0
+
+        try:
+            while True:
+                while len(in_flight) < window:
+                    max_seq = next_seq + batch_size - 1
+                    in_flight.append((next_seq, max_seq,
+                                      asyncio.create_task(self.fetch_blocks(next_seq, max_seq))))
+                    next_seq = max_seq + 1
+
+                min_seq, max_seq, task = in_flight.popleft()
+                blocks = self.contiguous_run([block for block in await task
+                                              if isinstance(block, dict) and isinstance(block.get('id'), int)])
+                if not blocks:
+                    break
+
+                await self.store_blocks(blocks)
+                synced += len(blocks)
+                if self.current_block_number < max_seq:
+                    break
+                window = min(window * 2, max_in_flight)
+        finally:
+            for _, _, task in in_flight:
+                task.cancel()
+            if in_flight:
+                await asyncio.gather(*(task for _, _, task in in_flight), return_exceptions=True)
+
+        return synced
+
+    async def store_pushed_blocks(self) -> bool:
+        """
+        Store blocks delivered in WebSocket messages, if they continue
+        directly from current_block_number. Caller holds the sync lock.
+        Returns False when a gap remains that has to be fetched over HTTP.
+        """
+        pushed, self._pushed_blocks = self._pushed_blocks, []
+        pushed = [block for block in pushed
+                  if isinstance(block, dict) and isinstance(block.get('id'), int)]
+        if not pushed:
+            return False
+        newer = [block for block in pushed if block['id'] > self.current_block_number]
+        if not newer:
+            return True
+
+        run = self.contiguous_run(newer)
+        if run:
+            await self.store_blocks(run)
+        return len(run) == len({block['id'] for block in newer})
 
     def process_blocks(self, blocks: list) -> list:
         for block in blocks:
@@ -211,44 +277,32 @@ class ResilientPythonCache(AsyncIOEventEmitter):
         except asyncio.CancelledError:
             pass  # Allow task to be cancelled gracefully
 
-    async def fetch_and_sync_new_blocks(self):
-        try:
-            batch_size = 100
-            concurrency_limit = 5
-            batch_ranges = []
-            blocks_fetched = True
-
-            async with httpx.AsyncClient(verify=False) as client:
-                while blocks_fetched:
-                    min_seq = self.current_block_number + 1
-                    max_seq = min_seq + batch_size - 1
-
-                    url = f"{self.http_endpoint}/{min_seq}/{max_seq}"
-                    logger.info(f"Checking for new blocks from {min_seq} to {max_seq}")
-                    response = await client.get(url)
-                    blocks = response.json()
-
-                    if isinstance(blocks, list) and blocks:
-                        self.current_block_number = max(block.get('id', 0) for block in blocks)
-                        batch_ranges.append({'min_seq': min_seq, 'max_seq': max_seq})
-                    else:
-                        blocks_fetched = False
-
-            if not batch_ranges:
-                logger.info("No new blocks to sync.")
-                return
-
-            logger.info(f"Total new batches to fetch: {len(batch_ranges)}")
-
-            semaphore = asyncio.Semaphore(concurrency_limit)
-            tasks = [self.fetch_and_sync_batch(batch['min_seq'], batch['max_seq'], semaphore)
-                     for batch in batch_ranges]
-            await asyncio.gather(*tasks)
+    async def fetch_and_sync_new_blocks(self, pushed_blocks: Optional[list] = None):
+        """
+        Sync new blocks, preferring blocks pushed over the WebSocket. If a
+        pass is already running the request is recorded and that pass runs
+        once more instead of starting a second writer.
+        """
+        if pushed_blocks:
+            self._pushed_blocks.extend(pushed_blocks)
+        self._sync_pending = True
+        if self._sync_lock.locked():
+            return
+
+        async with self._sync_lock:
+            try:
+                await self.run_pending_passes()
+            except Exception as e:
+                logger.error("Error fetching new blocks:")
+                logger.error(e)
+                self.emit('error', e)
 
-        except Exception as e:
-            logger.error("Error fetching new blocks:")
-            logger.error(e)
-            self.emit('error', e)
+    async def run_pending_passes(self):
+        """Run sync passes until no trigger is pending. Caller holds the sync lock."""
+        while self._sync_pending and not self.is_closing:
+            self._sync_pending = False
+            if not await self.store_pushed_blocks():
+                await self.sync_blocks()
 
     async def connect_websocket(self):
         try:
@@ -272,7 +326,9 @@ class ResilientPythonCache(AsyncIOEventEmitter):
                         parsed_message = {"type": message}
 
                     if parsed_message.get("type") == "Update blocks":
-                        await self.fetch_and_sync_new_blocks()
+                        pushed_blocks = parsed_message.get("blocks")
+                        await self.fetch_and_sync_new_blocks(
+                            pushed_blocks if isinstance(pushed_blocks, list) else None)
                     else:
                         logger.warning(f"Received unrecognized message: {message}")
         except (websockets.exceptions.ConnectionClosedError,
@@ -314,6 +370,10 @@ class ResilientPythonCache(AsyncIOEventEmitter):
                 except asyncio.CancelledError:
                     pass
 
+            if self.http_client is not None:
+                await self.http_client.aclose()
+                self.http_client = None
+
             if self.mongo_client is not None:
                 self.mongo_client.close()    
                 logger.info("Closed MongoDB and WebSocket connections.")
@@ -36,4 +36,6 @@ class ResilientDBConfig:
     http_endpoint: Optional[str] = None
     ws_endpoint: Optional[str] = None
     reconnect_interval: int = 5000  # in milliseconds
-    fetch_interval: int = 30000  # in milliseconds
\ No newline at end of file
+    fetch_interval: int = 30000  # in milliseconds
+    batch_size: int = 100  # blocks per range request
+    fetch_concurrency: int = 5  # range requests in flight while syncing
\ No newline at end of file
@@ -11,6 +11,8 @@ from typing import Tuple
 from functools import wraps
 from flask import request, jsonify
 
+from services.stroke_codec import is_packed_path, validate_path
+
 
 def validate_json(required_fields=None):
     """
@@ -203,7 +205,8 @@ def validate_stroke_data(value) -> Tuple[bool, str]:
     Rules (enforced on backend):
     - Must be a dict/object
     - Must have required fields: points, color, width
-    - Points must be a list of coordinate objects
+    - Points must be a list of coordinate objects or a packed path
+      (services.stroke_codec), which is checked as one buffer
     """
     if not value:
         return False, "Stroke data is required"
@@ -221,10 +224,14 @@ def validate_stroke_data(value) -> Tuple[bool, str]:
         return False, "Stroke must have width"
     
     points = value.get('points')
-    if not isinstance(points, list):
+    if is_packed_path(points):
+        is_valid, error = validate_path(points)
+        if not is_valid:
+            return False, error
+        points = []
+    elif not isinstance(points, list):
         return False, "Points must be a list"
-    
-    if len(points) == 0:
+    elif len(points) == 0:
         return False, "Stroke must have at least one point"
     
     for i, point in enumerate(points):
@@ -488,6 +495,11 @@ def validate_stroke_payload(value) -> Tuple[bool, str]:
     if "pathData" not in stroke:
         return False, "Stroke must have pathData"
     
+    if is_packed_path(stroke["pathData"]):
+        is_valid, error = validate_path(stroke["pathData"])
+        if not is_valid:
+            return False, f"Stroke pathData invalid: {error}"
+    
     is_valid, error = validate_color(stroke.get("color"))
     if not is_valid:
         return False, f"Stroke color invalid: {error}"
@@ -106,4 +106,8 @@ def rotate_room_master():
                 logger.warning('rotate_room_master: failed to rewrap room %s: %s', room.get('_id'), e)
                 errors += 1
 
+    # Drop cached unwrapped room keys and ciphers so nothing outlives the rotation
+    from services.crypto_service import clear_room_key_cache
+    clear_room_key_cache()
+
     return jsonify({'status': 'ok', 'newMasterB64': new_b64, 'roomsRewrapped': updated, 'errors': errors}), 200
@@ -3,6 +3,8 @@ import traceback
 from services.canvas_counter import get_canvas_draw_count
 from services.graphql_service import commit_transaction_via_graphql
 from services.db import redis_client, strokes_coll
+from services.room_snapshot import invalidate_snapshot
+from services.room_state import bump_room_state
 from config import *
 from middleware.rate_limit import limiter
 import logging
@@ -82,8 +84,11 @@ def submit_clear_canvas_timestamp():
             redis_client.set(redis_ts_legacy, ts)
             redis_client.set(redis_count_key, res_draw_count)
             redis_client.set(redis_count_legacy, res_draw_count)
+            if room_id:
+                invalidate_snapshot(room_id)
         except Exception:
             logger.exception("Failed setting Redis keys for clear markers")
+        bump_room_state(room_id)
 
         try:
             _persist_marker(resdb_count_id, "value", res_draw_count)
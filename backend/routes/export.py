@@ -3,7 +3,11 @@ import json
 import logging
 from bson import ObjectId
 from services.db import redis_client, strokes_coll, rooms_coll, shares_coll
-from services.crypto_service import unwrap_room_key, decrypt_for_room
+from services.crypto_service import unwrap_room_key, decrypt_for_room, bundle_for_json
+from services.parallel_decrypt import parallel_map
+from services.stroke_index import index_stroke
+from services.room_draw_index import index_draw_key
+from services.room_activity import touch_room
 from middleware.auth import require_auth, require_room_access
 from cryptography.exceptions import InvalidTag
 
@@ -116,7 +120,7 @@ def export_canvas(room_id):
                         "user": doc.get("user"),
                         "ts": doc.get("ts"),
                         "roomId": doc.get("roomId"),
-                        "value": json.dumps({"encrypted": doc["blob"]})
+                        "value": json.dumps({"encrypted": bundle_for_json(doc["blob"])})
                     })
                 
                 # Format 3: Try to extract from transactions array (ResilientDB sync format)
@@ -174,9 +178,9 @@ def export_canvas(room_id):
         if room and isinstance(room, dict) and room_type in ("private", "secure") and room.get("wrappedKey"):
             try:
                 room_key = unwrap_room_key(room["wrappedKey"])
-                decrypted_count = 0
-                
-                for stroke in mongo_strokes:
+
+                def _decrypt_value(stroke):
+                    """Decrypt ``stroke["value"]`` in place; True if it was encrypted and decrypted."""
                     try:
                         # Check if value is encrypted
                         value_field = stroke.get("value")
@@ -195,12 +199,14 @@ def export_canvas(room_id):
                             dec = decrypt_for_room(room_key, enc)
                             dec_text = dec.decode("utf-8") if isinstance(dec, (bytes, bytearray)) else str(dec)
                             stroke["value"] = dec_text
-                            decrypted_count += 1
+                            return True
                     except InvalidTag:
                         logger.warning(f"export_canvas: InvalidTag when decrypting stroke {stroke.get('id')}")
                     except Exception as e:
                         logger.warning(f"export_canvas: Failed to decrypt stroke {stroke.get('id')}: {e}")
-                
+                    return False
+
+                decrypted_count = sum(1 for ok in parallel_map(_decrypt_value, mongo_strokes) if ok)
                 logger.info(f"export_canvas: Decrypted {decrypted_count} strokes")
             except Exception as e:
                 logger.exception(f"export_canvas: Failed to unwrap room key: {e}")
@@ -437,6 +443,7 @@ def import_canvas(room_id):
                     "roomId": room_id,
                 }
                 redis_client.set(stroke_id, json.dumps(cache_entry))
+                index_draw_key(room_id, stroke_id)
                 
                 # Insert directly into MongoDB for immediate availability
                 # This ensures strokes appear right away without waiting for sync service
@@ -465,6 +472,7 @@ def import_canvas(room_id):
                             "type": room_type
                         }
                     strokes_coll.insert_one(mongo_doc)
+                    index_stroke(room_id, stroke_for_mongo, blob=mongo_doc.get("blob"))
                     logger.debug(f"import_canvas: Inserted stroke {stroke_id} into MongoDB")
                 except Exception as e:
                     logger.warning(f"import_canvas: Failed to insert stroke {stroke_id} into MongoDB: {e}")
@@ -495,6 +503,9 @@ def import_canvas(room_id):
                 failed_count += 1
         
         logger.info(f"import_canvas: Imported {imported_count} strokes, {failed_count} failed")
+
+        if imported_count and room and isinstance(room, dict) and room.get("_id"):
+            touch_room(room["_id"])
         
         # Broadcast refresh event to all clients in the room
         from services.socketio_service import push_to_room
@@ -5,12 +5,15 @@ import json
 import traceback
 import logging
 from services.canvas_counter import get_canvas_draw_count
-from services.db import redis_client, strokes_coll, rooms_coll
+from services.db import mongo_client, redis_client, strokes_coll, rooms_coll
 from services.crypto_service import unwrap_room_key, decrypt_for_room
+from services.parallel_decrypt import iter_parallel_map
+from services.room_state import get_room_state
+from services.room_draw_index import get_room_draw_keys, index_draw_keys, mark_covered, coverage_start, room_of_entry
 from bson import ObjectId
 from config import *
 import os
-from pymongo import MongoClient, errors as pymongo_errors
+from pymongo import errors as pymongo_errors
 import math
 import datetime
 from cryptography.exceptions import InvalidTag
@@ -340,31 +343,26 @@ def _normalize_numberlong_in_obj(o):
 def get_strokes_from_mongo(start_ts=None, end_ts=None, room_id=None):
     """
     Robust retrieval of strokes from MongoDB, optionally scoped to a room.
-    Returns a list of items like:
+    Yields items like:
       { 'value': <json-string>, 'user': <string>, 'ts': <int>, 'id': <string>, 'undone': bool }
 
+    Items are streamed in cursor order, so long history ranges are never held
+    in memory at once; callers that need ts order sort what they keep. The
+    query runs on the shared services.db client and its connection pool.
+
     If room_id is provided, the Mongo query will try to restrict results to that room
     (matching several common storage shapes), and when possible we will attempt to
     decrypt per-room 'encrypted' bundles using the room's wrappedKey.
 
-    On any error this function returns an empty list (and logs the error).
+    On any error this generator stops yielding (and logs the error).
     """
-    mongo_uri = os.environ.get('MONGO_ATLAS_URI') or os.environ.get('MONGO_URL')
-    db_name = os.environ.get('MONGO_DB', 'canvasCache')
-    coll_name = os.environ.get('MONGO_COLLECTION', 'strokes')
-    if not mongo_uri:
-        logging.getLogger(__name__).error("MONGO_ATLAS_URI / MONGO_URL not set in environment")
-        return []
-
-    client = None
+    db_name = os.environ.get('MONGO_DB', DB_NAME)
+    coll_name = os.environ.get('MONGO_COLLECTION', COLLECTION_NAME)
+
     cursor = None
-    results = []
+    yielded = 0
     try:
-        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-
-        db = client[db_name]
-        coll = db[coll_name]
+        coll = mongo_client[db_name][coll_name]
 
         # Base time-presence query (keep shapes that include timestamps in common places)
         base_or = [
@@ -409,17 +407,17 @@ def get_strokes_from_mongo(start_ts=None, end_ts=None, room_id=None):
             except Exception:
                 room_doc = None
 
-        for doc in cursor:
+        def _process(doc):
             try:
                 ts = _find_ts_in_doc(doc)
                 if ts is None:
-                    continue
+                    return None
                 if (start_ts is not None and ts < start_ts) or (end_ts is not None and ts > end_ts):
-                    continue
+                    return None
 
                 user, payload = _extract_user_and_inner_value(doc)
                 if not payload:
-                    continue
+                    return None
 
                 if isinstance(payload, str):
                     try:
@@ -548,43 +546,39 @@ def get_strokes_from_mongo(start_ts=None, end_ts=None, room_id=None):
                 except Exception:
                     room_candidate = None
 
-                results.append({
+                item = {
                     'value': json.dumps(parsed_payload),
                     'user': user or parsed_payload.get("user", "") or "",
                     'ts': int(ts),
                     'id': doc_id or parsed_payload.get("id") or parsed_payload.get("drawingId") or "",
                     'undone': bool(parsed_payload.get("undone", False)),
                     'roomId': room_candidate
-                })
+                }
             except Exception as inner_exc:
                 logging.getLogger(__name__).exception(f"Failed to process Mongo doc {_id_repr(doc)}: {inner_exc}")
+                return None
+            return item
+
+        # Decrypting rooms decode on the decrypt pool; the cursor is still
+        # read on this thread and items come back in cursor order
+        encrypted_room = bool(room_doc and room_doc.get("wrappedKey"))
+        processed = iter_parallel_map(_process, cursor) if encrypted_room else map(_process, cursor)
+        for item in processed:
+            if item is None:
                 continue
+            yielded += 1
+            yield item
 
-        # sort by timestamp ascending
-        results.sort(key=lambda x: x.get('ts', 0))
-        logging.getLogger(__name__).info(f"Mongo history query returned {len(results)} items for range {start_ts}..{end_ts} room={room_id}")
-        return results
-
-
-    
+        logging.getLogger(__name__).info(f"Mongo history query returned {yielded} items for range {start_ts}..{end_ts} room={room_id}")
 
     except pymongo_errors.PyMongoError as pm_err:
         logging.getLogger(__name__).exception(f"MongoDB error while fetching strokes: {pm_err}")
-        return []
     except Exception as e:
         logging.getLogger(__name__).exception(f"Unexpected error in get_strokes_from_mongo: {e}")
-        return []
     finally:
-        try:
-            if cursor is not None:
-                try:
-                    cursor.close()
-                except Exception:
-                    pass
-        finally:
+        if cursor is not None:
             try:
-                if client is not None:
-                    client.close()
+                cursor.close()
             except Exception:
                 pass
 
@@ -692,55 +686,314 @@ def process_mongo_docs(doc_list, start_ts=None, end_ts=None, room_id=None):
 
 logger = logging.getLogger(__name__)
 
-get_canvas_data_bp = Blueprint('get_canvas_data', __name__)
+def _tx_asset_ts(tx):
+    v = tx.get("value") or {}
+    asset = (v.get("asset") or {}).get("data", {}) if isinstance(v.get("asset"), dict) else {}
+    candidate = asset.get("ts") or asset.get("timestamp") or asset.get("order") or 0
 
-@get_canvas_data_bp.route('/getCanvasData', methods=['GET'])
-def get_canvas_data():
+    if isinstance(candidate, dict) and "$numberLong" in candidate:
+        try:
+            return int(candidate["$numberLong"])
+        except Exception:
+            return 0
     try:
-        res_canvas_draw_count = get_canvas_draw_count()
+        return int(candidate)
+    except Exception:
+        return 0
 
-        room_id = request.args.get("roomId") or request.args.get("room_id")
-        clear_after = _get_effective_clear_ts(room_id)
+def _finalize_recovered_asset(asset_data, key_id):
+    """Normalize a stroke asset recovered from Mongo into the cached draw-entry shape."""
+    # if a JSON-string 'value' is embedded, merge it
+    if isinstance(asset_data.get("value"), str):
+        try:
+            inner = json.loads(asset_data["value"])
+            if isinstance(inner, dict):
+                asset_data.update(inner)
+                asset_data.pop("value", None)
+        except Exception:
+            pass
 
-        clear_key_room = f"draw_count_clear_canvas:{room_id}" if room_id else None
-        room_count = None
-        global_count = None
-        
+    try:
+        asset_data = _normalize_numberlong_in_obj(asset_data)
+    except Exception:
+        pass
+
+    # Attempt to extract roomId from common nested locations so room filtering works
+    try:
+        room_candidate = asset_data.get('roomId') or asset_data.get('room')
+        if not room_candidate and isinstance(asset_data.get('stroke'), dict):
+            room_candidate = asset_data.get('stroke', {}).get('roomId')
+
+        if isinstance(room_candidate, dict):
+            room_candidate = room_candidate.get('$oid') or room_candidate.get('oid') or None
+        if isinstance(room_candidate, (bytes, bytearray)):
+            try:
+                room_candidate = room_candidate.decode('utf-8')
+            except Exception:
+                room_candidate = None
+        if isinstance(room_candidate, (int, float)):
+            room_candidate = str(room_candidate)
+        if room_candidate:
+            asset_data['roomId'] = room_candidate
+    except Exception:
+        pass
+
+    asset_data["undone"] = bool(asset_data.get("undone", False))
+    asset_data["id"] = asset_data.get("id") or key_id
+    return asset_data
+
+def _recover_draw_keys(key_ids, room_id=None):
+    """
+    Recover res-canvas-draw-* entries that are missing from Redis.
+
+    All keys are looked up with one $in query over mirrored transactions. For
+    whatever is still missing in a room read, one query over the room's
+    plaintext strokes and one decrypt pass over its blobs (with the room key
+    unwrapped once) follow. Recovered entries are written back to Redis in a
+    single pipeline. Returns {key_id: asset_data}.
+    """
+    wanted = set(key_ids)
+    recovered = {}
+    if not wanted:
+        return recovered
+
+    try:
+        # Newest block first; within a block the latest tx for a key wins
+        cursor = strokes_coll.find(
+            {"transactions.value.asset.data.id": {"$in": list(wanted)}},
+            sort=[("_id", -1)]
+        )
+        for block in cursor:
+            latest = {}
+            for t in block.get("transactions", []):
+                if not isinstance(t, dict):
+                    continue
+                val = t.get("value")
+                if not isinstance(val, dict):
+                    continue
+                asset = (val.get("asset") or {}).get("data", {})
+                aid = asset.get("id") if isinstance(asset, dict) else None
+                if aid not in wanted or aid in recovered:
+                    continue
+                if aid not in latest or _tx_asset_ts(t) > _tx_asset_ts(latest[aid]):
+                    latest[aid] = t
+            for aid, tx in latest.items():
+                asset_data = dict((tx.get("value") or {}).get("asset", {}).get("data", {}) or {})
+                recovered[aid] = _finalize_recovered_asset(asset_data, aid)
+            if len(recovered) == len(wanted):
+                break
+    except Exception as e:
+        logger.warning(f"get_canvas_data: bulk recovery of draw keys failed: {e}")
+
+    remaining = wanted - set(recovered)
+    if remaining and room_id:
+        found = {}
+        try:
+            for doc in strokes_coll.find({"roomId": room_id, "stroke.id": {"$in": list(remaining)}}):
+                inner = doc.get("stroke") or {}
+                if inner.get("id") in remaining:
+                    found[inner["id"]] = inner
+        except Exception as e:
+            logger.warning(f"get_canvas_data: room stroke recovery failed for room {room_id}: {e}")
+
+        remaining -= set(found)
+        if remaining:
+            try:
+                room_doc = rooms_coll.find_one({"_id": ObjectId(room_id)})
+            except Exception:
+                room_doc = None
+            if room_doc and room_doc.get("type") in ("private", "secure") and room_doc.get("wrappedKey"):
+                try:
+                    rk = unwrap_room_key(room_doc["wrappedKey"])
+                    for _doc in strokes_coll.find({"roomId": room_id, "blob": {"$exists": True}}):
+                        try:
+                            candidate = decrypt_for_room(rk, _doc["blob"])
+                            candidate = json.loads(candidate.decode()) if isinstance(candidate, (bytes, bytearray)) else json.loads(candidate)
+                        except Exception:
+                            continue
+                        cid = candidate.get("id")
+                        if cid in remaining:
+                            found[cid] = candidate
+                            remaining.discard(cid)
+                            if not remaining:
+                                break
+                except Exception as _e:
+                    logger.warning(f"get_canvas_data: decrypt scan failed for room {room_id}: {_e}")
+
+        for key_id, inner in found.items():
+            asset_data = {
+                "id": key_id,
+                "roomId": room_id,
+                "ts": inner.get("timestamp") or inner.get("ts"),
+                "user": inner.get("user"),
+                "undone": bool(inner.get("undone", False)),
+            }
+            asset_data.update(inner)
+            recovered[key_id] = _finalize_recovered_asset(asset_data, key_id)
+
+    if recovered:
         try:
-            if clear_key_room:
-                rv = redis_client.get(clear_key_room)
-                if rv is not None:
-                    room_count = int(rv.decode()) if isinstance(rv, bytes) else int(rv)
-            gv = redis_client.get("draw_count_clear_canvas")
-            if gv is not None:
-                global_count = int(gv.decode()) if isinstance(gv, bytes) else int(gv)
+            pipe = redis_client.pipeline(transaction=False)
+            for key_id, asset_data in recovered.items():
+                pipe.set(key_id, json.dumps(asset_data))
+            pipe.execute()
+        except Exception:
+            logger.exception("Failed to cache recovered draw keys into Redis")
+    return recovered
+
+def _load_canvas_state(room_id):
+    """
+    Resolve the clear and undo/redo state /getCanvasData filters with:
+    the effective clear timestamp, the draw count recorded at the last
+    clear and the ids of undone strokes. Cached per room by
+    services.room_state, so this only runs after a bump or expiry.
+    """
+    clear_after = _get_effective_clear_ts(room_id)
+
+    clear_key_room = f"draw_count_clear_canvas:{room_id}" if room_id else None
+    room_count = None
+    global_count = None
+    
+    try:
+        if clear_key_room:
+            rv = redis_client.get(clear_key_room)
+            if rv is not None:
+                room_count = int(rv.decode()) if isinstance(rv, bytes) else int(rv)
+        gv = redis_client.get("draw_count_clear_canvas")
+        if gv is not None:
+            global_count = int(gv.decode()) if isinstance(gv, bytes) else int(gv)
+    except Exception:
+        room_count = room_count if isinstance(room_count, int) else None
+        global_count = global_count if isinstance(global_count, int) else None
+    
+    if room_count is None and clear_key_room:
+        try:
+            room_count = _find_marker_ts_from_mongo(clear_key_room) or _find_marker_ts_from_mongo(f"res-canvas-draw-count:{room_id}")
         except Exception:
             room_count = room_count if isinstance(room_count, int) else None
+        if isinstance(room_count, int):
+            try:
+                redis_client.set(clear_key_room, int(room_count))
+            except Exception:
+                pass
+    
+    if global_count is None:
+        try:
+            global_count = _find_marker_ts_from_mongo("draw_count_clear_canvas") or _find_marker_ts_from_mongo("res-canvas-draw-count")
+        except Exception:
             global_count = global_count if isinstance(global_count, int) else None
-        
-        if room_count is None and clear_key_room:
+        if isinstance(global_count, int):
             try:
-                room_count = _find_marker_ts_from_mongo(clear_key_room) or _find_marker_ts_from_mongo(f"res-canvas-draw-count:{room_id}")
+                redis_client.set("draw_count_clear_canvas", int(global_count))
             except Exception:
-                room_count = room_count if isinstance(room_count, int) else None
-            if isinstance(room_count, int):
-                try:
-                    redis_client.set(clear_key_room, int(room_count))
-                except Exception:
-                    pass
-        
-        if global_count is None:
+                pass
+    
+    count_value_clear_canvas = max(room_count or 0, global_count or 0)
+
+    stroke_states = {}
+    # Process all undo records.
+    for key in redis_client.keys("undo-*"):
+        data = redis_client.get(key)
+        if data:
+            record = json.loads(data)
+            stroke_id = record["id"].replace("undo-", "")
+            stroke_states[stroke_id] = record  # State: undone (True)
+
+    # Process all redo records and update state if they are more recent.
+    for key in redis_client.keys("redo-*"):
+        data = redis_client.get(key)
+        if data:
+            record = json.loads(data)
+            stroke_id = record["id"].replace("redo-", "")
+            if stroke_id in stroke_states:
+                if record["ts"] > stroke_states[stroke_id]["ts"]:
+                    stroke_states[stroke_id] = record
+            else:
+                stroke_states[stroke_id] = record
+
+    try:
+        # We'll scan for both undo- and redo- prefix markers.
+        # Use range query instead of regex to leverage index
+        # Range query with prefix matching is much faster than regex (6-18x speedup)
+        # Index: transactions.value.asset.data.id + _id (created by undo_redo_marker_idx)
+        for prefix in ("undo-", "redo-"):
+            # Find any transaction blocks that contain an asset.data.id starting with the prefix.
+            # Use range query: $gte prefix and $lt prefix+highest_unicode to match prefix*
+            # This allows MongoDB to use the index efficiently
             try:
-                global_count = _find_marker_ts_from_mongo("draw_count_clear_canvas") or _find_marker_ts_from_mongo("res-canvas-draw-count")
+                cursor = strokes_coll.find(
+                    {
+                        "transactions.value.asset.data.id": {
+                            "$gte": prefix,
+                            "$lt": prefix + "\uffff"  # Unicode max ensures prefix matching
+                        }
+                    },
+                    sort=[("_id", -1)]
+                )
             except Exception:
-                global_count = global_count if isinstance(global_count, int) else None
-            if isinstance(global_count, int):
+                cursor = strokes_coll.find({"transactions.value.asset.data.id": {"$regex": f"^{prefix}"}})
+
+            for doc in cursor:
                 try:
-                    redis_client.set("draw_count_clear_canvas", int(global_count))
+                    txs = doc.get("transactions") or []
+                    for tx in txs:
+                        if not isinstance(tx, dict):
+                            continue
+                        v = tx.get("value") or {}
+                        asset = (v.get("asset") or {}).get("data") if isinstance(v.get("asset"), dict) else {}
+                        if not isinstance(asset, dict):
+                            continue
+                        aid = asset.get("id")
+                        if not aid or not aid.startswith(prefix):
+                            continue
+                        # extract ts (handle $numberLong wrappers)
+                        cand_ts = asset.get("ts") or asset.get("timestamp") or asset.get("order") or 0
+                        try:
+                            if isinstance(cand_ts, dict) and "$numberLong" in cand_ts:
+                                ts_val = int(cand_ts["$numberLong"])
+                            else:
+                                ts_val = int(cand_ts)
+                        except Exception:
+                            ts_val = 0
+                        undone_flag = bool(asset.get("undone", True if prefix == "undo-" else False))
+                        user_val = asset.get("user")
+                        # canonical stroke id without prefix
+                        sid = aid.replace(prefix, "")
+                        rec = {"id": aid, "user": user_val, "ts": ts_val, "undone": undone_flag}
+                        existing = stroke_states.get(sid)
+                        if not existing or ts_val > (existing.get("ts", 0) or 0):
+                            # store keyed by the non-prefixed stroke-id like Redis code expects
+                            stroke_states[sid] = rec
                 except Exception:
-                    pass
-        
-        count_value_clear_canvas = max(room_count or 0, global_count or 0)
+                    # continue processing other txs/docs even if one fails
+                    continue
+    except Exception:
+        logger.exception("Failed scanning Mongo for undo/redo markers")
+
+    undone_strokes = set()
+    for stroke_id, state in stroke_states.items():
+        if state.get("undone"):
+            undone_strokes.add(stroke_id)
+
+    return {
+        "clearTs": clear_after,
+        "drawCountAtClear": count_value_clear_canvas,
+        "undoneIds": frozenset(undone_strokes),
+    }
+
+
+get_canvas_data_bp = Blueprint('get_canvas_data', __name__)
+
+@get_canvas_data_bp.route('/getCanvasData', methods=['GET'])
+def get_canvas_data():
+    try:
+        res_canvas_draw_count = get_canvas_draw_count()
+
+        room_id = request.args.get("roomId") or request.args.get("room_id")
+        state = get_room_state(room_id, _load_canvas_state)
+        clear_after = state["clearTs"]
+        count_value_clear_canvas = state["drawCountAtClear"]
+        undone_strokes = state["undoneIds"]
 
         start_param = request.args.get('start')
         end_param = request.args.get('end')
@@ -752,92 +1005,7 @@ def get_canvas_data():
 
 
         all_missing_data = []
-        missing_keys = []
         
-        stroke_states = {}
-        # Process all undo records.
-        for key in redis_client.keys("undo-*"):
-            data = redis_client.get(key)
-            if data:
-                record = json.loads(data)
-                stroke_id = record["id"].replace("undo-", "")
-                stroke_states[stroke_id] = record  # State: undone (True)
-
-        # Process all redo records and update state if they are more recent.
-        for key in redis_client.keys("redo-*"):
-            data = redis_client.get(key)
-            if data:
-                record = json.loads(data)
-                stroke_id = record["id"].replace("redo-", "")
-                if stroke_id in stroke_states:
-                    if record["ts"] > stroke_states[stroke_id]["ts"]:
-                        stroke_states[stroke_id] = record
-                else:
-                    stroke_states[stroke_id] = record
-
-        try:
-            # We'll scan for both undo- and redo- prefix markers.
-            # Use range query instead of regex to leverage index
-            # Range query with prefix matching is much faster than regex (6-18x speedup)
-            # Index: transactions.value.asset.data.id + _id (created by undo_redo_marker_idx)
-            for prefix in ("undo-", "redo-"):
-                # Find any transaction blocks that contain an asset.data.id starting with the prefix.
-                # Use range query: $gte prefix and $lt prefix+highest_unicode to match prefix*
-                # This allows MongoDB to use the index efficiently
-                try:
-                    cursor = strokes_coll.find(
-                        {
-                            "transactions.value.asset.data.id": {
-                                "$gte": prefix,
-                                "$lt": prefix + "\uffff"  # Unicode max ensures prefix matching
-                            }
-                        },
-                        sort=[("_id", -1)]
-                    )
-                except Exception:
-                    cursor = strokes_coll.find({"transactions.value.asset.data.id": {"$regex": f"^{prefix}"}})
-
-                for doc in cursor:
-                    try:
-                        txs = doc.get("transactions") or []
-                        for tx in txs:
-                            if not isinstance(tx, dict):
-                                continue
-                            v = tx.get("value") or {}
-                            asset = (v.get("asset") or {}).get("data") if isinstance(v.get("asset"), dict) else {}
-                            if not isinstance(asset, dict):
-                                continue
-                            aid = asset.get("id")
-                            if not aid or not aid.startswith(prefix):
-                                continue
-                            # extract ts (handle $numberLong wrappers)
-                            cand_ts = asset.get("ts") or asset.get("timestamp") or asset.get("order") or 0
-                            try:
-                                if isinstance(cand_ts, dict) and "$numberLong" in cand_ts:
-                                    ts_val = int(cand_ts["$numberLong"])
-                                else:
-                                    ts_val = int(cand_ts)
-                            except Exception:
-                                ts_val = 0
-                            undone_flag = bool(asset.get("undone", True if prefix == "undo-" else False))
-                            user_val = asset.get("user")
-                            # canonical stroke id without prefix
-                            sid = aid.replace(prefix, "")
-                            rec = {"id": aid, "user": user_val, "ts": ts_val, "undone": undone_flag}
-                            existing = stroke_states.get(sid)
-                            if not existing or ts_val > (existing.get("ts", 0) or 0):
-                                # store keyed by the non-prefixed stroke-id like Redis code expects
-                                stroke_states[sid] = rec
-                    except Exception:
-                        # continue processing other txs/docs even if one fails
-                        continue
-        except Exception:
-            logger.exception("Failed scanning Mongo for undo/redo markers")
-
-        undone_strokes = set()
-        for stroke_id, state in stroke_states.items():
-            if state.get("undone"):
-                undone_strokes.add(stroke_id)
 
         logger.error("count_value_clear_canvas")
         logger.error(count_value_clear_canvas)
@@ -853,9 +1021,17 @@ def get_canvas_data():
             except Exception:
                 end_idx = 0
 
+            # A room read only touches the room's own draw keys once its index
+            # covers the range; otherwise scan the global counter range and
+            # index what we decode along the way.
+            room_keys = get_room_draw_keys(room_id, start_idx, end_idx) if room_id else None
+            if room_keys is not None:
+                keys_to_fetch = room_keys
+            else:
+                keys_to_fetch = [f"res-canvas-draw-{i}" for i in range(start_idx, end_idx)]
+            scanned_pairs = []
+
             # OPTIMIZATION: Use Redis pipeline to fetch all keys in parallel (10-20x faster)
-            # Build list of all keys to fetch
-            keys_to_fetch = [f"res-canvas-draw-{i}" for i in range(start_idx, end_idx)]
             
             # Fetch all keys in one pipeline operation
             redis_results = {}
@@ -879,106 +1055,26 @@ def get_canvas_data():
                         except Exception:
                             redis_results[key_id] = None
 
-            # Process each stroke (same logic as before, but using pre-fetched results)
-            for i in range(start_idx, end_idx):
-                key_id = f"res-canvas-draw-{i}"
-                drawing = None
-
-                # 1) Try Redis cached entry first (from pipeline results)
+            # Decode the cached entries, then recover every miss in one bulk stage
+            drawings = {}
+            for key_id in keys_to_fetch:
                 raw = redis_results.get(key_id)
                 if raw:
                     try:
-                        drawing = json.loads(raw)
+                        drawings[key_id] = json.loads(raw)
                     except Exception:
                         try:
-                            drawing = json.loads(raw.decode()) if isinstance(raw, (bytes, bytearray)) else None
+                            drawings[key_id] = json.loads(raw.decode()) if isinstance(raw, (bytes, bytearray)) else None
                         except Exception:
-                            drawing = None
+                            drawings[key_id] = None
+            drawings.update(_recover_draw_keys([k for k in keys_to_fetch if not drawings.get(k)], room_id))
 
-                # 2) If not in Redis, try Mongo fallback for this specific key
-                if not drawing:
-                    try:
-                        block = strokes_coll.find_one(
-                            {"transactions.value.asset.data.id": key_id},
-                            sort=[("_id", -1)]
-                        )
-                    except Exception:
-                        block = None
-
-                    if block:
-                        # find transactions inside the block that reference this key_id
-                        txs = []
-                        for t in block.get("transactions", []):
-                            if not isinstance(t, dict):
-                                continue
-                            val = t.get("value")
-                            if isinstance(val, dict):
-                                asset = (val.get("asset") or {}).get("data", {})
-                                if isinstance(asset, dict) and asset.get("id") == key_id:
-                                    txs.append(t)
-                        # pick the latest tx for this key (by ts / timestamp / order)
-                        if txs:
-                            def _tx_ts(tt):
-                                v = tt.get("value") or {}
-                                asset = (v.get("asset") or {}).get("data", {}) if isinstance(v.get("asset"), dict) else {}
-                                candidate = asset.get("ts") or asset.get("timestamp") or asset.get("order") or 0
-
-                                if isinstance(candidate, dict) and "$numberLong" in candidate:
-                                    try:
-                                        return int(candidate["$numberLong"])
-                                    except Exception:
-                                        return 0
-                                try:
-                                    return int(candidate)
-                                except Exception:
-                                    return 0
-                            tx = max(txs, key=_tx_ts)
-                            asset_data = (tx.get("value") or {}).get("asset", {}).get("data", {}) or {}
-
-                            # if a JSON-string 'value' is embedded, merge it
-                            if isinstance(asset_data.get("value"), str):
-                                try:
-                                    inner = json.loads(asset_data["value"])
-                                    if isinstance(inner, dict):
-                                        asset_data.update(inner)
-                                        asset_data.pop("value", None)
-                                except Exception:
-                                    pass
-
-                            try:
-                                asset_data = _normalize_numberlong_in_obj(asset_data)
-                            except Exception:
-                                pass
-
-                            # Attempt to extract roomId from common nested locations so room filtering works
-                            try:
-                                room_candidate = asset_data.get('roomId') or asset_data.get('room')
-                                if not room_candidate and isinstance(asset_data.get('stroke'), dict):
-                                    room_candidate = asset_data.get('stroke', {}).get('roomId')
-
-                                if isinstance(room_candidate, dict):
-                                    room_candidate = room_candidate.get('$oid') or room_candidate.get('oid') or None
-                                if isinstance(room_candidate, (bytes, bytearray)):
-                                    try:
-                                        room_candidate = room_candidate.decode('utf-8')
-                                    except Exception:
-                                        room_candidate = None
-                                if isinstance(room_candidate, (int, float)):
-                                    room_candidate = str(room_candidate)
-                                if room_candidate:
-                                    asset_data['roomId'] = room_candidate
-                            except Exception:
-                                pass
-
-                            asset_data["undone"] = bool(asset_data.get("undone", False))
-                            asset_data["id"] = asset_data.get("id") or key_id
-                            try:
-                                redis_client.set(key_id, json.dumps(asset_data))
-                            except Exception:
-                                pass
-                            drawing = asset_data
+            for key_id in keys_to_fetch:
+                drawing = drawings.get(key_id)
 
                 if drawing:
+                    if room_keys is None:
+                        scanned_pairs.append((room_of_entry(drawing), key_id))
                     dts = drawing.get("ts") or drawing.get("timestamp")
                     if isinstance(dts, dict) and "$numberLong" in dts:
                         try:
@@ -1007,6 +1103,13 @@ def get_canvas_data():
                             "roomId":             drawing.get("roomId", None)
                         }
                         all_missing_data.append(wrapper)
+
+            if room_keys is None:
+                # Keys that neither Redis nor Mongo could produce are not in
+                # the index, so the range is only covered past the last of them.
+                failed_keys = [k for k in keys_to_fetch if not drawings.get(k)]
+                if index_draw_keys(scanned_pairs) and room_id:
+                    mark_covered(room_id, coverage_start(start_idx, failed_keys))
         except Exception as e:
             logger.exception("Recovery loop failed; falling back to counter-range. Error: %s", e)
             # In history mode, start from 0 to include all drawings
@@ -1039,148 +1142,6 @@ def get_canvas_data():
                     }
                     all_missing_data.append(wrapper)
                     
-        # If we had missing cached res-canvas keys, attempt to recover them from Mongo in bulk.
-        mongo_map = {}
-        if missing_keys:
-            try:
-                # Use the robust helper to fetch strokes. In history mode, query the requested range.
-                # Otherwise, query strokes after clear_after (normal mode behavior).
-                if history_mode:
-                    try:
-                        s_ts = int(start_param) if start_param is not None and start_param != '' else None
-                    except Exception:
-                        s_ts = None
-                    try:
-                        e_ts = int(end_param) if end_param is not None and end_param != '' else None
-                    except Exception:
-                        e_ts = None
-                    mongo_items = get_strokes_from_mongo(s_ts, e_ts, room_id)
-                else:
-                    mongo_items = get_strokes_from_mongo(clear_after, None, room_id)
-
-                for it in mongo_items:
-                    iid = it.get("id")
-                    if iid:
-                        mongo_map[str(iid)] = it
-            except Exception:
-                mongo_map = {}
-
-        for key_str, idx in missing_keys:
-            block = strokes_coll.find_one(
-                {"transactions.value.asset.data.id": key_str},
-                sort=[("_id", -1)]
-            )
-
-            logger.debug("attempting recovery for %s", key_str)
-
-            # 1) If block exists, use the latest matching tx (existing logic)
-            if block:
-                matching_txs = [
-                    t for t in block.get("transactions", [])
-                    if t.get("value", {}).get("asset", {}).get("data", {}).get("id") == key_str
-                ]
-                tx = max(matching_txs, key=lambda t: _extract_number(t.get("value", {}).get("asset", {}).get("data", {}).get("ts", 0)), default=None)
-                if not tx:
-                    logger.debug("Found block %s but no matching txn inside for %s", block.get('_id'), key_str)
-                    continue
-                asset_data = tx["value"]["asset"]["data"]
-            else:
-                found = mongo_map.get(key_str)
-                if found:
-                    # 'found' items are from get_strokes_from_mongo and have at least 'value','ts','user','id'
-                    try:
-                        payload = found.get("value")
-                        parsed = json.loads(payload) if isinstance(payload, str) else payload
-                    except Exception:
-                        parsed = {"raw": payload}
-                    asset_data = parsed if isinstance(parsed, dict) else {"raw": parsed}
-                    asset_data["id"] = key_str
-                    asset_data["ts"] = int(found.get("ts") or asset_data.get("ts") or 0)
-                    asset_data["user"] = found.get("user") or asset_data.get("user")
-                else:
-                    logger.debug("no direct block found for %s; attempting room-specific scan", key_str)
-                    rid = request.args.get("roomId") or request.args.get("room_id")
-                    doc = None
-                    inner = None
-                    room_doc = None
-
-                    if rid:
-                        try:
-                            room_doc = rooms_coll.find_one({"_id": ObjectId(rid)})
-                        except Exception:
-                            room_doc = None
-                        try:
-                            doc = strokes_coll.find_one({"roomId": rid, "stroke.id": key_str})
-                        except Exception:
-                            doc = None
-                        if not doc and room_doc and room_doc.get("type") in ("private", "secure"):
-                            try:
-                                rk = unwrap_room_key(room_doc["wrappedKey"])
-                                for _doc in strokes_coll.find({"roomId": rid, "blob": {"$exists": True}}):
-                                    try:
-                                        candidate = decrypt_for_room(rk, _doc["blob"])
-                                        candidate = json.loads(candidate.decode()) if isinstance(candidate, (bytes, bytearray)) else json.loads(candidate)
-                                        if candidate.get("id") == key_str:
-                                            inner = candidate
-                                            break
-                                    except Exception:
-                                        continue
-                            except Exception as _e:
-                                logger.warning(f"get_canvas_data: decrypt scan failed for room {rid}: {_e}")
-
-                    if doc or inner:
-                        if inner is None:
-                            inner = doc.get("stroke") if doc else inner
-                        asset_data = {
-                            "id": key_str,
-                            "roomId": rid,
-                            "ts": inner.get("timestamp") or inner.get("ts"),
-                            "user": inner.get("user"),
-                            "undone": bool(inner.get("undone", False)),
-                        }
-                        asset_data.update(inner)
-                    else:
-                        logger.debug(f"No Mongo block or fallback found for {key_str}")
-                        continue
-
-            if isinstance(asset_data.get("value"), str):
-                try:
-                    inner = json.loads(asset_data["value"])
-                    asset_data.update(inner)
-                    asset_data.pop("value", None)
-                except Exception:
-                    pass
-
-            asset_data["undone"] = asset_data.get("undone", False)
-
-            # Cache recovered stroke in Redis for next calls
-            try:
-                redis_client.set(key_str, json.dumps(asset_data))
-            except Exception:
-                logger.exception("Failed to cache recovered %s into Redis", key_str)
-
-            # Only accept strokes after clear_after and correct prefix
-            try:
-                ast_ts = int(asset_data.get("ts")) if asset_data.get("ts") is not None else 0
-            except Exception:
-                ast_ts = 0
-
-            if (
-                asset_data.get("id","").startswith("res-canvas-draw-") and
-                asset_data.get("id") not in undone_strokes and
-                (history_mode or ast_ts > clear_after)
-            ):
-                wrapper = {
-                    "id":                 asset_data.get("id", ""),
-                    "user":               asset_data.get("user", ""),
-                    "ts":                 ast_ts,
-                    "deletion_date_flag": "",
-                    "undone":             asset_data.get("undone", False),
-                    "value":              json.dumps(asset_data),
-                    "roomId":             asset_data.get("roomId", None)
-                }
-                all_missing_data.append(wrapper)
-
         stroke_entries = {}
         for entry in all_missing_data:
             stroke_id = entry.get('id')
@@ -1244,7 +1205,7 @@ def get_canvas_data():
                 if len(all_missing_data) == 0:
                     try:
                         logger.warning(f"No strokes found in Redis for history range; trying MongoDB as fallback")
-                        mongo_items = get_strokes_from_mongo(start_ts, end_ts, room_id)
+                        mongo_items = sorted(get_strokes_from_mongo(start_ts, end_ts, room_id), key=lambda x: x.get('ts', 0))
                         if mongo_items:
                             all_missing_data = mongo_items
                             logger.info(f"MongoDB fallback returned {len(mongo_items)} strokes for history range {start_ts}..{end_ts}")
@@ -1413,7 +1374,7 @@ def get_canvas_data():
                 except Exception:
                     end_ts = None
 
-                mongo_items = get_strokes_from_mongo(start_ts, end_ts, room_id)
+                mongo_items = sorted(get_strokes_from_mongo(start_ts, end_ts, room_id), key=lambda x: x.get('ts', 0))
                 if mongo_items:
                     logger.info(f"getCanvasData: Mongo room lookup returned {len(mongo_items)} items for room {room_id}")
                     all_missing_data = mongo_items
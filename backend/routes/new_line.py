@@ -3,6 +3,7 @@ import json
 import traceback
 import logging
 from services.canvas_counter import get_canvas_draw_count, increment_canvas_draw_count
+from services.room_draw_index import index_draw_key
 from services.graphql_service import commit_transaction_via_graphql
 from services.db import redis_client
 from services.socketio_service import push_to_room, push_to_user
@@ -68,6 +69,7 @@ def submit_new_line():
         cache_entry = full_data.copy()
         cache_entry['txnId'] = txn_id
         redis_client.set(cache_entry['id'], json.dumps(cache_entry))
+        index_draw_key(request_data.get('roomId') or inner_value.get('roomId'), cache_entry['id'])
 
         from services.db import strokes_coll
         mongo_entry = {
@@ -2,18 +2,31 @@
 from flask import Blueprint, request, jsonify, g
 from bson import ObjectId
 from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
+from redis.exceptions import WatchError
 from datetime import datetime
 import json, time, traceback, logging
 import re
 from services.db import rooms_coll, shares_coll, users_coll, strokes_coll, redis_client, invites_coll, notifications_coll
 from services.socketio_service import push_to_user, push_to_room
-from services.crypto_service import wrap_room_key, unwrap_room_key, encrypt_for_room, decrypt_for_room
+from services.crypto_service import wrap_room_key, unwrap_room_key, decrypt_for_room, encrypt_stroke, bundle_for_json
 from services.graphql_service import commit_transaction_via_graphql, GraphQLService
-from services.graphql_retry_queue import add_to_retry_queue, get_queue_size, get_pending_retries
+from services.graphql_retry_queue import get_queue_size, get_pending_retries
+from services.commit_outbox import enqueue_commit, enqueue_commits
 from services.graphql_retry_worker import is_worker_running
+from services.undone_index import record_undo, record_redo, drop as drop_undone_index
+from services.room_snapshot import load_room_state, invalidate_snapshot, delete_snapshot
+from services.room_state import bump_room_state
+from services.room_activity import touch_room
+from services.stroke_cache import cache_stroke, cache_strokes, get_cached_strokes, drop_room_cache
+from services.room_draw_index import drop as drop_draw_index
+from services.stroke_index import READY_FIELD, index_stroke, index_room_rows, make_row, ensure_room_indexed, find_room_strokes, find_room_strokes_by_id, find_room_strokes_after, reset_room_index
+from services.stroke_decoder import decode_stroke, coerce_ts
+from services.parallel_decrypt import parallel_map
+from services.stroke_codec import is_packed_path, validate_path, stroke_for_client
 import os
 from config import (
-    SIGNER_PUBLIC_KEY, SIGNER_PRIVATE_KEY, RECIPIENT_PUBLIC_KEY, JWT_SECRET,
+    SIGNER_PUBLIC_KEY, SIGNER_PRIVATE_KEY, JWT_SECRET,
     RATE_LIMIT_ROOM_CREATE_HOURLY, RATE_LIMIT_ROOM_UPDATE_MINUTE, 
     RATE_LIMIT_SEARCH_MINUTE, RATE_LIMIT_STROKE_MINUTE, RATE_LIMIT_UNDO_REDO_MINUTE
 )
@@ -41,6 +54,12 @@ except Exception:
 logger = logging.getLogger(__name__)
 rooms_bp = Blueprint("rooms", __name__)
 
+MAX_STROKES_PER_BATCH = int(os.getenv("MAX_STROKES_PER_BATCH", "2000"))
+# Strokes are stamped before they are stored, on each replica's own clock, so
+# one can become visible after a read whose cursor is already past its ts.
+# /strokes/since re-sends this window behind the cursor; clients dedup by id.
+CURSOR_OVERLAP_MS = int(os.getenv("CURSOR_OVERLAP_MS", "10000"))
+
 def _authed_user():
     """
     Authenticate user via JWT token in Authorization header.
@@ -767,6 +786,84 @@ def admin_fill_wrapped_key(roomId):
     rooms_coll.update_one({"_id": room["_id"]}, {"$set": {"wrappedKey": wrapped}})
     return jsonify({"status":"ok","message":"wrappedKey created"})
 
+def _cut_ids(stroke):
+    """Return (originalStrokeIds, replacementSegmentIds) of a cut record, else two empty lists."""
+    path_data = stroke.get("pathData")
+    if isinstance(path_data, dict) and path_data.get("tool") == "cut" and path_data.get("cut") == True:
+        return ([str(sid) for sid in path_data.get("originalStrokeIds") or []],
+                [str(sid) for sid in path_data.get("replacementSegmentIds") or []])
+    return [], []
+
+
+def _move_stack_entry(roomId, key_base, ts, undo):
+    """
+    Pop the top of the undo (``undo=True``) or redo stack and apply the whole
+    Redis side of the action in one MULTI/EXEC: the pop, the cut-set swap,
+    the push onto the opposite stack, the undone_strokes and room-undone
+    index updates and the snapshot invalidation land together or not at all.
+    The source stack is WATCHed, so a concurrent undo/redo by the same user
+    makes this retry instead of moving the same entry twice.
+
+    Returns ``(raw, stroke, stroke_id)``, or None when the stack is empty.
+    An entry without a stroke id raises ValueError and stays on the stack.
+    """
+    src_key = f"{key_base}:undo" if undo else f"{key_base}:redo"
+    dst_key = f"{key_base}:redo" if undo else f"{key_base}:undo"
+    cut_set_key = f"cut-stroke-ids:{roomId}"
+    with redis_client.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                pipe.watch(src_key)
+                raw = pipe.lindex(src_key, 0)
+                if not raw:
+                    return None
+                stroke = json.loads(raw)
+                stroke_id = stroke.get("id") or stroke.get("drawingId")
+                if not stroke_id:
+                    raise ValueError("Stroke ID missing")
+                original_ids, replacement_ids = _cut_ids(stroke)
+                # Undo restores the originals and hides the replacements; redo reverses it
+                restore_ids, hide_ids = (original_ids, replacement_ids) if undo else (replacement_ids, original_ids)
+
+                pipe.multi()
+                pipe.lpop(src_key)
+                if restore_ids:
+                    pipe.srem(cut_set_key, *restore_ids)
+                if hide_ids:
+                    pipe.sadd(cut_set_key, *hide_ids)
+                pipe.lpush(dst_key, raw)
+                if undo:
+                    pipe.sadd(f"{key_base}:undone_strokes", stroke_id)
+                    record_undo(roomId, [stroke_id], ts, pipe=pipe)
+                else:
+                    pipe.srem(f"{key_base}:undone_strokes", stroke_id)
+                    record_redo(roomId, [stroke_id], pipe=pipe)
+                invalidate_snapshot(roomId, pipe=pipe)
+                pipe.execute()
+            except WatchError:
+                continue
+            if original_ids or replacement_ids:
+                logger.info(f"Swapped cut set for {stroke_id}: {len(original_ids)} original, {len(replacement_ids)} replacement IDs")
+            return raw, stroke, stroke_id
+
+
+def _check_path(stroke):
+    """
+    Validate client-packed pathData. Returns an error message or None. The
+    pathData is stored exactly as the client sent it, since that is what its
+    wallet signature covers; packing happens only on the way out.
+    """
+    path = stroke.get("pathData")
+    if is_packed_path(path):
+        ok, err = validate_path(path)
+        return None if ok else f"pathData invalid: {err}"
+    return None
+
+
+def _wants_packed_path():
+    return request.args.get("pathData") == "packed"
+
+
 @rooms_bp.route("/rooms/<roomId>/strokes", methods=["POST"])
 @require_auth
 @require_room_access(room_id_param="roomId")
@@ -857,6 +954,10 @@ def post_stroke(roomId):
         stroke["walletSignature"] = sig
         stroke["walletPubKey"]    = spk
 
+    path_error = _check_path(stroke)
+    if path_error:
+        return jsonify({"status":"error","message":path_error}), 400
+
     asset_data = {}
     if room["type"] in ("private","secure"):
         if not room.get("wrappedKey"):
@@ -887,11 +988,12 @@ def post_stroke(roomId):
         
         logger.warning(f"ENCRYPTING STROKE (private/secure): brushType={stroke.get('brushType')}, brushParams={stroke.get('brushParams')}, metadata={stroke.get('metadata')}")
         
-        enc = encrypt_for_room(rk, json.dumps(stroke).encode())
-        asset_data = {"roomId": roomId, "type": room["type"], "encrypted": enc}
+        enc = encrypt_stroke(rk, stroke)
+        asset_data = {"roomId": roomId, "type": room["type"], "encrypted": bundle_for_json(enc)}
         strokes_coll.insert_one({"roomId": roomId, "ts": stroke["ts"], "blob": enc})
+        index_stroke(roomId, stroke, blob=enc)
 
-        rooms_coll.update_one({"_id": room["_id"]}, {"$set": {"updatedAt": datetime.utcnow()}})
+        touch_room(room["_id"])
     else:
         asset_data = {"roomId": roomId, "type": "public", "stroke": stroke}
         
@@ -899,63 +1001,34 @@ def post_stroke(roomId):
         logger.warning(f"STORING FULL STROKE: {json.dumps(stroke, default=str)[:500]}...")
         
         strokes_coll.insert_one({"roomId": roomId, "ts": stroke["ts"], "stroke": stroke})
+        index_stroke(roomId, stroke)
 
-        rooms_coll.update_one({"_id": room["_id"]}, {"$set": {"updatedAt": datetime.utcnow()}})
+        touch_room(room["_id"])
 
-    # Cache stroke in Redis ensures strokes are available even before MongoDB sync completes
+    # Stroke cache (so strokes are readable before MongoDB sync completes),
+    # cut set and undo stack go to Redis as one MULTI/EXEC round trip
+    orig_stroke_ids, _ = _cut_ids(stroke)
+    skip_undo_stack = payload.get("skipUndoStack", False) or stroke.get("skipUndoStack", False)
     try:
-        stroke_cache_key = f"stroke:{roomId}:{stroke['id']}"
-        stroke_cache_value = {
-            "id": stroke["id"],
-            "roomId": roomId,
-            "ts": stroke["ts"],
-            "user": stroke["user"],
-            "stroke": stroke,
-            "undone": False
-        }
-        redis_client.set(
-            stroke_cache_key,
-            json.dumps(stroke_cache_value)
-        )
+        pipe = redis_client.pipeline(transaction=True)
+        cache_stroke(roomId, stroke, pipe=pipe)
+        if orig_stroke_ids:
+            pipe.sadd(f"cut-stroke-ids:{roomId}", *orig_stroke_ids)
+        if not skip_undo_stack:
+            key_base = f"room:{roomId}:{claims['sub']}"
+            pipe.lpush(f"{key_base}:undo", json.dumps(stroke))
+            pipe.delete(f"{key_base}:redo")
+        pipe.execute()
         logger.info(f"Cached stroke {stroke['id']} in Redis with brushType={stroke.get('brushType')}")
+        if orig_stroke_ids:
+            invalidate_snapshot(roomId)
+            logger.info(f"Added {len(orig_stroke_ids)} stroke IDs to cut set for room {roomId}")
     except Exception as e:
-        logger.warning(f"Failed to cache stroke in Redis: {e}")
-
-    try:
-        path_data = stroke.get("pathData")
-        if isinstance(path_data, dict) and path_data.get("tool") == "cut" and path_data.get("cut") == True:
-            orig_stroke_ids = path_data.get("originalStrokeIds") or []
-            if orig_stroke_ids:
-                cut_set_key = f"cut-stroke-ids:{roomId}"
-                redis_client.sadd(cut_set_key, *[str(sid) for sid in orig_stroke_ids])
-                logger.info(f"Added {len(orig_stroke_ids)} stroke IDs to cut set for room {roomId}")
-    except Exception as e:
-        logger.warning(f"post_stroke: failed to process cut record: {e}")
-
-    prep = {
-        "operation": "CREATE",
-        "amount": 1,
-        "signerPublicKey": SIGNER_PUBLIC_KEY,
-        "signerPrivateKey": SIGNER_PRIVATE_KEY,
-        "recipientPublicKey": RECIPIENT_PUBLIC_KEY,
-        "asset": { "data": asset_data }
-    }
-    
-    # Attempt ResilientDB commit (non-blocking - don't fail request if GraphQL is down)
-    try:
-        txn_id = commit_transaction_via_graphql(prep)
-        logger.info(f"ResilientDB commit SUCCESS for stroke {stroke['id']}: txn_id={txn_id}")
-    except Exception as e:
-        logger.error(f"ResilientDB commit FAILED for stroke {stroke['id']} (stroke saved to MongoDB): {str(e)}")
-        # Queue for retry - will automatically sync when ResilientDB comes back online
-        add_to_retry_queue(stroke['id'], asset_data)
-        logger.info(f"Added stroke {stroke['id']} to retry queue for later sync")
+        logger.warning(f"post_stroke: failed to update Redis for stroke {stroke['id']}: {e}")
 
-    skip_undo_stack = payload.get("skipUndoStack", False) or stroke.get("skipUndoStack", False)
-    if not skip_undo_stack:
-        key_base = f"room:{roomId}:{claims['sub']}"
-        redis_client.lpush(f"{key_base}:undo", json.dumps(stroke))
-        redis_client.delete(f"{key_base}:redo")
+    # The ResilientDB commit happens off the request thread; the txn id is
+    # pushed to the room as resilientdb_committed once it lands.
+    enqueue_commit(stroke['id'], asset_data, roomId)
 
     push_to_room(roomId, "new_stroke", {
         "roomId": roomId,
@@ -973,7 +1046,9 @@ def post_stroke(roomId):
 def post_strokes_batch(roomId):
     """
     Add multiple strokes to a room's canvas in a single request.
-    Optimized for paste operations to reduce network overhead.
+    Optimized for paste operations: strokes are verified first, then written
+    with one insert_many, one Redis pipeline, one activity touch and one
+    pipelined outbox enqueue.
     
     Server-side enforcement:
     - Authentication required via @require_auth
@@ -998,14 +1073,14 @@ def post_strokes_batch(roomId):
     if len(strokes) == 0:
         return jsonify({"status":"ok", "processed": 0})
     
-    if len(strokes) > 200:
-        return jsonify({"status":"error","message":"Maximum 200 strokes per batch"}), 400
+    if len(strokes) > MAX_STROKES_PER_BATCH:
+        return jsonify({"status":"error","message":f"Maximum {MAX_STROKES_PER_BATCH} strokes per batch"}), 400
     
     logger.info(f"Processing batch of {len(strokes)} strokes for room {roomId}")
     
-    processed_count = 0
     failed_count = 0
     errors = []
+    index_batch = []
     
     # Get room key once for encrypted rooms
     room_key = None
@@ -1033,8 +1108,15 @@ def post_strokes_batch(roomId):
             logger.exception("post_strokes_batch: failed to unwrap room key: %s", e)
             return jsonify({"status": "error", "message": "Invalid room encryption key"}), 500
     
+    # Pass 1: normalize and verify every stroke; nothing is written yet
+    accepted = []
     for idx, stroke in enumerate(strokes):
         try:
+            if not isinstance(stroke, dict):
+                errors.append(f"Stroke {idx}: Stroke must be an object")
+                failed_count += 1
+                continue
+
             # Add default fields
             stroke["roomId"] = roomId
             stroke["user"] = claims["username"]
@@ -1086,65 +1168,82 @@ def post_strokes_batch(roomId):
                     errors.append(f"Stroke {idx}: Bad signature")
                     failed_count += 1
                     continue
-            
-            # Store stroke
-            if room["type"] in ("private", "secure"):
-                enc = encrypt_for_room(room_key, json.dumps(stroke).encode())
-                asset_data = {"roomId": roomId, "type": room["type"], "encrypted": enc}
-                strokes_coll.insert_one({"roomId": roomId, "ts": stroke["ts"], "blob": enc})
-            else:
-                asset_data = {"roomId": roomId, "type": "public", "stroke": stroke}
-                strokes_coll.insert_one({"roomId": roomId, "ts": stroke["ts"], "stroke": stroke})
-            
-            # Cache in Redis
-            try:
-                stroke_cache_key = f"stroke:{roomId}:{stroke['id']}"
-                stroke_cache_value = {
-                    "id": stroke["id"],
-                    "roomId": roomId,
-                    "ts": stroke["ts"],
-                    "user": stroke["user"],
-                    "stroke": stroke,
-                    "undone": False
-                }
-                redis_client.set(stroke_cache_key, json.dumps(stroke_cache_value))
-            except Exception as e:
-                logger.warning(f"Failed to cache stroke {idx} in Redis: {e}")
-            
-            # Commit to ResilientDB (non-blocking - don't fail batch if GraphQL is down)
-            prep = {
-                "operation": "CREATE",
-                "amount": 1,
-                "signerPublicKey": SIGNER_PUBLIC_KEY,
-                "signerPrivateKey": SIGNER_PRIVATE_KEY,
-                "recipientPublicKey": RECIPIENT_PUBLIC_KEY,
-                "asset": {"data": asset_data}
-            }
-            try:
-                txn_id = commit_transaction_via_graphql(prep)
-                logger.info(f"ResilientDB batch commit SUCCESS for stroke {stroke['id']} ({idx+1}/{len(strokes)}): txn_id={txn_id}")
-            except Exception as e:
-                logger.error(f"ResilientDB batch commit FAILED for stroke {stroke['id']} ({idx+1}/{len(strokes)}) (stroke saved to MongoDB): {str(e)}")
-                # Queue for retry - will automatically sync when ResilientDB comes back online
-                add_to_retry_queue(stroke['id'], asset_data)
-                logger.info(f"Added batch stroke {stroke['id']} to retry queue for later sync")
-            
-            # Update undo stack if not skipped
-            skip_undo_stack = payload.get("skipUndoStack", False) or stroke.get("skipUndoStack", False)
-            if not skip_undo_stack:
-                key_base = f"room:{roomId}:{claims['sub']}"
-                redis_client.lpush(f"{key_base}:undo", json.dumps(stroke))
-                redis_client.delete(f"{key_base}:redo")
-            
-            processed_count += 1
-            
+
+            path_error = _check_path(stroke)
+            if path_error:
+                errors.append(f"Stroke {idx}: {path_error}")
+                failed_count += 1
+                continue
+
+            accepted.append((idx, stroke))
         except Exception as e:
             logger.exception(f"Failed to process batch stroke {idx}: {e}")
             errors.append(f"Stroke {idx}: {str(e)}")
             failed_count += 1
-    
+
+    # Pass 2: build documents; encrypted rooms reuse the single unwrapped key
+    docs = []
+    asset_batch = []
+    for idx, stroke in accepted:
+        if room_key is not None:
+            enc = encrypt_stroke(room_key, stroke)
+            docs.append({"roomId": roomId, "ts": stroke["ts"], "blob": enc})
+            asset_batch.append({"roomId": roomId, "type": room["type"], "encrypted": bundle_for_json(enc)})
+            index_batch.append(make_row(roomId, stroke, blob=enc))
+        else:
+            docs.append({"roomId": roomId, "ts": stroke["ts"], "stroke": stroke})
+            asset_batch.append({"roomId": roomId, "type": "public", "stroke": stroke})
+            index_batch.append(make_row(roomId, stroke))
+
+    # One unordered insert_many; strokes whose insert failed are dropped from
+    # every later step
+    failed_positions = set()
+    if docs:
+        try:
+            strokes_coll.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            for err in (e.details or {}).get("writeErrors", []):
+                failed_positions.add(err.get("index"))
+        except Exception as e:
+            logger.exception(f"post_strokes_batch: insert_many failed for room {roomId}: {e}")
+            failed_positions = set(range(len(docs)))
+    for pos in sorted(failed_positions):
+        errors.append(f"Stroke {accepted[pos][0]}: failed to store stroke")
+    failed_count += len(failed_positions)
+
+    stored = [i for i in range(len(accepted)) if i not in failed_positions]
+    cache_batch = [accepted[i][1] for i in stored]
+    index_batch = [index_batch[i] for i in stored]
+    processed_count = len(stored)
+
+    index_room_rows(roomId, index_batch)
+
+    # Commit to ResilientDB off the request thread; the outbox workers post
+    # these as batched GraphQL requests
+    enqueue_commits(((accepted[i][1]["id"], asset_batch[i]) for i in stored), roomId)
+
+    # Cache, undo stack and cut set in one Redis pipeline
+    skip_all = payload.get("skipUndoStack", False)
+    undo_entries = [json.dumps(stroke) for stroke in cache_batch
+                    if not (skip_all or stroke.get("skipUndoStack", False))]
+    cut_ids = [sid for stroke in cache_batch for sid in _cut_ids(stroke)[0]]
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        cache_strokes(roomId, cache_batch, pipe=pipe)
+        if undo_entries:
+            key_base = f"room:{roomId}:{claims['sub']}"
+            pipe.lpush(f"{key_base}:undo", *undo_entries)
+            pipe.delete(f"{key_base}:redo")
+        if cut_ids:
+            pipe.sadd(f"cut-stroke-ids:{roomId}", *cut_ids)
+        pipe.execute()
+        if cut_ids:
+            invalidate_snapshot(roomId)
+    except Exception as e:
+        logger.warning(f"Failed to update Redis for batch strokes: {e}")
+
     # Update room timestamp
-    rooms_coll.update_one({"_id": room["_id"]}, {"$set": {"updatedAt": datetime.utcnow()}})
+    touch_room(room["_id"])
     
     # Broadcast batch completion
     push_to_room(roomId, "batch_strokes_added", {
@@ -1181,6 +1280,12 @@ def get_strokes(roomId):
     Query parameters (all optional):
     - start: Start timestamp for history range
     - end: End timestamp for history range
+    - pathData=packed: return freehand pathData in the packed delta form
+      (services.stroke_codec) instead of ``{x, y}`` point lists; paths that
+      cannot be packed exactly stay point lists
+
+    The response carries a ``cursor`` that can be passed to
+    GET /rooms/<roomId>/strokes/since to catch up after a reconnect.
     """
     user = g.current_user
     claims = g.token_claims
@@ -1202,142 +1307,25 @@ def get_strokes(roomId):
             {"transactions.value.asset.data.roomId": {"$in": [roomId]}}
         ]
     }
-    items = list(strokes_coll.find(mongo_query))
     
     # Check Redis cache for recently added strokes
     # This ensures strokes appear even before MongoDB sync completes
     redis_strokes = []
     try:
-        pattern = f"stroke:{roomId}:*"
-        for key in redis_client.scan_iter(match=pattern):
-            try:
-                cached_data = redis_client.get(key)
-                if cached_data:
-                    stroke_entry = json.loads(cached_data if isinstance(cached_data, str) else cached_data.decode('utf-8'))
-                    redis_strokes.append(stroke_entry)
-            except Exception as e:
-                logger.warning(f"Failed to parse cached stroke {key}: {e}")
+        if room.get("type") not in ("private", "secure"):
+            redis_strokes = get_cached_strokes(roomId)
         
         if redis_strokes:
             logger.info(f"Retrieved {len(redis_strokes)} strokes from Redis cache for room {roomId}")
     except Exception as e:
         logger.warning(f"Failed to retrieve Redis cached strokes: {e}")
     
-    user_id = claims['sub']
-    undone_strokes = set()
-    
-    cut_set_key = f"cut-stroke-ids:{roomId}"
-    try:
-        raw_cut = redis_client.smembers(cut_set_key)
-        cut_stroke_ids = set(x.decode() if isinstance(x, (bytes, bytearray)) else str(x) for x in (raw_cut or set()))
-    except Exception as e:
-        logger.warning(f"Failed to get cut stroke IDs: {e}")
-        cut_stroke_ids = set()
-    
-    try:
-        pattern = f"room:{roomId}:*:undone_strokes"
-        for key in redis_client.scan_iter(match=pattern):
-            undone_keys = redis_client.smembers(key)
-            for stroke_key in undone_keys:
-                undone_strokes.add(stroke_key.decode('utf-8') if isinstance(stroke_key, bytes) else str(stroke_key))
-        logger.debug(f"Loaded {len(undone_strokes)} undone strokes from Redis for room {roomId}")
-    except Exception as e:
-        logger.warning(f"Redis lookup for undone strokes failed: {e}")
-
-    try:
-        # Try to recover undo/redo state from MongoDB markers
-        # Markers can be in different formats depending on how they were stored
-        pipeline = [
-            {
-                "$match": {
-                    "$or": [
-                        # Format 1: Direct asset.data structure (from ResDB mirror)
-                        {
-                            "asset.data.roomId": roomId,
-                            "asset.data.type": {"$in": ["undo_marker", "redo_marker"]}
-                        },
-                        # Format 2: Transactions array structure
-                        {
-                            "transactions.value.asset.data.roomId": roomId,
-                            "transactions.value.asset.data.type": {"$in": ["undo_marker", "redo_marker"]}
-                        }
-                    ]
-                }
-            },
-            {"$sort": {"_id": -1}}  # Sort by MongoDB _id (descending) as proxy for time
-        ]
-        
-        markers_cursor = strokes_coll.aggregate(pipeline)
-        markers_found = {}
-        
-        for doc in markers_cursor:
-            marker_data = None
-            stroke_id = None
-            marker_type = None
-            
-            # Try asset.data first
-            if 'asset' in doc and 'data' in doc['asset']:
-                marker_data = doc['asset']['data']
-                stroke_id = marker_data.get('strokeId')
-                marker_type = marker_data.get('type')
-            
-            # Try transactions array
-            elif 'transactions' in doc and isinstance(doc['transactions'], list):
-                for txn in doc['transactions']:
-                    if 'value' in txn and 'asset' in txn['value'] and 'data' in txn['value']['asset']:
-                        data = txn['value']['asset']['data']
-                        if data.get('type') in ['undo_marker', 'redo_marker'] and data.get('roomId') == roomId:
-                            marker_data = data
-                            stroke_id = data.get('strokeId')
-                            marker_type = data.get('type')
-                            break
-            
-            if stroke_id and marker_type:
-                # Keep only the most recent marker for each stroke
-                if stroke_id not in markers_found:
-                    markers_found[stroke_id] = marker_type
-        
-        # Apply the markers to build the undone set
-        for stroke_id, marker_type in markers_found.items():
-            if marker_type == "undo_marker":
-                undone_strokes.add(stroke_id)
-            elif marker_type == "redo_marker":
-                undone_strokes.discard(stroke_id)
-        
-        logger.debug(f"Total {len(undone_strokes)} undone strokes after MongoDB recovery for room {roomId}")
-    except Exception as e:
-        logger.warning(f"MongoDB recovery of undo/redo state failed: {e}")
-        logger.exception(e)
-
-    try:
-        clear_after = 0
-        clear_key = f"last-clear-ts:{roomId}"
-        raw = None
-        try:
-            raw = redis_client.get(clear_key)
-        except Exception:
-            raw = None
-        if raw:
-            try:
-                if isinstance(raw, (bytes, bytearray)):
-                    raw = raw.decode()
-                clear_after = int(raw)
-            except Exception:
-                clear_after = 0
-        else:
-            try:
-                blk = strokes_coll.find_one({"asset.data.type": "clear_marker", "asset.data.roomId": roomId}, sort=[("_id", -1)])
-                if blk:
-                    asset = (blk.get("asset") or {}).get("data", {})
-                    cand = asset.get("ts") or asset.get("timestamp") or asset.get("value")
-                    try:
-                        clear_after = int(cand) if cand is not None else 0
-                    except Exception:
-                        clear_after = 0
-            except Exception:
-                clear_after = 0
-    except Exception:
-        clear_after = 0
+    # Undone/cut/clear resolution comes from the room snapshot; it is only
+    # recomputed from Redis and the Mongo markers after an undo, redo, cut or clear.
+    room_state = load_room_state(roomId)
+    undone_strokes = room_state["undoneIds"]
+    cut_stroke_ids = room_state["cutIds"]
+    clear_after = room_state["clearTs"]
 
     start_param = request.args.get('start')
     end_param = request.args.get('end')
@@ -1351,8 +1339,8 @@ def get_strokes(roomId):
     except Exception:
         end_ts = None
 
+    rk = None
     if room["type"] in ("private","secure"):
-        rk = None
         try:
             if room.get("wrappedKey"):
                 rk = unwrap_room_key(room["wrappedKey"])
@@ -1360,50 +1348,42 @@ def get_strokes(roomId):
             logger.exception("get_strokes: failed to unwrap room key for room %s", roomId)
             rk = None
 
+    # Serve from the per-room stroke index (single range query on roomId, ts)
+    # once it is complete for this room; otherwise scan every stroke shape.
+    # A live load reads the snapshot's visible rows plus the rows after its
+    # covered bound rather than every post-clear row.
+    items = None
+    if room["type"] == "public" or rk is not None:
+        was_indexed = bool(room.get(READY_FIELD))
+        if ensure_room_indexed(room, rk):
+            if not was_indexed:
+                # Rows just backfilled may sit below the snapshot's bound
+                invalidate_snapshot(roomId)
+            try:
+                if history_mode:
+                    items = find_room_strokes(roomId, start_ts=start_ts, end_ts=end_ts)
+                elif was_indexed and room_state.get("visibleIds") is not None:
+                    items = find_room_strokes_by_id(roomId, room_state["visibleIds"])
+                    items += find_room_strokes_after(roomId, room_state["coveredTs"], room_state["coveredId"])
+                else:
+                    items = find_room_strokes(roomId, after_ts=clear_after)
+            except Exception:
+                logger.exception("get_strokes: stroke index read failed for room %s", roomId)
+                items = None
+    if items is None:
+        items = list(strokes_coll.find(mongo_query))
+
+    if room["type"] in ("private","secure"):
         out = []
         seen_stroke_ids = set()
-        
-        for it in items:
+
+        # Decrypt on the decrypt pool, in chunks, preserving item order
+        decoded = parallel_map(lambda it: decode_stroke(it, rk), items)
+
+        for stroke_data in decoded:
             try:
-                stroke_data = None
-                
-                if 'transactions' in it and it['transactions']:
-                    try:
-                        asset_data = it['transactions'][0]['value']['asset']['data']
-                        if 'stroke' in asset_data:
-                            stroke_data = asset_data['stroke']
-                            if stroke_data and 'timestamp' in stroke_data:
-                                stroke_data['ts'] = stroke_data['timestamp']
-                        elif 'encrypted' in asset_data:
-                            if rk is None:
-                                continue
-                            blob = asset_data['encrypted']
-                            raw = decrypt_for_room(rk, blob)
-                            stroke_data = json.loads(raw.decode())
-                            if stroke_data and 'timestamp' in stroke_data:
-                                stroke_data['ts'] = stroke_data['timestamp']
-                    except (KeyError, IndexError, TypeError):
-                        pass
-                
                 if stroke_data is None:
-                    if "blob" in it:
-                        if rk is None:
-                            continue
-                        blob = it["blob"]
-                        raw = decrypt_for_room(rk, blob)
-                        stroke_data = json.loads(raw.decode())
-                    elif 'asset' in it and 'data' in it['asset'] and 'encrypted' in it['asset']['data']:
-                        if rk is None:
-                            continue
-                        blob = it['asset']['data']['encrypted']
-                        raw = decrypt_for_room(rk, blob)
-                        stroke_data = json.loads(raw.decode())
-                    elif "stroke" in it:
-                        stroke_data = it["stroke"]
-                    elif 'asset' in it and 'data' in it['asset'] and 'stroke' in it['asset']['data']:
-                        stroke_data = it['asset']['data']['stroke']
-                    else:
-                        continue
+                    continue
 
                 stroke_id = stroke_data.get("id") or stroke_data.get("drawingId")
                 
@@ -1433,16 +1413,7 @@ def get_strokes(roomId):
                     logger.warning(f"PASTE FILTER DEBUG - strokeId={stroke_id}, parentPasteId={parent_paste_id}, parent_undone={parent_undone}, in_undone_set={parent_paste_id in undone_strokes}")
 
                 if stroke_id and not parent_undone and stroke_id not in undone_strokes and stroke_id not in cut_stroke_ids:
-                    try:
-                        st_ts = stroke_data.get('ts') or stroke_data.get('timestamp')
-                        if isinstance(st_ts, dict) and '$numberLong' in st_ts:
-                            st_ts = int(st_ts['$numberLong'])
-                        elif isinstance(st_ts, (bytes, bytearray)):
-                            st_ts = int(st_ts.decode())
-                        else:
-                            st_ts = int(st_ts) if st_ts is not None else None
-                    except Exception:
-                        st_ts = None
+                    st_ts = coerce_ts(stroke_data.get('ts') or stroke_data.get('timestamp'))
 
                     if not history_mode and (st_ts is None or st_ts <= clear_after):
                         continue
@@ -1511,35 +1482,19 @@ def get_strokes(roomId):
             for i, stroke in enumerate(out[:2]):
                 logger.warning(f"Stroke {i}: {json.dumps(stroke, indent=2)}")
         
-        return jsonify({"status":"ok","strokes": out})
+        packed = _wants_packed_path()
+        load_cursor = _load_cursor(out, clear_after)
+        out = [stroke_for_client(s, packed) for s in out]
+        return jsonify({"status":"ok","strokes": out, "cursor": load_cursor})
     else:
         filtered_strokes = []
         seen_stroke_ids = set()
         
         for it in items:
             try:
-                stroke_data = None
-                
-                if 'transactions' in it and it['transactions']:
-                    try:
-                        asset_data = it['transactions'][0]['value']['asset']['data']
-                        if 'stroke' in asset_data:
-                            stroke_data = asset_data['stroke']
-                            if stroke_data and 'timestamp' in stroke_data:
-                                stroke_data['ts'] = stroke_data['timestamp']
-                    except (KeyError, IndexError, TypeError):
-                        pass
-                
+                stroke_data = decode_stroke(it)
                 if stroke_data is None:
-                    if 'stroke' in it:
-                        stroke_data = it["stroke"]
-                    elif 'asset' in it and 'data' in it['asset']:
-                        if 'stroke' in it['asset']['data']:
-                            stroke_data = it['asset']['data']['stroke']
-                        elif 'value' in it['asset']['data']:
-                            stroke_data = json.loads(it['asset']['data'].get('value', '{}'))
-                    else:
-                        continue
+                    continue
 
                 stroke_id = stroke_data.get("id") or stroke_data.get("drawingId")
                 
@@ -1568,16 +1523,7 @@ def get_strokes(roomId):
                     logger.warning(f"PASTE FILTER DEBUG (public) - strokeId={stroke_id}, parentPasteId={parent_paste_id}, parent_undone={parent_undone}, in_undone_set={parent_paste_id in undone_strokes}")
 
                 if stroke_id and not parent_undone and stroke_id not in undone_strokes and stroke_id not in cut_stroke_ids:
-                    try:
-                        st_ts = stroke_data.get('ts') or stroke_data.get('timestamp')
-                        if isinstance(st_ts, dict) and '$numberLong' in st_ts:
-                            st_ts = int(st_ts['$numberLong'])
-                        elif isinstance(st_ts, (bytes, bytearray)):
-                            st_ts = int(st_ts.decode())
-                        else:
-                            st_ts = int(st_ts) if st_ts is not None else None
-                    except Exception:
-                        st_ts = None
+                    st_ts = coerce_ts(stroke_data.get('ts') or stroke_data.get('timestamp'))
 
                     if not history_mode and (st_ts is None or st_ts <= clear_after):
                         continue
@@ -1751,7 +1697,180 @@ def get_strokes(roomId):
             if 'ts' in stroke and 'timestamp' not in stroke:
                 stroke['timestamp'] = stroke['ts']
         
-        return jsonify({"status":"ok","strokes": filtered_strokes})
+        packed = _wants_packed_path()
+        load_cursor = _load_cursor(filtered_strokes, clear_after)
+        filtered_strokes = [stroke_for_client(s, packed) for s in filtered_strokes]
+        return jsonify({"status":"ok","strokes": filtered_strokes, "cursor": load_cursor})
+
+
+def _format_cursor(ts, stroke_id):
+    return f"{int(ts)}:{stroke_id or ''}"
+
+
+def _load_cursor(strokes, clear_after=None):
+    """Cursor just past the newest stroke a room load returned (never wall-clock time)."""
+    newest = clear_after or 0
+    for s in strokes:
+        ts = coerce_ts(s.get("ts") or s.get("timestamp"))
+        if ts is not None and ts > newest:
+            newest = ts
+    return _format_cursor(newest, "")
+
+
+def _parse_cursor(raw):
+    """Parse a ``<ts>:<strokeId>`` cursor. A bare timestamp is accepted too."""
+    ts_part, _, sid = (raw or "").partition(":")
+    return int(ts_part), sid
+
+
+def _normalize_stroke_for_client(stroke_data):
+    """Fill brush/metadata fields the same way get_strokes does."""
+    meta_obj = stroke_data.get("metadata") or {}
+    stroke_data["brushStyle"] = stroke_data.get("brushStyle") or meta_obj.get("brushStyle") or "round"
+    stroke_data["brushType"] = stroke_data.get("brushType") or meta_obj.get("brushType") or "normal"
+    stroke_data["brushParams"] = stroke_data.get("brushParams") or meta_obj.get("brushParams") or {}
+    stroke_data["drawingType"] = stroke_data.get("drawingType") or meta_obj.get("drawingType") or "stroke"
+    stroke_data["stampData"] = stroke_data.get("stampData") or meta_obj.get("stampData")
+    stroke_data["stampSettings"] = stroke_data.get("stampSettings") or meta_obj.get("stampSettings")
+    stroke_data["filterType"] = stroke_data.get("filterType") or meta_obj.get("filterType")
+    stroke_data["filterParams"] = stroke_data.get("filterParams") or meta_obj.get("filterParams") or {}
+    stroke_data["metadata"] = {
+        "brushStyle": stroke_data["brushStyle"],
+        "brushType": stroke_data["brushType"],
+        "brushParams": stroke_data["brushParams"],
+        "drawingType": stroke_data["drawingType"],
+        "stampData": stroke_data["stampData"],
+        "stampSettings": stroke_data["stampSettings"],
+        "filterType": stroke_data["filterType"],
+        "filterParams": stroke_data["filterParams"],
+    }
+    if 'id' in stroke_data and 'drawingId' not in stroke_data:
+        stroke_data['drawingId'] = stroke_data['id']
+    if 'ts' in stroke_data:
+        stroke_data['timestamp'] = stroke_data['ts']
+    return stroke_data
+
+
+@rooms_bp.route("/rooms/<roomId>/strokes/since", methods=["GET"])
+@require_auth
+@require_room_access(room_id_param="roomId")
+def get_strokes_since(roomId):
+    """
+    Return only what changed in a room after ``cursor``.
+
+    Intended for reconnects and refreshes: the client passes the cursor from
+    its last GET /rooms/<roomId>/strokes (or from a previous call here) and
+    receives the strokes, undo/redo markers and clear markers created since.
+
+    Query parameters:
+    - cursor (required): ``<ts>:<strokeId>`` as returned by the server
+    - limit: maximum strokes to return (default 500, max 2000)
+    - pathData=packed: as for GET /rooms/<roomId>/strokes
+
+    Response fields:
+    - strokes: new strokes ordered by (ts, strokeId)
+    - markers: undo/redo markers ``{type, strokeId, user, ts}`` since the cursor
+    - clearedAt: latest clear timestamp since the cursor, or null
+    - cursor: pass this on the next call
+    - hasMore: more strokes are pending past the returned cursor
+    - resync: the delta cannot be served; the client should reload fully
+
+    Strokes and markers from the CURSOR_OVERLAP_MS before the cursor are sent
+    again on every call, so a stroke stored late (its ts comes from the
+    replica that received it, before the write) is still delivered. Clients
+    dedup strokes by id; applying a marker twice is idempotent.
+    """
+    room = g.current_room
+
+    try:
+        cursor_ts, cursor_sid = _parse_cursor(request.args.get("cursor"))
+    except (TypeError, ValueError):
+        return jsonify({"status":"error","message":"Invalid cursor"}), 400
+    try:
+        limit = max(1, min(int(request.args.get("limit", 500)), 2000))
+    except (TypeError, ValueError):
+        limit = 500
+
+    rk = None
+    if room["type"] in ("private","secure"):
+        try:
+            if room.get("wrappedKey"):
+                rk = unwrap_room_key(room["wrappedKey"])
+        except Exception:
+            logger.exception("get_strokes_since: failed to unwrap room key for room %s", roomId)
+        if rk is None:
+            return jsonify({"status":"ok","resync": True,"strokes": [],"markers": [],"clearedAt": None,"cursor": _format_cursor(cursor_ts, cursor_sid),"hasMore": False})
+
+    if not ensure_room_indexed(room, rk):
+        return jsonify({"status":"ok","resync": True,"strokes": [],"markers": [],"clearedAt": None,"cursor": _format_cursor(cursor_ts, cursor_sid),"hasMore": False})
+
+    overlap_ts = max(0, cursor_ts - CURSOR_OVERLAP_MS)
+    try:
+        rows = find_room_strokes_after(roomId, cursor_ts, cursor_sid, limit=limit + 1)
+        late_rows = find_room_strokes(roomId, start_ts=overlap_ts, end_ts=cursor_ts) if cursor_ts else []
+    except Exception:
+        logger.exception("get_strokes_since: stroke index read failed for room %s", roomId)
+        return jsonify({"status":"error","message":"Failed to read strokes"}), 500
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # The cursor only advances over rows actually returned; the overlap rows
+    # ride along without moving it, so paging always makes progress
+    new_ts, new_sid = cursor_ts, cursor_sid
+    if rows:
+        new_ts, new_sid = rows[-1]["ts"], rows[-1]["strokeId"]
+    page_ids = {row["strokeId"] for row in rows}
+    rows = [row for row in late_rows if row["strokeId"] not in page_ids] + rows
+
+    marker_query = {
+        "asset.data.roomId": roomId,
+        "asset.data.type": {"$in": ["undo_marker", "redo_marker", "clear_marker"]},
+        "asset.data.ts": {"$gte": overlap_ts}
+    }
+    if has_more:
+        marker_query["asset.data.ts"]["$lte"] = new_ts
+
+    markers = []
+    cleared_at = None
+    try:
+        for doc in strokes_coll.find(marker_query, {"asset.data.value": 0}).sort([("asset.data.ts", 1), ("_id", 1)]):
+            data = (doc.get("asset") or {}).get("data") or {}
+            try:
+                m_ts = int(data.get("ts"))
+            except Exception:
+                continue
+            if data.get("type") == "clear_marker":
+                cleared_at = max(cleared_at or 0, m_ts)
+            else:
+                markers.append({"type": data.get("type"), "strokeId": data.get("strokeId"), "user": data.get("user"), "ts": m_ts})
+            if not has_more and m_ts > new_ts:
+                new_ts, new_sid = m_ts, ""
+    except Exception:
+        logger.exception("get_strokes_since: marker lookup failed for room %s", roomId)
+        return jsonify({"status":"error","message":"Failed to read markers"}), 500
+
+    packed = _wants_packed_path()
+    strokes = []
+    for row in rows:
+        if cleared_at is not None and row["ts"] <= cleared_at:
+            continue
+        try:
+            stroke_data = decode_stroke(row, rk)
+            if stroke_data is None:
+                continue
+            stroke_data["ts"] = row["ts"]
+            strokes.append(stroke_for_client(_normalize_stroke_for_client(stroke_data), packed))
+        except Exception:
+            logger.warning("get_strokes_since: skipping undecodable stroke %s in room %s", row.get("strokeId"), roomId)
+
+    return jsonify({
+        "status": "ok",
+        "strokes": strokes,
+        "markers": markers,
+        "clearedAt": cleared_at,
+        "cursor": _format_cursor(new_ts, new_sid),
+        "hasMore": has_more,
+    })
 
 @rooms_bp.route("/rooms/<roomId>/undo", methods=["POST"])
 @require_auth
@@ -1779,103 +1898,47 @@ def room_undo(roomId):
     key_base = f"room:{roomId}:{user_id}"
     logger.info(f"Using key_base: {key_base} for user {user_id}")
     
-    last_raw = redis_client.lpop(f"{key_base}:undo")
-    if not last_raw:
+    ts = int(time.time() * 1000)
+    try:
+        moved = _move_stack_entry(roomId, key_base, ts, undo=True)
+    except Exception as e:
+        logger.exception("An error occurred during room_undo")
+        return jsonify({"status":"error","message":f"Failed to undo: {str(e)}"}), 500
+    if not moved:
         logger.info("Undo stack is empty, returning noop.")
         return jsonify({"status":"noop"})
-    
-    logger.info("Popped stroke from undo stack.")
-    
-    try:
-        stroke = json.loads(last_raw)
-        stroke_id = stroke.get("id") or stroke.get("drawingId")
-        if not stroke_id:
-            logger.error("Stroke ID missing in undo data.")
-            raise ValueError("Stroke ID missing")
-
-        logger.info(f"Processing undo for stroke_id: {stroke_id}")
 
-        path_data = stroke.get("pathData")
-        is_cut_record = (isinstance(path_data, dict) and 
-                        path_data.get("tool") == "cut" and 
-                        path_data.get("cut") == True)
-        
-        if is_cut_record:
-            original_stroke_ids = path_data.get("originalStrokeIds") or []
-            replacement_segment_ids = path_data.get("replacementSegmentIds") or []
-            cut_set_key = f"cut-stroke-ids:{roomId}"
-            
-            if original_stroke_ids:
-                for orig_id in original_stroke_ids:
-                    redis_client.srem(cut_set_key, str(orig_id))
-                logger.info(f"Removed {len(original_stroke_ids)} original stroke IDs from cut set during undo")
-            
-            if replacement_segment_ids:
-                for rep_id in replacement_segment_ids:
-                    redis_client.sadd(cut_set_key, str(rep_id))
-                logger.info(f"Added {len(replacement_segment_ids)} replacement segment IDs to cut set during undo")
+    _, stroke, stroke_id = moved
+    logger.info(f"Moved stroke {stroke_id} to redo stack.")
 
-        redis_client.lpush(f"{key_base}:redo", last_raw)
-        logger.info("Moved stroke to redo stack.")
-        
-        redis_client.sadd(f"{key_base}:undone_strokes", stroke_id)
-        logger.info("Added stroke to undone_strokes set in Redis.")
+    marker_rec = {
+        "type": "undo_marker",
+        "roomId": roomId,
+        "user": user_id,
+        "strokeId": stroke_id,
+        "ts": ts,
+        "value": json.dumps(stroke),  # Store full stroke object for recovery
+        "undone": True
+    }
 
-        ts = int(time.time() * 1000)
-        marker_rec = {
-            "type": "undo_marker",
-            "roomId": roomId,
-            "user": user_id,
-            "strokeId": stroke_id,
-            "ts": ts,
-            "value": json.dumps(stroke),  # Store full stroke object for recovery
-            "undone": True
-        }
-        
-        logger.info("Attempting to persist undo marker via GraphQL.")
-        try:
-            marker_asset = {"data": marker_rec}
-            payload = {
-                "operation": "CREATE", "amount": 1,
-                "signerPublicKey": SIGNER_PUBLIC_KEY, "signerPrivateKey": SIGNER_PRIVATE_KEY,
-                "recipientPublicKey": RECIPIENT_PUBLIC_KEY,
-                "asset": marker_asset
-            }
-            strokes_coll.insert_one({"asset": marker_asset})
-            
-            # Non-blocking GraphQL commit with retry queue 
-            try:
-                txn_id = commit_transaction_via_graphql(payload)
-                logger.info(f"ResilientDB commit SUCCESS for undo marker (stroke {stroke_id}): txn_id={txn_id}")
-            except Exception as e:
-                logger.error(f"ResilientDB commit FAILED for undo marker (stroke {stroke_id}): {str(e)}")
-                # Queue for retry - undo operation continues successfully
-                marker_id = f"undo_marker_{stroke_id}_{ts}"
-                add_to_retry_queue(marker_id, marker_rec)
-                logger.info(f"Added undo marker for stroke {stroke_id} to retry queue for later sync")
-            
-            logger.info("Successfully processed undo marker.")
-        except Exception as e:
-            logger.exception("Failed to process undo marker (non-GraphQL error)")
-            redis_client.lpush(f"{key_base}:undo", last_raw)
-            redis_client.lrem(f"{key_base}:redo", 1, last_raw)
-            redis_client.srem(f"{key_base}:undone_strokes", stroke_id)
-            return jsonify({"status":"error", "message":"Failed to persist undo action"}), 500
+    # Written only once the Redis side has landed. If the insert fails the
+    # ledger commit below still carries the marker and the sync mirror
+    # stores it in Mongo.
+    try:
+        strokes_coll.insert_one({"asset": {"data": marker_rec}})
+    except Exception:
+        logger.exception("Failed to persist undo marker")
 
-        push_to_room(roomId, "stroke_undone", {
-            "roomId": roomId,
-            "strokeId": stroke_id,
-            "user": claims.get("username", "unknown"),
-            "timestamp": ts
-        })
-        logger.info("Broadcasted stroke_undone event.")
-        return jsonify({"status":"ok", "undone_stroke_id": stroke_id})
+    enqueue_commit(f"undo_marker_{stroke_id}_{ts}", marker_rec, roomId)
 
-    except Exception as e:
-        logger.exception("An error occurred during room_undo")
-        if last_raw:
-            redis_client.lpush(f"{key_base}:undo", last_raw)
-        return jsonify({"status":"error","message":f"Failed to undo: {str(e)}"}), 500
+    push_to_room(roomId, "stroke_undone", {
+        "roomId": roomId,
+        "strokeId": stroke_id,
+        "user": claims.get("username", "unknown"),
+        "timestamp": ts
+    })
+    logger.info("Broadcasted stroke_undone event.")
+    return jsonify({"status":"ok", "undone_stroke_id": stroke_id})
 
 @rooms_bp.route("/rooms/<roomId>/undo_redo_status", methods=["GET"])
 @require_auth
@@ -2003,31 +2066,17 @@ def mark_strokes_undone(roomId):
                 
                 try:
                     marker_asset = {"data": marker_rec}
-                    payload = {
-                        "operation": "CREATE", "amount": 1,
-                        "signerPublicKey": SIGNER_PUBLIC_KEY, 
-                        "signerPrivateKey": SIGNER_PRIVATE_KEY,
-                        "recipientPublicKey": RECIPIENT_PUBLIC_KEY,
-                        "asset": marker_asset
-                    }
                     strokes_coll.insert_one({"asset": marker_asset})
-                    
-                    # Non-blocking GraphQL commit with retry queue 
-                    try:
-                        txn_id = commit_transaction_via_graphql(payload)
-                        logger.info(f"ResilientDB commit SUCCESS for mark_undone marker (stroke {stroke_id}): txn_id={txn_id}")
-                    except Exception as e:
-                        logger.error(f"ResilientDB commit FAILED for mark_undone marker (stroke {stroke_id}): {str(e)}")
-                        # Queue for retry - mark_undone operation continues successfully
-                        marker_id = f"mark_undone_marker_{stroke_id}_{ts}"
-                        add_to_retry_queue(marker_id, marker_rec)
-                        logger.info(f"Added mark_undone marker for stroke {stroke_id} to retry queue for later sync")
-                    
+                    enqueue_commit(f"mark_undone_marker_{stroke_id}_{ts}", marker_rec, roomId)
                     logger.info(f"Persisted undo marker for stroke {stroke_id}")
                 except Exception as e:
                     logger.exception(f"Failed to persist undo marker for stroke {stroke_id}: {e}")
                     # Continue with other strokes even if one fails
         
+        if marked_count:
+            record_undo(roomId, stroke_ids, int(time.time() * 1000))
+            invalidate_snapshot(roomId)
+
         # Broadcast event to other users
         push_to_room(roomId, "strokes_marked_undone", {
             "roomId": roomId,
@@ -2071,90 +2120,39 @@ def room_redo(roomId):
     
     key_base = f"room:{roomId}:{user_id}"
 
-    last_raw = redis_client.lpop(f"{key_base}:redo")
-    if not last_raw: return jsonify({"status":"noop"})
-    
+    ts = int(time.time() * 1000)
     try:
-        stroke = json.loads(last_raw)
-        stroke_id = stroke.get("id") or stroke.get("drawingId")
-        if not stroke_id:
-            raise ValueError("Stroke ID missing")
+        moved = _move_stack_entry(roomId, key_base, ts, undo=False)
+    except Exception as e:
+        return jsonify({"status":"error","message":f"Failed to redo: {str(e)}"}), 500
+    if not moved: return jsonify({"status":"noop"})
 
-        path_data = stroke.get("pathData")
-        is_cut_record = (isinstance(path_data, dict) and 
-                        path_data.get("tool") == "cut" and 
-                        path_data.get("cut") == True)
-        
-        if is_cut_record:
-            original_stroke_ids = path_data.get("originalStrokeIds") or []
-            replacement_segment_ids = path_data.get("replacementSegmentIds") or []
-            cut_set_key = f"cut-stroke-ids:{roomId}"
-            
-            if original_stroke_ids:
-                redis_client.sadd(cut_set_key, *[str(orig_id) for orig_id in original_stroke_ids])
-                logger.info(f"Added {len(original_stroke_ids)} stroke IDs back to cut set during redo")
-            
-            if replacement_segment_ids:
-                for rep_id in replacement_segment_ids:
-                    redis_client.srem(cut_set_key, str(rep_id))
-                logger.info(f"Removed {len(replacement_segment_ids)} replacement segment IDs from cut set during redo")
+    _, stroke, stroke_id = moved
+    marker_rec = {
+        "type": "redo_marker",
+        "roomId": roomId,
+        "user": user_id,
+        "strokeId": stroke_id,
+        "ts": ts,
+        "value": json.dumps(stroke),  # Store full stroke object for recovery
+        "undone": False
+    }
 
-        redis_client.lpush(f"{key_base}:undo", last_raw)
-        
-        redis_client.srem(f"{key_base}:undone_strokes", stroke_id)
+    try:
+        strokes_coll.insert_one({"asset": {"data": marker_rec}})
+    except Exception:
+        logger.exception("Failed to persist redo marker")
 
-        ts = int(time.time() * 1000)
-        marker_rec = {
-            "type": "redo_marker",
-            "roomId": roomId,
-            "user": user_id,
-            "strokeId": stroke_id,
-            "ts": ts,
-            "value": json.dumps(stroke),  # Store full stroke object for recovery
-            "undone": False
-        }
-        
-        try:
-            payload = {
-                "operation": "CREATE", "amount": 1,
-                "signerPublicKey": SIGNER_PUBLIC_KEY, "signerPrivateKey": SIGNER_PRIVATE_KEY,
-                "recipientPublicKey": RECIPIENT_PUBLIC_KEY,
-                "asset": {"data": marker_rec}
-            }
-            strokes_coll.insert_one({"asset": {"data": marker_rec}})
-            
-            # Non-blocking GraphQL commit with retry queue 
-            try:
-                txn_id = commit_transaction_via_graphql(payload)
-                logger.info(f"ResilientDB commit SUCCESS for redo marker (stroke {stroke_id}): txn_id={txn_id}")
-            except Exception as e:
-                logger.error(f"ResilientDB commit FAILED for redo marker (stroke {stroke_id}): {str(e)}")
-                # Queue for retry - redo operation continues successfully
-                marker_id = f"redo_marker_{stroke_id}_{ts}"
-                add_to_retry_queue(marker_id, marker_rec)
-                logger.info(f"Added redo marker for stroke {stroke_id} to retry queue for later sync")
-            
-            logger.info("Successfully processed redo marker.")
-        except Exception:
-            logger.exception("Failed to process redo marker (non-GraphQL error)")
-            redis_client.lpop(f"{key_base}:undo")
-            redis_client.rpush(f"{key_base}:redo", last_raw)
-            redis_client.sadd(f"{key_base}:undone_strokes", stroke_id)
-            return jsonify({"status":"error", "message":"Failed to persist redo action"}), 500
+    enqueue_commit(f"redo_marker_{stroke_id}_{ts}", marker_rec, roomId)
 
-        push_to_room(roomId, "stroke_redone", {
-            "roomId": roomId,
-            "stroke": stroke,
-            "user": claims.get("username", "unknown"),
-            "timestamp": ts
-        })
-        
-        return jsonify({"status":"ok", "redone_stroke": stroke})
-        
-    except Exception as e:
-        if last_raw:
-            redis_client.lpush(f"{key_base}:redo", last_raw)
-        return jsonify({"status":"error","message":f"Failed to redo: {str(e)}"}), 500
+    push_to_room(roomId, "stroke_redone", {
+        "roomId": roomId,
+        "stroke": stroke,
+        "user": claims.get("username", "unknown"),
+        "timestamp": ts
+    })
+
+    return jsonify({"status":"ok", "redone_stroke": stroke})
 
 @rooms_bp.route("/rooms/<roomId>/reset_my_stacks", methods=["POST"])
 @require_auth
@@ -2186,6 +2184,7 @@ def reset_my_stacks(roomId):
     except Exception:
         logger.exception("Failed to reset user stacks for room %s user %s", roomId, user_id)
         return jsonify({"status":"error","message":"Failed to reset stacks"}), 500
+    invalidate_snapshot(roomId)
     return jsonify({"status":"ok"})
 
 @rooms_bp.route("/rooms/<roomId>/clear", methods=["POST"])
@@ -2264,29 +2263,13 @@ def room_clear(roomId):
     }
     try:
         strokes_coll.insert_one({"asset": {"data": marker_rec}})
-
-        payload = {
-            "operation": "CREATE",
-            "amount": 1,
-            "signerPublicKey": SIGNER_PUBLIC_KEY,
-            "signerPrivateKey": SIGNER_PRIVATE_KEY,
-            "recipientPublicKey": RECIPIENT_PUBLIC_KEY,
-            "asset": {"data": marker_rec}
-        }
-        
-        # Non-blocking GraphQL commit with retry queue 
-        try:
-            txn_id = commit_transaction_via_graphql(payload)
-            logger.info(f"ResilientDB commit SUCCESS for clear marker (room {roomId}): txn_id={txn_id}")
-        except Exception as e:
-            logger.error(f"ResilientDB commit FAILED for clear marker (room {roomId}): {str(e)}")
-            # Queue for retry - clear operation continues successfully
-            marker_id = f"clear_marker_{roomId}_{cleared_at}"
-            add_to_retry_queue(marker_id, marker_rec)
-            logger.info(f"Added clear marker for room {roomId} to retry queue for later sync")
+        enqueue_commit(f"clear_marker_{roomId}_{cleared_at}", marker_rec, roomId)
     except Exception:
         logger.exception("Failed to persist clear marker")
 
+    invalidate_snapshot(roomId)
+    bump_room_state(roomId)
+
     try:
         push_to_room(roomId, "canvas_cleared", {
             "roomId": roomId,
@@ -2674,6 +2657,9 @@ def update_room(roomId):
         return jsonify({"status":"error","message":"No valid fields to update"}), 400
     updates["updatedAt"] = datetime.utcnow()
     rooms_coll.update_one({"_id": ObjectId(roomId)}, {"$set": updates})
+    if "type" in updates and updates["type"] != room.get("type"):
+        # Stroke encoding may have changed; rebuild the projection on next read
+        reset_room_index(str(room["_id"]), room["_id"])
     
     # Note: Owners do NOT have share records in shares_coll, even for private/secure rooms
     # The owner is identified by room.ownerId field only
@@ -2901,6 +2887,22 @@ def delete_room(roomId):
     except Exception:
         logger.exception("Failed to delete strokes for room %s", rid)
 
+    reset_room_index(rid)
+    delete_snapshot(rid)
+    bump_room_state(rid)
+    try:
+        drop_undone_index(rid)
+    except Exception:
+        logger.exception("Failed to drop undone index for room %s", rid)
+    try:
+        drop_room_cache(rid)
+    except Exception:
+        logger.exception("Failed to drop stroke cache for room %s", rid)
+    try:
+        drop_draw_index(rid)
+    except Exception:
+        logger.exception("Failed to drop draw key index for room %s", rid)
+
     try:
         shares_coll.delete_many({"roomId": rid})
     except Exception:
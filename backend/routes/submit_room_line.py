@@ -1,16 +1,19 @@
 from flask import Blueprint, request, jsonify
 import json, time, traceback, logging, jwt
-from datetime import datetime
 import os
 from bson import ObjectId
-from services.graphql_service import commit_transaction_via_graphql
+from services.commit_outbox import enqueue_commit
 from services.db import redis_client, strokes_coll, rooms_coll, shares_coll
 from services.socketio_service import push_to_room
 from services.analytics_service import ingest_event
 from services.canvas_counter import get_canvas_draw_count, increment_canvas_draw_count
+from services.room_draw_index import index_draw_key
 from services.crypto_service import unwrap_room_key, encrypt_for_room, wrap_room_key
+from services.stroke_index import index_stroke
+from services.room_snapshot import invalidate_snapshot
+from services.room_activity import touch_room
 import nacl.signing, nacl.encoding
-from config import SIGNER_PUBLIC_KEY, SIGNER_PRIVATE_KEY, RECIPIENT_PUBLIC_KEY, JWT_SECRET, RATE_LIMIT_STROKE_MINUTE
+from config import JWT_SECRET, RATE_LIMIT_STROKE_MINUTE
 from cryptography.exceptions import InvalidTag
 from middleware.rate_limit import limiter, user_rate_limit
 
@@ -137,6 +140,7 @@ def submit_room_line():
             "roomId": roomId,
         }
         redis_client.set(stroke_id, json.dumps(cache_entry))
+        index_draw_key(roomId, stroke_id)
 
         try:
             parsed = data.get('value')
@@ -147,6 +151,8 @@ def submit_room_line():
                 if origs:
                     cut_set_key = f"cut-stroke-ids:{roomId}" if roomId else "cut-stroke-ids"
                     redis_client.sadd(cut_set_key, *[str(o) for o in origs])
+                    if roomId:
+                        invalidate_snapshot(roomId)
         except Exception as _e:
             logger.warning(f"submit_room_line: failed to update cut-stroke-ids: {_e}")
 
@@ -167,6 +173,7 @@ def submit_room_line():
                 'blob': enc,
                 'type': room_type
             })
+            index_stroke(roomId, drawing, blob=enc)
 
             try:
                 ingest_event({
@@ -184,7 +191,7 @@ def submit_room_line():
 
             # Update room's updatedAt so the Dashboard's "Last edited" reflects drawing activity
             try:
-                rooms_coll.update_one({'_id': room['_id']}, {'$set': {'updatedAt': datetime.utcnow()}})
+                touch_room(room['_id'])
             except Exception:
                 logger.exception('Failed to update room updatedAt after inserting encrypted stroke')
 
@@ -204,6 +211,7 @@ def submit_room_line():
                 'stroke': drawing,
                 'type': 'public'
             })
+            index_stroke(roomId, drawing)
 
             try:
                 ingest_event({
@@ -220,7 +228,7 @@ def submit_room_line():
                 pass
 
             try:
-                rooms_coll.update_one({'_id': room['_id']}, {'$set': {'updatedAt': datetime.utcnow()}})
+                touch_room(room['_id'])
             except Exception:
                 logger.exception('Failed to update room updatedAt after inserting public stroke')
             asset_data = {
@@ -232,15 +240,7 @@ def submit_room_line():
                 'value': json.dumps(drawing)
             }
 
-        prep = {
-            'operation': 'CREATE',
-            'amount': 1,
-            'signerPublicKey': SIGNER_PUBLIC_KEY,
-            'signerPrivateKey': SIGNER_PRIVATE_KEY,
-            'recipientPublicKey': RECIPIENT_PUBLIC_KEY,
-            'asset': {'data': asset_data}
-        }
-        commit_transaction_via_graphql(prep)
+        enqueue_commit(drawing['id'], asset_data, roomId)
 
         key_base = f"{roomId}:{user}"
         redis_client.lpush(f"{key_base}:undo", json.dumps(drawing))
@@ -6,6 +6,7 @@ import logging
 import uuid
 from services.db import redis_client
 from services.graphql_service import commit_transaction_via_graphql
+from services.room_state import bump_room_state
 from config import *
 from middleware.rate_limit import limiter
 
@@ -123,6 +124,8 @@ def undo():
                 pass
         except Exception:
             logger.exception("Failed to set undo marker for %s", stroke_id)
+        # undo-*/redo-* markers are global, so every room's cached state is stale
+        bump_room_state()
 
         _persist_undo_state(stroke_obj, undone=True, ts=ts, marker_id=undo_marker_key)
 
@@ -177,6 +180,7 @@ def redo():
                 pass
         except Exception:
             logger.exception("Failed to set redo marker for %s", stroke_id)
+        bump_room_state()
 
         _persist_undo_state(stroke_obj, undone=False, ts=ts, marker_id=redo_marker_key)
 
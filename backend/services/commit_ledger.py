@@ -0,0 +1,130 @@
+# services/commit_ledger.py
+"""
+Ledger of ResilientDB commits: stroke (or marker) id -> txn id.
+
+A commit can land on ResilientDB even when the client sees a failure (a
+read timeout after the node accepted the write), and the retry queue then
+submits the same stroke again. Every submit path now checks this ledger
+first: the commit outbox and the retry drain skip ids that are already
+recorded, and add_to_retry_queue() does not queue them. Successful commits
+are recorded by whoever made them, and the sync mirror records every id it
+sees in a mirrored block, which also catches commits whose response was
+lost. The outbox stamps its id into every asset as COMMIT_ID_FIELD, so the
+mirror keys the ledger on the same id the submit paths look up.
+
+Entries live in one Redis hash per UTC day (``resilientdb:committed:<day>``)
+that expires after LEDGER_RETENTION_DAYS, long enough to cover the retry
+queue's own retention. Lookups read all live buckets in one pipeline. A
+lookup that fails returns nothing, so Redis trouble can cause a duplicate
+commit but never a lost one.
+"""
+
+import json
+import time
+import logging
+
+from services.db import redis_client
+
+logger = logging.getLogger(__name__)
+
+LEDGER_KEY_PREFIX = "resilientdb:committed"
+LEDGER_RETENTION_DAYS = 8
+COMMIT_ID_FIELD = "commitId"
+
+
+def _day(ts=None):
+    return int((time.time() if ts is None else ts) // 86400)
+
+
+def _bucket(day):
+    return f"{LEDGER_KEY_PREFIX}:{day}"
+
+
+def _decode(v):
+    return v.decode("utf-8") if isinstance(v, (bytes, bytearray)) else v
+
+
+def record_commits(mapping, pipe=None):
+    """Record ``{id: txn_id}``. Never raises."""
+    mapping = {str(k): str(v) for k, v in (mapping or {}).items() if k and v}
+    if not mapping:
+        return 0
+    try:
+        own_pipe = pipe is None
+        if own_pipe:
+            pipe = redis_client.pipeline(transaction=False)
+        key = _bucket(_day())
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, LEDGER_RETENTION_DAYS * 86400)
+        if own_pipe:
+            pipe.execute()
+        return len(mapping)
+    except Exception as e:
+        logger.warning(f"commit_ledger: failed to record {len(mapping)} commits: {e}")
+        return 0
+
+
+def record_commit(item_id, txn_id):
+    return record_commits({item_id: txn_id})
+
+
+def committed_txns(ids):
+    """Return ``{id: txn_id}`` for the ids already committed."""
+    ids = [str(i) for i in ids or [] if i]
+    if not ids:
+        return {}
+    try:
+        today = _day()
+        pipe = redis_client.pipeline(transaction=False)
+        for day in range(today, today - LEDGER_RETENTION_DAYS, -1):
+            pipe.hmget(_bucket(day), ids)
+        found = {}
+        for values in pipe.execute():
+            for item_id, txn_id in zip(ids, values or []):
+                if txn_id is not None and item_id not in found:
+                    found[item_id] = _decode(txn_id)
+        return found
+    except Exception as e:
+        logger.warning(f"commit_ledger: lookup failed, treating {len(ids)} ids as uncommitted: {e}")
+        return {}
+
+
+def committed_txn(item_id):
+    return committed_txns([item_id]).get(str(item_id))
+
+
+def record_new_commits(mapping):
+    """record_commits() for the ids not in the ledger yet; the first txn id recorded wins."""
+    known = committed_txns(list(mapping or {}))
+    return record_commits({k: v for k, v in (mapping or {}).items() if str(k) not in known})
+
+
+def _asset_id(asset_data):
+    if asset_data.get(COMMIT_ID_FIELD):
+        return asset_data[COMMIT_ID_FIELD]
+    # Assets committed before the outbox stamped its id
+    stroke = asset_data.get("stroke")
+    if isinstance(stroke, dict):
+        return stroke.get("id") or stroke.get("drawingId")
+    return asset_data.get("id")
+
+
+def record_mirrored_blocks(blocks):
+    """
+    Sync mirror handler: record the outbox id of every asset in mirrored
+    blocks. Older encrypted strokes carry no plaintext id; stroke_index
+    records those once it has decrypted them.
+    """
+    mapping = {}
+    for block in blocks or []:
+        for txn in block.get("transactions") or []:
+            try:
+                value = txn.get("value")
+                if isinstance(value, str):
+                    value = json.loads(value)
+                item_id = _asset_id(value["asset"]["data"])
+                if item_id and txn.get("id"):
+                    mapping.setdefault(item_id, txn["id"])
+            except Exception:
+                continue
+    return record_new_commits(mapping)
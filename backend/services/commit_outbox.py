@@ -0,0 +1,306 @@
+# services/commit_outbox.py
+"""
+Durable outbox for ResilientDB commits.
+
+Request handlers used to call commit_transaction_via_graphql() inline, so a
+stroke request took as long as ResilientDB did and a hung GraphQL node held
+the request thread. Handlers now call enqueue_commit(), a single XADD to the
+Redis stream OUTBOX_STREAM, and return once the stroke is in Mongo and
+Redis. A pool of commit workers in each process reads the stream through
+the consumer group OUTBOX_GROUP and commits each entry. When a commit lands,
+the ledger txn id is pushed to the room as ``resilientdb_committed``.
+
+Each worker commits what it read in one round trip: entries are coalesced
+up to OUTBOX_BATCH_SIZE, waiting at most OUTBOX_LINGER_MS for a partial
+batch to fill, and posted as one multi-mutation GraphQL document
+(commit_transactions_batch_via_graphql). Results come back per alias, so
+each stroke is still notified or retried on its own.
+
+Ids already in the commit ledger (services.commit_ledger) are acked without
+being resubmitted, and every successful commit is recorded there.
+
+Failed commits are handed to the existing retry queue
+(services.graphql_retry_queue) and acked, so there is still one place that
+retries with backoff. A commit whose outcome is unknown (the request timed
+out or the reply was lost) is queued with UNKNOWN_OUTCOME_RECHECK_SECONDS of
+delay, so the ledger is consulted again only after the mirror caught up.
+Entries whose worker died before acking stay in the group's pending list and
+are claimed again after OUTBOX_CLAIM_IDLE_MS.
+"""
+
+import os
+import json
+import socket
+import threading
+import logging
+
+from services.db import redis_client
+from services.graphql_service import (
+    commit_transaction_via_graphql, commit_transactions_batch_via_graphql, graphql_circuit_open,
+    CommitOutcomeUnknown
+)
+from services.graphql_retry_queue import add_to_retry_queue, UNKNOWN_OUTCOME_RECHECK_SECONDS
+from services.commit_ledger import committed_txns, record_commits, COMMIT_ID_FIELD
+from config import SIGNER_PUBLIC_KEY, SIGNER_PRIVATE_KEY, RECIPIENT_PUBLIC_KEY
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_STREAM = "resilientdb:outbox"
+OUTBOX_GROUP = "committers"
+OUTBOX_WORKERS = int(os.getenv("RESDB_COMMIT_WORKERS", "4"))
+OUTBOX_BATCH_SIZE = int(os.getenv("RESDB_COMMIT_BATCH_SIZE", "25"))
+OUTBOX_LINGER_MS = int(os.getenv("RESDB_COMMIT_LINGER_MS", "20"))
+OUTBOX_BLOCK_MS = 2000
+OUTBOX_CLAIM_IDLE_MS = 60000
+COMMITTED_EVENT = "resilientdb_committed"
+
+_workers = []
+_stop_event = threading.Event()
+
+
+def _prepare(asset_data):
+    return {
+        "operation": "CREATE",
+        "amount": 1,
+        "signerPublicKey": SIGNER_PUBLIC_KEY,
+        "signerPrivateKey": SIGNER_PRIVATE_KEY,
+        "recipientPublicKey": RECIPIENT_PUBLIC_KEY,
+        "asset": {"data": asset_data}
+    }
+
+
+def _fields(item_id, asset_data, room_id):
+    return {
+        "id": str(item_id),
+        "asset": json.dumps(asset_data, separators=(",", ":"), default=str),
+        "roomId": room_id or "",
+    }
+
+
+def _stamped(item_id, asset_data):
+    """``asset_data`` carrying ``item_id``, so the mirror records the same id in the ledger."""
+    return {**asset_data, COMMIT_ID_FIELD: str(item_id)}
+
+
+def enqueue_commit(item_id, asset_data, room_id=None):
+    """
+    Queue ``asset_data`` for commit to ResilientDB. O(1) and never raises:
+    if the outbox is unreachable, or the GraphQL circuit is open, the item
+    goes to the retry queue instead.
+    """
+    asset_data = _stamped(item_id, asset_data)
+    if graphql_circuit_open():
+        add_to_retry_queue(str(item_id), asset_data)
+        return
+    try:
+        redis_client.xadd(OUTBOX_STREAM, _fields(item_id, asset_data, room_id))
+    except Exception as e:
+        logger.error(f"commit_outbox: enqueue failed for {item_id}, using retry queue: {e}")
+        add_to_retry_queue(str(item_id), asset_data)
+
+
+def enqueue_commits(items, room_id=None):
+    """
+    Queue many ``(item_id, asset_data)`` pairs with one pipelined round
+    trip. Same fallbacks as enqueue_commit(); never raises.
+    """
+    items = [(item_id, _stamped(item_id, asset_data)) for item_id, asset_data in items]
+    if not items:
+        return
+    if graphql_circuit_open():
+        for item_id, asset_data in items:
+            add_to_retry_queue(str(item_id), asset_data)
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for item_id, asset_data in items:
+            pipe.xadd(OUTBOX_STREAM, _fields(item_id, asset_data, room_id))
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"commit_outbox: batch enqueue of {len(items)} items failed, using retry queue: {e}")
+        for item_id, asset_data in items:
+            add_to_retry_queue(str(item_id), asset_data)
+
+
+def _ensure_group():
+    try:
+        redis_client.xgroup_create(OUTBOX_STREAM, OUTBOX_GROUP, id="0", mkstream=True)
+    except Exception as e:
+        # BUSYGROUP: another process created it first
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _decode(v):
+    return v.decode("utf-8") if isinstance(v, (bytes, bytearray)) else v
+
+
+def _notify(room_id, item_id, txn_id):
+    if not room_id:
+        return
+    try:
+        from services.socketio_service import push_to_room
+        push_to_room(room_id, COMMITTED_EVENT, {"roomId": room_id, "id": item_id, "txnId": txn_id})
+    except Exception:
+        logger.debug("commit_outbox: failed to push commit notice for %s", item_id)
+
+
+def _parse_entry(entry_id, fields):
+    fields = {_decode(k): _decode(v) for k, v in (fields or {}).items()}
+    try:
+        asset_data = json.loads(fields.get("asset") or "null")
+    except ValueError:
+        asset_data = None
+    item_id = fields.get("id")
+    if not item_id or not isinstance(asset_data, dict):
+        logger.warning(f"commit_outbox: dropping malformed entry {entry_id}")
+        return None
+    return item_id, asset_data, fields.get("roomId") or None
+
+
+def _commit_all(items):
+    """Commit parsed items; one request for a single item, one aliased document otherwise."""
+    if len(items) == 1:
+        try:
+            return [commit_transaction_via_graphql(_prepare(items[0][1]))]
+        except Exception as e:
+            return [e]
+    return commit_transactions_batch_via_graphql([_prepare(asset_data) for _, asset_data, _ in items])
+
+
+def process_entries(entries):
+    """
+    Commit a batch of outbox entries in one GraphQL round trip, then ack
+    them all. Returns one bool per entry: True on a ledger commit.
+    """
+    parsed = [_parse_entry(entry_id, fields) for entry_id, fields in entries]
+    items = [p for p in parsed if p is not None]
+    # Redelivered or reclaimed entries whose commit already landed are not resubmitted
+    known = committed_txns([item_id for item_id, _, _ in items]) if items else {}
+    to_commit = [p for p in items if p[0] not in known]
+    results = iter(_commit_all(to_commit) if to_commit else [])
+
+    committed = []
+    new_commits = {}
+    for p in parsed:
+        if p is None:
+            committed.append(False)
+            continue
+        item_id, asset_data, room_id = p
+        if item_id in known:
+            logger.info(f"ResilientDB commit SKIPPED for {item_id}: already committed as txn_id={known[item_id]}")
+            _notify(room_id, item_id, known[item_id])
+            committed.append(True)
+            continue
+        result = next(results)
+        if isinstance(result, CommitOutcomeUnknown):
+            # May have landed: the retry checks the ledger before resubmitting
+            logger.warning(f"ResilientDB commit UNKNOWN for {item_id}: {str(result)}")
+            add_to_retry_queue(item_id, asset_data, delay_seconds=UNKNOWN_OUTCOME_RECHECK_SECONDS)
+            committed.append(False)
+        elif isinstance(result, Exception):
+            logger.error(f"ResilientDB commit FAILED for {item_id}: {str(result)}")
+            add_to_retry_queue(item_id, asset_data)
+            committed.append(False)
+        else:
+            logger.info(f"ResilientDB commit SUCCESS for {item_id}: txn_id={result}")
+            _notify(room_id, item_id, result)
+            new_commits[item_id] = result
+            committed.append(True)
+
+    pipe = redis_client.pipeline(transaction=False)
+    record_commits(new_commits, pipe=pipe)
+    for entry_id, _ in entries:
+        pipe.xack(OUTBOX_STREAM, OUTBOX_GROUP, entry_id)
+        pipe.xdel(OUTBOX_STREAM, entry_id)
+    pipe.execute()
+    return committed
+
+
+def process_entry(entry_id, fields):
+    """Commit one outbox entry, then ack it. Returns True on a ledger commit."""
+    return process_entries([(entry_id, fields)])[0]
+
+
+def _read_batch(consumer):
+    resp = redis_client.xreadgroup(OUTBOX_GROUP, consumer, {OUTBOX_STREAM: ">"},
+                                   count=OUTBOX_BATCH_SIZE, block=OUTBOX_BLOCK_MS)
+    entries = resp[0][1] if resp else []
+    if entries and len(entries) < OUTBOX_BATCH_SIZE and OUTBOX_LINGER_MS > 0:
+        # Give a partial batch one short window to fill before committing
+        _stop_event.wait(OUTBOX_LINGER_MS / 1000.0)
+        resp = redis_client.xreadgroup(OUTBOX_GROUP, consumer, {OUTBOX_STREAM: ">"},
+                                       count=OUTBOX_BATCH_SIZE - len(entries))
+        entries += resp[0][1] if resp else []
+    return entries
+
+
+def _claim_stale(consumer):
+    try:
+        resp = redis_client.xautoclaim(OUTBOX_STREAM, OUTBOX_GROUP, consumer, OUTBOX_CLAIM_IDLE_MS,
+                                       start_id="0-0", count=OUTBOX_BATCH_SIZE)
+        return resp[1] if resp and len(resp) > 1 else []
+    except Exception as e:
+        logger.debug(f"commit_outbox: stale claim failed: {e}")
+        return []
+
+
+def _worker_loop(consumer):
+    logger.info(f"ResilientDB commit worker {consumer} started")
+    idle_rounds = 0
+    while not _stop_event.is_set():
+        try:
+            entries = []
+            # Cheap housekeeping when the stream is quiet
+            if idle_rounds % 15 == 0:
+                entries = _claim_stale(consumer)
+            if not entries:
+                entries = _read_batch(consumer)
+            idle_rounds = 0 if entries else idle_rounds + 1
+            # Deleted entries come back from a claim with no fields
+            entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+            if entries:
+                process_entries(entries)
+        except Exception as e:
+            logger.error(f"commit_outbox: worker {consumer} iteration failed: {e}")
+            if "NOGROUP" in str(e):
+                try:
+                    _ensure_group()
+                except Exception:
+                    pass
+            _stop_event.wait(2)
+    logger.info(f"ResilientDB commit worker {consumer} stopped")
+
+
+def start_commit_workers(count=OUTBOX_WORKERS):
+    """Start the commit worker pool. Called when the Flask app starts."""
+    if any(t.is_alive() for t in _workers):
+        logger.warning("Commit workers already running")
+        return
+    try:
+        _ensure_group()
+    except Exception:
+        logger.exception("commit_outbox: could not create consumer group; workers will retry")
+    _stop_event.clear()
+    _workers.clear()
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    for i in range(max(1, count)):
+        t = threading.Thread(target=_worker_loop, args=(f"{prefix}-{i}",), name=f"ResDBCommitWorker-{i}", daemon=True)
+        t.start()
+        _workers.append(t)
+    logger.info(f"Started {len(_workers)} ResilientDB commit workers")
+
+
+def stop_commit_workers():
+    """Stop the commit worker pool. Un-acked entries are reclaimed later."""
+    _stop_event.set()
+    for t in _workers:
+        t.join(timeout=OUTBOX_BLOCK_MS / 1000.0 + 3)
+    _workers.clear()
+
+
+def get_outbox_size():
+    try:
+        return redis_client.xlen(OUTBOX_STREAM)
+    except Exception:
+        return 0
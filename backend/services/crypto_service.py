@@ -14,14 +14,38 @@ This file exposes:
  - unwrap_room_key(wrapped: dict) -> bytes
  - encrypt_for_room(room_key: bytes, plaintext: bytes) -> {'nonce','ct'}
  - decrypt_for_room(room_key: bytes, bundle: dict) -> bytes
+ - clear_room_key_cache() -> None
+ - encrypt_stroke(room_key: bytes, stroke: dict) -> {'nonce','ct'} | bson Binary envelope
+ - decrypt_stroke(room_key: bytes, bundle) -> dict
+ - bundle_for_json(bundle) -> JSON-safe form of a bundle
+
+Unwrapped room keys and their AESGCM instances are kept in small in-process
+LRU caches with a TTL, so hot rooms unwrap once instead of once per stroke.
+Entries are keyed by the wrapped ciphertext (resp. the raw key), so a
+re-wrapped room simply misses; clear_room_key_cache() drops everything and
+is called on master-key rotation.
+
+Stroke blobs come in two formats. The original bundle is
+``{"nonce": b64, "ct": b64}`` around ``json.dumps(stroke)``. The binary
+envelope (opt-in with BINARY_STROKE_BLOBS=True) is one BSON Binary holding
+``0x01 || nonce || ct`` around a services.stroke_codec plaintext, with no
+base64 or JSON text pass. Where a blob has to travel as JSON (ResilientDB
+assets) the envelope is carried as ``{"env": b64}``. Every reader accepts all
+three forms, and decrypt_for_room() hands legacy callers JSON bytes either
+way.
 """
 import os
+import json
 import base64
 import logging
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone
 import hvac
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.exceptions import InvalidTag
+from bson.binary import Binary
 
 from services.db import redis_client, settings_coll
 
@@ -30,6 +54,54 @@ logger = logging.getLogger(__name__)
 _NONCE_BYTES = 12
 _SETTINGS_ID = "room_master_key_b64"
 
+BINARY_STROKE_BLOBS = os.getenv("BINARY_STROKE_BLOBS", "False") == "True"
+_ENVELOPE_V1 = b"\x01"
+
+ROOM_KEY_CACHE_SIZE = int(os.getenv("ROOM_KEY_CACHE_SIZE", "1024"))
+ROOM_KEY_CACHE_TTL_SECONDS = int(os.getenv("ROOM_KEY_CACHE_TTL_SECONDS", "900"))
+
+
+class _TTLCache:
+    """Thread-safe LRU with a per-entry TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_room_keys = _TTLCache(ROOM_KEY_CACHE_SIZE, ROOM_KEY_CACHE_TTL_SECONDS)  # (nonce, ct) -> room key
+_ciphers = _TTLCache(ROOM_KEY_CACHE_SIZE, ROOM_KEY_CACHE_TTL_SECONDS)    # room key -> AESGCM
+
+
+def clear_room_key_cache():
+    _room_keys.clear()
+    _ciphers.clear()
+
 def _b64e(b: bytes) -> str:
     return base64.b64encode(b).decode("utf-8")
 
@@ -211,26 +283,90 @@ def wrap_room_key(room_key: bytes) -> dict:
 def unwrap_room_key(wrapped: dict) -> bytes:
     if not isinstance(wrapped, dict) or "nonce" not in wrapped or "ct" not in wrapped:
         raise ValueError("wrapped must be a dict with 'nonce' and 'ct'")
-    nonce = _b64d(wrapped["nonce"])
-    ct = _b64d(wrapped["ct"])
-    return _MASTER.decrypt(nonce, ct, None)  # may raise InvalidTag
+    cache_key = (wrapped["nonce"], wrapped["ct"])
+    room_key = _room_keys.get(cache_key)
+    if room_key is None:
+        nonce = _b64d(wrapped["nonce"])
+        ct = _b64d(wrapped["ct"])
+        room_key = _MASTER.decrypt(nonce, ct, None)  # may raise InvalidTag
+        _room_keys.put(cache_key, room_key)
+    return room_key
+
+def _cipher(room_key: bytes) -> AESGCM:
+    key = bytes(room_key)
+    aes = _ciphers.get(key)
+    if aes is None:
+        aes = AESGCM(key)
+        _ciphers.put(key, aes)
+    return aes
 
 def encrypt_for_room(room_key: bytes, plaintext: bytes) -> dict:
     if not isinstance(room_key, (bytes, bytearray)) or len(room_key) != 32:
         raise ValueError("room_key must be 32 bytes")
     if not isinstance(plaintext, (bytes, bytearray)):
         raise ValueError("plaintext must be bytes")
-    aes = AESGCM(room_key)
+    aes = _cipher(room_key)
     nonce = _rand()
     ct = aes.encrypt(nonce, plaintext, None)
     return {"nonce": _b64e(nonce), "ct": _b64e(ct)}
 
+def _envelope_bytes(bundle):
+    """Raw envelope bytes of a binary or ``{"env"}`` bundle, else None."""
+    if isinstance(bundle, (bytes, bytearray)):
+        return bytes(bundle)
+    if isinstance(bundle, dict) and isinstance(bundle.get("env"), str):
+        return _b64d(bundle["env"])
+    return None
+
+def _open_envelope(room_key: bytes, env: bytes) -> dict:
+    from services.stroke_codec import decode_stroke_bytes
+    if env[:1] != _ENVELOPE_V1 or len(env) < 1 + _NONCE_BYTES:
+        raise ValueError("unknown stroke envelope version")
+    nonce = env[1:1 + _NONCE_BYTES]
+    return decode_stroke_bytes(_cipher(room_key).decrypt(nonce, env[1 + _NONCE_BYTES:], None))
+
+def encrypt_stroke(room_key: bytes, stroke: dict, binary: "bool | None" = None):
+    """
+    Encrypt a stroke dict. Returns a binary envelope when ``binary`` (default
+    BINARY_STROKE_BLOBS), else the original ``{"nonce","ct"}`` JSON bundle.
+    """
+    if binary is None:
+        binary = BINARY_STROKE_BLOBS
+    if not binary:
+        return encrypt_for_room(room_key, json.dumps(stroke).encode())
+    if not isinstance(room_key, (bytes, bytearray)) or len(room_key) != 32:
+        raise ValueError("room_key must be 32 bytes")
+    from services.stroke_codec import encode_stroke
+    nonce = _rand()
+    ct = _cipher(room_key).encrypt(nonce, encode_stroke(stroke), None)
+    return Binary(_ENVELOPE_V1 + nonce + ct)
+
+def decrypt_stroke(room_key: bytes, bundle) -> dict:
+    """Decrypt any stroke blob format back to the stroke dict."""
+    env = _envelope_bytes(bundle)
+    if env is not None:
+        if not isinstance(room_key, (bytes, bytearray)) or len(room_key) != 32:
+            raise ValueError("room_key must be 32 bytes")
+        return _open_envelope(room_key, env)
+    return json.loads(decrypt_for_room(room_key, bundle))
+
+def bundle_for_json(bundle):
+    """JSON-safe form of a blob, for ResilientDB assets and other JSON transports."""
+    env = _envelope_bytes(bundle)
+    if env is not None and not isinstance(bundle, dict):
+        return {"env": _b64e(env)}
+    return bundle
+
 def decrypt_for_room(room_key: bytes, bundle: dict) -> bytes:
     if not isinstance(room_key, (bytes, bytearray)) or len(room_key) != 32:
         raise ValueError("room_key must be 32 bytes")
+    env = _envelope_bytes(bundle)
+    if env is not None:
+        # Binary envelopes carry BSON; older callers expect JSON text
+        return json.dumps(_open_envelope(room_key, env), default=str).encode("utf-8")
     if not isinstance(bundle, dict) or "nonce" not in bundle or "ct" not in bundle:
         raise ValueError("bundle must be a dict with 'nonce' and 'ct'")
-    aes = AESGCM(room_key)
+    aes = _cipher(room_key)
     nonce = _b64d(bundle["nonce"])
     ct = _b64d(bundle["ct"])
     return aes.decrypt(nonce, ct, None)
@@ -39,6 +39,10 @@ refresh_tokens_coll = mongo_client[DB_NAME]["refresh_tokens"]
 invites_coll = mongo_client[DB_NAME]["room_invites"]
 notifications_coll = mongo_client[DB_NAME]["notifications"]
 stamps_coll = mongo_client[DB_NAME]["stamps"]
+# Normalized per-room stroke projection (see services/stroke_index.py)
+stroke_index_coll = mongo_client[DB_NAME]["stroke_index"]
+# Resolved per-room visibility state (see services/room_snapshot.py)
+room_snapshots_coll = mongo_client[DB_NAME]["room_snapshots"]
 
 # Analytics collections
 try:
@@ -74,6 +78,11 @@ rooms_coll.create_index([("ownerId", 1), ("type", 1)])
 shares_coll.create_index([("roomId", 1), ("userId", 1)], unique=True)
 strokes_coll.create_index([("roomId", 1), ("ts", 1)])
 stamps_coll.create_index([("user_id", 1), ("deleted", 1)])
+stroke_index_coll.create_index([("roomId", 1), ("strokeId", 1)], unique=True)
+stroke_index_coll.create_index([("roomId", 1), ("ts", 1), ("strokeId", 1)])
+room_snapshots_coll.create_index("roomId", unique=True)
+# Undo/redo/clear markers are looked up per room by time for incremental sync
+strokes_coll.create_index([("asset.data.roomId", 1), ("asset.data.ts", 1)])
 
 def get_db():
     """Get database connection"""
@@ -10,39 +10,193 @@ Architecture:
 - Background worker retries periodically
 - Successful retries are removed from queue
 - Persistent across server restarts
+
+Storage:
+- RETRY_QUEUE_KEY: sorted set of stroke ids scored by next-attempt time
+  (epoch seconds)
+- RETRY_ITEMS_KEY: hash of stroke id -> item JSON (written once, never
+  re-serialized, so removal never depends on matching JSON bytes)
+- RETRY_ATTEMPTS_KEY: hash of stroke id -> failed attempts
+- RETRY_LEASES_KEY: hash of stroke id -> id of the worker holding it
+- ``{RETRY_QUEUE_KEY}:ids``: dedup set of queued stroke ids
+All state changes are Lua scripts. Claiming moves an item's score to a
+lease deadline (now + RETRY_CLAIM_LEASE_SECONDS) and records the claiming
+worker as its owner, so workers in any number of processes and app
+replicas never claim the same item. While a worker commits, a
+LeaseHeartbeat pushes the deadline out every RETRY_HEARTBEAT_SECONDS. Ack
+deletes the item; nack counts the attempt and reschedules it with backoff,
+but only while the caller is still the owner. Items whose worker died come
+due again once their lease runs out and go to whichever worker claims next.
+
+Draining:
+- A failed attempt pushes the item back by an exponential backoff
+  (RETRY_BACKOFF_BASE_SECONDS doubling per attempt, capped at
+  RETRY_BACKOFF_MAX_SECONDS, with jitter), so a drain only touches due items
+- process_retry_queue() commits claimed items in aliased GraphQL batches of
+  RETRY_COMMIT_BATCH, RETRY_CONCURRENCY requests at a time
+- drain_retry_queue() keeps calling it until nothing is due, sizing each round
+  with AdaptiveBatchSize from the success rate and request latency it observed
+- Ids already in the commit ledger (services.commit_ledger) are never queued
+  or resubmitted; successful retries are recorded there
 """
 
+import os
 import json
 import time
+import random
+import socket
 import logging
+import threading
 import redis.exceptions
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional
 from services.db import redis_client
-from services.graphql_service import commit_transaction_via_graphql
+from services.commit_ledger import committed_txn, committed_txns, record_commits
+from services.graphql_service import (
+    commit_transaction_via_graphql, commit_transactions_batch_via_graphql, graphql_circuit_open, CircuitOpenError,
+    CommitOutcomeUnknown
+)
 from config import SIGNER_PUBLIC_KEY, SIGNER_PRIVATE_KEY, RECIPIENT_PUBLIC_KEY
 
 logger = logging.getLogger(__name__)
 
 RETRY_QUEUE_KEY = "resilientdb:retry_queue"
+RETRY_ITEMS_KEY = "resilientdb:retry_items"
 RETRY_ATTEMPTS_KEY = "resilientdb:retry_attempts"
+RETRY_LEASES_KEY = "resilientdb:retry_leases"
+RETRY_DEDUP_KEY = f"{RETRY_QUEUE_KEY}:ids"
 MAX_RETRY_ATTEMPTS = 1000
 RETRY_EXPIRY_SECONDS = 7 * 24 * 3600  # Keep failed commits for 7 days
 
-def add_to_retry_queue(stroke_id: str, asset_data: Dict[str, Any]) -> None:
+RETRY_CONCURRENCY = int(os.getenv("RETRY_CONCURRENCY", "4"))
+RETRY_COMMIT_BATCH = int(os.getenv("RETRY_COMMIT_BATCH", "25"))
+RETRY_MIN_BATCH = 10
+RETRY_MAX_BATCH = int(os.getenv("RETRY_MAX_BATCH", "1000"))
+RETRY_TARGET_LATENCY_MS = int(os.getenv("RETRY_TARGET_LATENCY_MS", "2000"))
+RETRY_BACKOFF_BASE_SECONDS = 5
+RETRY_BACKOFF_MAX_SECONDS = 900
+RETRY_DRAIN_MAX_SECONDS = 50
+# A commit whose outcome is unknown is not resubmitted before the sync mirror
+# has had time to see its block and record it in the commit ledger
+UNKNOWN_OUTCOME_RECHECK_SECONDS = int(os.getenv("UNKNOWN_OUTCOME_RECHECK_SECONDS", "60"))
+RETRY_CLAIM_LEASE_SECONDS = int(os.getenv("RETRY_CLAIM_LEASE_SECONDS", "60"))
+RETRY_HEARTBEAT_SECONDS = RETRY_CLAIM_LEASE_SECONDS / 3
+
+# KEYS: dedup, items, queue   ARGV: id, item json, score, dedup ttl
+_ENQUEUE_LUA = """
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then
+  return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[3], ARGV[3], ARGV[1])
+redis.call('SADD', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+# KEYS: queue, items, attempts, leases   ARGV: now, limit, lease deadline, owner
+# Returns the number of due legacy (whole-JSON) members, which are left for
+# migrate_legacy_retry_queue(), then id, item json, attempts for each claimed item
+_CLAIM_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local out = {0}
+for _, id in ipairs(ids) do
+  local item = redis.call('HGET', KEYS[2], id)
+  if item then
+    redis.call('ZADD', KEYS[1], ARGV[3], id)
+    redis.call('HSET', KEYS[4], id, ARGV[4])
+    out[#out + 1] = id
+    out[#out + 1] = item
+    out[#out + 1] = redis.call('HGET', KEYS[3], id) or '0'
+  elseif string.sub(id, 1, 1) == '{' then
+    out[1] = out[1] + 1
+  else
+    redis.call('ZREM', KEYS[1], id)
+  end
+end
+return out
+"""
+
+# KEYS: queue, leases   ARGV: owner, lease deadline, ids...
+# Returns how many leases were still held and extended
+_EXTEND_LUA = """
+local n = 0
+for i = 3, #ARGV do
+  if redis.call('HGET', KEYS[2], ARGV[i]) == ARGV[1] and redis.call('ZSCORE', KEYS[1], ARGV[i]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[i])
+    n = n + 1
+  end
+end
+return n
+"""
+
+# KEYS: queue, items, attempts, dedup, leases   ARGV: id, owner ('' for any)
+# Returns -1 and leaves the item alone when owner no longer holds its lease
+_ACK_LUA = """
+if ARGV[2] ~= '' and redis.call('HGET', KEYS[5], ARGV[1]) ~= ARGV[2] then
+  return -1
+end
+local removed = redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('SREM', KEYS[4], ARGV[1])
+redis.call('HDEL', KEYS[5], ARGV[1])
+return removed
+"""
+
+# KEYS: queue, items, attempts, dedup, leases
+# ARGV: id, owner, now, backoff base, backoff cap, jitter, max attempts, count attempt (1|0)
+# Returns {status, attempts}; status is requeued, dropped or stale (lease lost)
+_NACK_LUA = """
+if redis.call('HGET', KEYS[5], ARGV[1]) ~= ARGV[2] or not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+  return {'stale', 0}
+end
+redis.call('HDEL', KEYS[5], ARGV[1])
+if ARGV[8] == '0' then
+  redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+  return {'requeued', tonumber(redis.call('HGET', KEYS[3], ARGV[1]) or '0')}
+end
+local n = redis.call('HINCRBY', KEYS[3], ARGV[1], 1)
+if n >= tonumber(ARGV[7]) then
+  redis.call('ZREM', KEYS[1], ARGV[1])
+  redis.call('HDEL', KEYS[2], ARGV[1])
+  redis.call('HDEL', KEYS[3], ARGV[1])
+  redis.call('SREM', KEYS[4], ARGV[1])
+  return {'dropped', n}
+end
+local delay = math.min(tonumber(ARGV[5]), tonumber(ARGV[4]) * 2 ^ (n - 1)) * tonumber(ARGV[6])
+redis.call('ZADD', KEYS[1], tonumber(ARGV[3]) + delay, ARGV[1])
+return {'requeued', n}
+"""
+
+_scripts = {}
+
+
+def _run_script(source, keys, args):
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = redis_client.register_script(source)
+    return script(keys=keys, args=args, client=redis_client)
+
+
+def _decode(v):
+    return v.decode() if isinstance(v, bytes) else v
+
+
+def add_to_retry_queue(stroke_id: str, asset_data: Dict[str, Any], delay_seconds: float = 0) -> None:
     """
     Add a failed GraphQL commit to the retry queue.
     
     Args:
         stroke_id: Unique identifier for the stroke
         asset_data: The asset data that should have been committed to ResilientDB
+        delay_seconds: Do not retry before this many seconds have passed
     """
     try:
-        # OPTIMIZATION: Use Redis SET for O(1) deduplication (was O(n) scan)
-        dedup_key = f"{RETRY_QUEUE_KEY}:ids"
-        
-        # Check if this stroke is already in the queue (O(1) instead of O(n))
-        if redis_client.sismember(dedup_key, stroke_id):
-            logger.warning(f"Stroke {stroke_id} already in retry queue, skipping duplicate")
+        # A commit that timed out may still have landed; the ledger knows
+        txn_id = committed_txn(stroke_id)
+        if txn_id:
+            logger.info(f"Stroke {stroke_id} already committed as {txn_id}, not queueing a retry")
             return
         
         retry_item = {
@@ -52,21 +206,17 @@ def add_to_retry_queue(stroke_id: str, asset_data: Dict[str, Any]) -> None:
             "attempts": 0
         }
         
-        # Use deterministic JSON serialization for consistent key
-        retry_item_json = json.dumps(retry_item, sort_keys=True)
-        
-        # Store in Redis sorted set with timestamp as score for ordered processing
-        redis_client.zadd(
-            RETRY_QUEUE_KEY,
-            {retry_item_json: time.time()}
+        # Dedup check, payload, schedule and dedup TTL in one atomic script.
+        # The dedup set expires after 7 days so orphaned entries are
+        # eventually cleaned up even if removal fails.
+        added = _run_script(
+            _ENQUEUE_LUA,
+            [RETRY_DEDUP_KEY, RETRY_ITEMS_KEY, RETRY_QUEUE_KEY],
+            [stroke_id, json.dumps(retry_item, sort_keys=True), time.time() + delay_seconds, 604800]
         )
-        
-        # Add to deduplication set (O(1) for future checks)
-        redis_client.sadd(dedup_key, stroke_id)
-        
-        # Set TTL on deduplication set to prevent memory leaks (7 days)
-        # This ensures orphaned entries are eventually cleaned up even if removal fails
-        redis_client.expire(dedup_key, 604800)
+        if not added:
+            logger.warning(f"Stroke {stroke_id} already in retry queue, skipping duplicate")
+            return
         
         logger.info(f"Added stroke {stroke_id} to GraphQL retry queue")
     except redis.exceptions.RedisError as e:
@@ -77,6 +227,26 @@ def add_to_retry_queue(stroke_id: str, asset_data: Dict[str, Any]) -> None:
         logger.error(f"Failed to add stroke {stroke_id} to retry queue: {e}")
 
 
+def _load_items(ids) -> list:
+    """(item_json, item) tuples for ``ids``, skipping ids whose payload is gone."""
+    ids = [_decode(i) for i in ids]
+    if not ids:
+        return []
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hmget(RETRY_ITEMS_KEY, ids)
+    pipe.hmget(RETRY_ATTEMPTS_KEY, ids)
+    payloads, attempts = pipe.execute()
+    out = []
+    for raw, count in zip(payloads, attempts):
+        if raw is None:
+            continue
+        item_json = _decode(raw)
+        item = json.loads(item_json)
+        item["attempts"] = int(count or 0)
+        out.append((item_json, item))
+    return out
+
+
 def get_pending_retries(limit: int = 100) -> list:
     """
     Get pending retry items from the queue.
@@ -85,47 +255,42 @@ def get_pending_retries(limit: int = 100) -> list:
         limit: Maximum number of items to retrieve
         
     Returns:
-        List of tuples: (original_json_string, parsed_dict) (oldest first)
-        The original JSON string is needed for removal from Redis
+        List of tuples: (item_json_string, parsed_dict), earliest next attempt first
     """
     try:
-        # Get oldest items first (FIFO)
-        items = redis_client.zrange(RETRY_QUEUE_KEY, 0, limit - 1)
-        # Return both original JSON string AND parsed dict
-        # This ensures we can use the exact key for removal
-        return [(item.decode() if isinstance(item, bytes) else item, json.loads(item)) for item in items]
+        return _load_items(redis_client.zrange(RETRY_QUEUE_KEY, 0, limit - 1))
     except Exception as e:
         logger.error(f"Failed to get pending retries: {e}")
         return []
 
 
-def remove_from_retry_queue(stroke_id: str, retry_item_json: str) -> None:
+def remove_from_retry_queue(stroke_id: str, retry_item_json: Optional[str] = None,
+                           owner: Optional[str] = None) -> None:
     """
     Remove a successfully committed item from the retry queue.
     
     Args:
         stroke_id: Stroke identifier
-        retry_item_json: The ORIGINAL JSON string from Redis (not reconstructed!)
-                        This must be the exact string that was used as the Redis key
+        retry_item_json: Unused; items are keyed by stroke id. Accepted so
+                         callers holding get_pending_retries() tuples keep working
+        owner: Only remove the item while this worker holds its lease
     """
     try:
-        # Remove from sorted set (queue)
-        result = redis_client.zrem(RETRY_QUEUE_KEY, retry_item_json)
-        
-        # Remove from deduplication set (O(1) cleanup)
-        dedup_key = f"{RETRY_QUEUE_KEY}:ids"
-        redis_client.srem(dedup_key, stroke_id)
-        
-        if result > 0:
+        removed = _run_script(
+            _ACK_LUA,
+            [RETRY_QUEUE_KEY, RETRY_ITEMS_KEY, RETRY_ATTEMPTS_KEY, RETRY_DEDUP_KEY, RETRY_LEASES_KEY],
+            [stroke_id, owner or ""]
+        )
+        if removed == -1:
+            logger.warning(f"Stroke {stroke_id} lease moved away from {owner}, left in retry queue")
+        elif removed:
             logger.info(f"Removed stroke {stroke_id} from retry queue and dedup set")
         else:
-            logger.error(f"Stroke {stroke_id} not found in retry queue key mismatch! Queue will not shrink!")
-            logger.error(f"This indicates a bug in JSON serialization consistency")
+            logger.debug(f"Stroke {stroke_id} was not in the retry queue")
     except Exception as e:
         logger.error(f"Failed to remove stroke {stroke_id} from retry queue: {e}")
 
 
-
 def increment_retry_attempts(stroke_id: str) -> int:
     """
     Increment retry attempt counter for a stroke.
@@ -137,10 +302,7 @@ def increment_retry_attempts(stroke_id: str) -> int:
         Current retry attempt count
     """
     try:
-        key = f"{RETRY_ATTEMPTS_KEY}:{stroke_id}"
-        attempts = redis_client.incr(key)
-        redis_client.expire(key, RETRY_EXPIRY_SECONDS)
-        return attempts
+        return redis_client.hincrby(RETRY_ATTEMPTS_KEY, stroke_id, 1)
     except Exception as e:
         logger.error(f"Failed to increment retry attempts for {stroke_id}: {e}")
         return 0
@@ -149,75 +311,313 @@ def increment_retry_attempts(stroke_id: str) -> int:
 def get_retry_attempts(stroke_id: str) -> int:
     """Get current retry attempt count for a stroke."""
     try:
-        key = f"{RETRY_ATTEMPTS_KEY}:{stroke_id}"
-        attempts = redis_client.get(key)
+        attempts = redis_client.hget(RETRY_ATTEMPTS_KEY, stroke_id)
         return int(attempts) if attempts else 0
     except Exception:
         return 0
 
 
-def process_retry_queue(max_items: int = 50) -> Dict[str, int]:
+def retry_backoff_seconds(attempts: int) -> float:
+    """Delay before the next attempt after ``attempts`` failures, with +/-20% jitter."""
+    delay = min(RETRY_BACKOFF_MAX_SECONDS, RETRY_BACKOFF_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def get_due_retries(limit: int = 100, now: Optional[float] = None) -> list:
+    """
+    Like get_pending_retries(), but only items whose next-attempt time has
+    passed. Read-only; use claim_retries() to take items for processing.
+    """
+    try:
+        now = time.time() if now is None else now
+        return _load_items(redis_client.zrangebyscore(RETRY_QUEUE_KEY, "-inf", now, start=0, num=limit))
+    except Exception as e:
+        logger.error(f"Failed to get due retries: {e}")
+        return []
+
+
+def seconds_until_next_retry() -> Optional[float]:
+    """Seconds until the earliest queued item is due (0 if overdue), or None if the queue is empty."""
+    try:
+        head = redis_client.zrange(RETRY_QUEUE_KEY, 0, 0, withscores=True)
+    except Exception:
+        return None
+    if not head:
+        return None
+    return max(0.0, head[0][1] - time.time())
+
+
+def default_worker_id() -> str:
+    """Owner id for leases taken by this process (host and pid)."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def claim_retries(limit: int = 100, owner: Optional[str] = None,
+                  lease_seconds: int = RETRY_CLAIM_LEASE_SECONDS) -> list:
+    """
+    Atomically lease up to ``limit`` due items to ``owner``. Returns
+    ``(stroke_id, item, attempts)`` tuples. Other workers will not see these
+    items until the lease deadline passes; keep it alive with
+    extend_leases() / LeaseHeartbeat. Due members in the old whole-JSON
+    layout (enqueued by replicas not yet upgraded) are migrated, not
+    claimed, and come back on the next claim.
+    """
+    owner = owner or default_worker_id()
+    now = time.time()
+    flat = _run_script(
+        _CLAIM_LUA,
+        [RETRY_QUEUE_KEY, RETRY_ITEMS_KEY, RETRY_ATTEMPTS_KEY, RETRY_LEASES_KEY],
+        [now, limit, now + lease_seconds, owner]
+    ) or [0]
+    if int(flat[0] or 0):
+        migrate_legacy_retry_queue()
+    flat = flat[1:]
+    items = []
+    for i in range(0, len(flat), 3):
+        stroke_id = _decode(flat[i])
+        try:
+            item = json.loads(_decode(flat[i + 1]))
+        except (TypeError, ValueError):
+            item = {}
+        items.append((stroke_id, item, int(flat[i + 2] or 0)))
+    return items
+
+
+def extend_leases(owner: str, stroke_ids: list, lease_seconds: int = RETRY_CLAIM_LEASE_SECONDS) -> int:
+    """Push the deadline of every lease ``owner`` still holds among ``stroke_ids``. Returns how many."""
+    if not stroke_ids:
+        return 0
+    return int(_run_script(_EXTEND_LUA, [RETRY_QUEUE_KEY, RETRY_LEASES_KEY],
+                           [owner, time.time() + lease_seconds, *stroke_ids]) or 0)
+
+
+class LeaseHeartbeat:
+    """
+    Context manager that extends ``owner``'s leases on ``stroke_ids`` every
+    ``interval`` seconds until the block exits, so slow commits keep their
+    items and a crashed worker's items expire after one lease.
+    """
+
+    def __init__(self, owner: str, stroke_ids: list, interval: float = RETRY_HEARTBEAT_SECONDS):
+        self.owner = owner
+        self.stroke_ids = list(stroke_ids)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                extend_leases(self.owner, self.stroke_ids)
+            except Exception as e:
+                logger.warning(f"Retry lease heartbeat failed for {self.owner}: {e}")
+
+    def __enter__(self):
+        if self.stroke_ids:
+            self._thread = threading.Thread(target=self._run, name="RetryLeaseHeartbeat", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        return False
+
+
+def nack_retry(stroke_id: str, owner: str, count_attempt: bool = True, delay_seconds: float = 0) -> tuple:
+    """
+    Give a claimed item back. With ``count_attempt`` the failure is counted
+    and the item backs off (or is dropped at MAX_RETRY_ATTEMPTS); without it
+    the item is due again immediately. ``delay_seconds`` is added before
+    either. Returns ``(status, attempts)`` with status ``requeued``,
+    ``dropped`` or ``stale`` (``owner`` no longer held the lease and the item
+    was left alone).
+    """
+    status, attempts = _run_script(
+        _NACK_LUA,
+        [RETRY_QUEUE_KEY, RETRY_ITEMS_KEY, RETRY_ATTEMPTS_KEY, RETRY_DEDUP_KEY, RETRY_LEASES_KEY],
+        [stroke_id, owner, time.time() + delay_seconds, RETRY_BACKOFF_BASE_SECONDS, RETRY_BACKOFF_MAX_SECONDS,
+         random.uniform(0.8, 1.2), MAX_RETRY_ATTEMPTS, 1 if count_attempt else 0]
+    )
+    return _decode(status), int(attempts)
+
+
+def _prepare(asset_data):
+    return {
+        "operation": "CREATE",
+        "amount": 1,
+        "signerPublicKey": SIGNER_PUBLIC_KEY,
+        "signerPrivateKey": SIGNER_PRIVATE_KEY,
+        "recipientPublicKey": RECIPIENT_PUBLIC_KEY,
+        "asset": {"data": asset_data}
+    }
+
+
+class LeaseLostError(RuntimeError):
+    """The worker's lease on a retry item moved to another worker before its commit."""
+
+
+def held_leases(owner: str, stroke_ids: list) -> set:
+    """The subset of ``stroke_ids`` whose lease ``owner`` still holds."""
+    if not stroke_ids:
+        return set()
+    owners = redis_client.hmget(RETRY_LEASES_KEY, stroke_ids)
+    return {stroke_id for stroke_id, held_by in zip(stroke_ids, owners) if _decode(held_by) == owner}
+
+
+def _commit_chunk(chunk, owner):
+    """
+    Commit one chunk of (stroke_id, asset_data); returns (results, elapsed_ms).
+    Leases and the ledger are checked again right before the request: an item
+    another worker took over gets a LeaseLostError, one that landed meanwhile
+    gets its recorded txn id, and neither is submitted.
+    """
+    t0 = time.perf_counter()
+    ids = [stroke_id for stroke_id, _ in chunk]
+    held = held_leases(owner, ids)
+    known = committed_txns([stroke_id for stroke_id in ids if stroke_id in held])
+    results = {stroke_id: LeaseLostError(f"lease on {stroke_id} lost") for stroke_id in ids if stroke_id not in held}
+    results.update(known)
+    todo = [(stroke_id, asset_data) for stroke_id, asset_data in chunk if stroke_id not in results]
+    if len(todo) == 1:
+        try:
+            results[todo[0][0]] = commit_transaction_via_graphql(_prepare(todo[0][1]))
+        except Exception as e:
+            results[todo[0][0]] = e
+    elif todo:
+        committed = commit_transactions_batch_via_graphql([_prepare(asset_data) for _, asset_data in todo])
+        results.update(zip([stroke_id for stroke_id, _ in todo], committed))
+    return [results[stroke_id] for stroke_id in ids], (time.perf_counter() - t0) * 1000
+
+
+class AdaptiveBatchSize:
+    """
+    Round sizing for drain_retry_queue(). A clean, fast round doubles the
+    size; some failures or slow requests shrink it by a quarter; a mostly
+    failing or very slow round halves it.
+    """
+
+    def __init__(self, initial: int = 50, minimum: int = RETRY_MIN_BATCH,
+                 maximum: int = RETRY_MAX_BATCH, target_latency_ms: float = RETRY_TARGET_LATENCY_MS):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency_ms = target_latency_ms
+        self.size = max(minimum, min(maximum, initial))
+
+    def update(self, success: int, failed: int, latency_ms: float) -> int:
+        total = success + failed
+        if total == 0:
+            return self.size
+        rate = success / total
+        if rate < 0.5 or latency_ms > 2 * self.target_latency_ms:
+            self.size = max(self.minimum, self.size // 2)
+        elif rate < 0.95 or latency_ms > self.target_latency_ms:
+            self.size = max(self.minimum, int(self.size * 0.75))
+        else:
+            self.size = min(self.maximum, self.size * 2)
+        return self.size
+
+
+def process_retry_queue(max_items: int = 50, concurrency: Optional[int] = None,
+                        owner: Optional[str] = None) -> Dict[str, int]:
     """
-    Process pending GraphQL commit retries.
+    Claim and process due GraphQL commit retries.
     
     Args:
         max_items: Maximum number of items to process in this batch
+        concurrency: Parallel GraphQL requests (default RETRY_CONCURRENCY)
+        owner: Worker id the items are leased to (default default_worker_id())
         
     Returns:
-        Dictionary with success/failure counts
+        Dictionary with success/failure counts and the mean request latency
     """
-    stats = {"success": 0, "failed": 0, "skipped": 0}
-    
+    stats = {"success": 0, "failed": 0, "skipped": 0, "latency_ms": 0}
+
+    if graphql_circuit_open():
+        logger.debug("GraphQL circuit open, deferring retry drain")
+        return stats
+
     try:
-        pending_items = get_pending_retries(max_items)
+        owner = owner or default_worker_id()
+        claimed = claim_retries(max_items, owner=owner)
         
-        if not pending_items:
-            logger.debug("No pending GraphQL retries")
+        if not claimed:
+            logger.debug("No due GraphQL retries")
             return stats
         
-        logger.info(f"Processing {len(pending_items)} pending GraphQL retries")
+        logger.info(f"Processing {len(claimed)} due GraphQL retries")
         
-        for original_json, item in pending_items:
-            stroke_id = item.get("stroke_id")
+        work = []
+        for stroke_id, item, attempts in claimed:
             asset_data = item.get("asset_data")
             
-            if not stroke_id or not asset_data:
-                logger.warning(f"Invalid retry item: {item}")
+            if not asset_data:
+                logger.warning(f"Invalid retry item {stroke_id}: {item}")
+                remove_from_retry_queue(stroke_id, owner=owner)
                 stats["skipped"] += 1
                 continue
             
             # Check if we've exceeded max retry attempts
-            attempts = get_retry_attempts(stroke_id)
             if attempts >= MAX_RETRY_ATTEMPTS:
                 logger.error(f"Stroke {stroke_id} exceeded max retry attempts ({MAX_RETRY_ATTEMPTS}), removing from queue")
-                remove_from_retry_queue(stroke_id, original_json)
+                remove_from_retry_queue(stroke_id, owner=owner)
                 stats["skipped"] += 1
                 continue
-            
-            # Attempt to commit to ResilientDB
-            try:
-                prep = {
-                    "operation": "CREATE",
-                    "amount": 1,
-                    "signerPublicKey": SIGNER_PUBLIC_KEY,
-                    "signerPrivateKey": SIGNER_PRIVATE_KEY,
-                    "recipientPublicKey": RECIPIENT_PUBLIC_KEY,
-                    "asset": {"data": asset_data}
-                }
-                
-                txn_id = commit_transaction_via_graphql(prep)
-                logger.info(f"RETRY SUCCESS: Stroke {stroke_id} committed to ResilientDB: {txn_id}")
-                
-                # Use original JSON string as Redis key for removal
-                # This ensures exact match with the key that was stored
-                remove_from_retry_queue(stroke_id, original_json)
-                stats["success"] += 1
-                
-            except Exception as e:
-                # Increment attempts and keep in queue
-                new_attempts = increment_retry_attempts(stroke_id)
-                logger.warning(f"RETRY FAILED (attempt {new_attempts}/{MAX_RETRY_ATTEMPTS}): Stroke {stroke_id}: {str(e)}")
-                stats["failed"] += 1
+            work.append((stroke_id, asset_data))
+
+        # Items whose earlier attempt landed after all (recorded by the outbox
+        # or seen by the sync mirror) are done without another submit
+        known = committed_txns([stroke_id for stroke_id, _ in work])
+        for stroke_id in known:
+            logger.info(f"RETRY SKIPPED: Stroke {stroke_id} already committed as {known[stroke_id]}")
+            remove_from_retry_queue(stroke_id, owner=owner)
+            stats["skipped"] += 1
+        work = [(stroke_id, asset_data) for stroke_id, asset_data in work if stroke_id not in known]
+
+        chunks = [work[i:i + RETRY_COMMIT_BATCH] for i in range(0, len(work), RETRY_COMMIT_BATCH)]
+        workers = max(1, min(concurrency or RETRY_CONCURRENCY, len(chunks)))
+        with LeaseHeartbeat(owner, [stroke_id for stroke_id, _ in work]):
+            if workers == 1:
+                outcomes = [_commit_chunk(chunk, owner) for chunk in chunks]
+            else:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retry-drain") as pool:
+                    outcomes = list(pool.map(lambda chunk: _commit_chunk(chunk, owner), chunks))
+
+        latencies = []
+        new_commits = {}
+        for chunk, (results, elapsed_ms) in zip(chunks, outcomes):
+            latencies.append(elapsed_ms)
+            for (stroke_id, _), result in zip(chunk, results):
+                if isinstance(result, LeaseLostError):
+                    # The new owner drains it; neither ack nor nack what is not ours
+                    logger.info(f"RETRY SKIPPED: Stroke {stroke_id} was claimed by another worker")
+                    stats["skipped"] += 1
+                    continue
+                if isinstance(result, CircuitOpenError):
+                    # ResilientDB went down mid-drain; the item is due again without counting an attempt
+                    nack_retry(stroke_id, owner, count_attempt=False)
+                    continue
+                if isinstance(result, Exception):
+                    # The commit may have landed; hold it back until the
+                    # ledger has had a chance to learn about it
+                    delay = UNKNOWN_OUTCOME_RECHECK_SECONDS if isinstance(result, CommitOutcomeUnknown) else 0
+                    status, new_attempts = nack_retry(stroke_id, owner, delay_seconds=delay)
+                    if status == "dropped":
+                        logger.error(f"Stroke {stroke_id} exceeded max retry attempts ({MAX_RETRY_ATTEMPTS}), removed from queue")
+                    logger.warning(f"RETRY FAILED (attempt {new_attempts}/{MAX_RETRY_ATTEMPTS}): Stroke {stroke_id}: {str(result)}")
+                    stats["failed"] += 1
+                else:
+                    logger.info(f"RETRY SUCCESS: Stroke {stroke_id} committed to ResilientDB: {result}")
+                    new_commits[stroke_id] = result
+                    stats["success"] += 1
+        # Record before acking, so a worker that took over a lease meanwhile
+        # finds the commit in the ledger instead of submitting it again
+        record_commits(new_commits)
+        for stroke_id in new_commits:
+            remove_from_retry_queue(stroke_id, owner=owner)
+        if latencies:
+            stats["latency_ms"] = round(sum(latencies) / len(latencies))
         
         if stats["success"] > 0 or stats["failed"] > 0:
             logger.info(f"Retry batch complete: {stats['success']} success, {stats['failed']} failed, {stats['skipped']} skipped")
@@ -228,6 +628,32 @@ def process_retry_queue(max_items: int = 50) -> Dict[str, int]:
     return stats
 
 
+def drain_retry_queue(initial_batch: int = 50, max_seconds: float = RETRY_DRAIN_MAX_SECONDS,
+                      stop_event=None, owner: Optional[str] = None) -> Dict[str, int]:
+    """
+    Drain due retries in rounds until none are due, the circuit opens,
+    ``stop_event`` is set or ``max_seconds`` have passed. Round size adapts
+    to the success rate and latency of the previous round.
+    """
+    totals = {"success": 0, "failed": 0, "skipped": 0, "rounds": 0}
+    sizer = AdaptiveBatchSize(initial=initial_batch)
+    deadline = time.monotonic() + max_seconds
+    while time.monotonic() < deadline and not (stop_event is not None and stop_event.is_set()):
+        stats = process_retry_queue(max_items=sizer.size, owner=owner)
+        totals["rounds"] += 1
+        for key in ("success", "failed", "skipped"):
+            totals[key] += stats[key]
+        handled = stats["success"] + stats["failed"] + stats["skipped"]
+        if handled == 0:
+            break
+        sizer.update(stats["success"], stats["failed"], stats["latency_ms"])
+        if stats["success"] == 0 and stats["skipped"] == 0:
+            # Nothing landed this round; leave the backed-off items for later
+            break
+    totals["batch_size"] = sizer.size
+    return totals
+
+
 def get_queue_size() -> int:
     """Get the current size of the retry queue."""
     try:
@@ -246,9 +672,46 @@ def clear_retry_queue() -> int:
     """
     try:
         count = redis_client.zcard(RETRY_QUEUE_KEY)
-        redis_client.delete(RETRY_QUEUE_KEY)
+        redis_client.delete(RETRY_QUEUE_KEY, RETRY_ITEMS_KEY, RETRY_ATTEMPTS_KEY, RETRY_DEDUP_KEY, RETRY_LEASES_KEY)
         logger.warning(f"Cleared {count} items from GraphQL retry queue")
         return count
     except Exception as e:
         logger.error(f"Failed to clear retry queue: {e}")
         return 0
+
+
+def migrate_legacy_retry_queue() -> int:
+    """
+    Move items stored in the old layout (whole item JSON as the ZSET member,
+    attempts under ``{RETRY_ATTEMPTS_KEY}:{id}``) into the id + hash layout.
+    Safe to run repeatedly. Returns the number of items moved.
+    """
+    moved = 0
+    try:
+        for member, score in redis_client.zrange(RETRY_QUEUE_KEY, 0, -1, withscores=True):
+            member = _decode(member)
+            if not member.startswith("{"):
+                continue
+            try:
+                item = json.loads(member)
+                stroke_id = item["stroke_id"]
+            except (ValueError, KeyError):
+                redis_client.zrem(RETRY_QUEUE_KEY, member)
+                continue
+            legacy_attempts_key = f"{RETRY_ATTEMPTS_KEY}:{stroke_id}"
+            pipe = redis_client.pipeline(transaction=True)
+            pipe.hset(RETRY_ITEMS_KEY, stroke_id, member)
+            pipe.zadd(RETRY_QUEUE_KEY, {stroke_id: score})
+            pipe.zrem(RETRY_QUEUE_KEY, member)
+            pipe.sadd(RETRY_DEDUP_KEY, stroke_id)
+            pipe.get(legacy_attempts_key)
+            pipe.delete(legacy_attempts_key)
+            attempts = pipe.execute()[4]
+            if attempts:
+                redis_client.hset(RETRY_ATTEMPTS_KEY, stroke_id, int(attempts))
+            moved += 1
+        if moved:
+            logger.info(f"Migrated {moved} retry items to the id + hash layout")
+    except Exception as e:
+        logger.error(f"Failed to migrate legacy retry queue: {e}")
+    return moved
@@ -4,30 +4,48 @@ Background thread for GraphQL retry queue processing
 This module runs a background thread within the Flask application
 to automatically retry failed ResilientDB commits. No separate
 process needed - starts automatically when Flask starts.
+
+Every app replica runs one of these. Items are leased to a single worker
+(see services.graphql_retry_queue), so replicas split the backlog instead
+of retrying the same items.
 """
 
 import threading
 import time
 import logging
-from services.graphql_retry_queue import process_retry_queue, get_queue_size
+from services.graphql_retry_queue import (
+    drain_retry_queue, get_queue_size, seconds_until_next_retry, migrate_legacy_retry_queue, default_worker_id
+)
 
 logger = logging.getLogger(__name__)
 
 # Configuration
-RETRY_INTERVAL_SECONDS = 60
-BATCH_SIZE = 50
+RETRY_INTERVAL_SECONDS = 60  # Longest idle wait; sooner if a backed-off item comes due
+BATCH_SIZE = 50  # First drain round; later rounds adapt (see drain_retry_queue)
 
 # Thread control
 _retry_thread = None
 _stop_event = threading.Event()
 
 
+def _next_wait_seconds():
+    """Sleep until the next retry comes due, at most RETRY_INTERVAL_SECONDS."""
+    due_in = seconds_until_next_retry()
+    if due_in is None:
+        return RETRY_INTERVAL_SECONDS
+    return max(1.0, min(RETRY_INTERVAL_SECONDS, due_in))
+
+
 def _retry_worker_loop():
     """Background worker that processes the retry queue periodically."""
     # Wait a bit for Redis/MongoDB to be fully ready before starting
     time.sleep(2)
     
-    logger.info("GraphQL Retry Worker started (background thread)")
+    # Items queued before the id + hash layout
+    migrate_legacy_retry_queue()
+    
+    owner = default_worker_id()
+    logger.info(f"GraphQL Retry Worker {owner} started (background thread)")
     logger.info(f"Configuration: RETRY_INTERVAL={RETRY_INTERVAL_SECONDS}s, BATCH_SIZE={BATCH_SIZE}")
     
     iteration = 0
@@ -41,14 +59,14 @@ def _retry_worker_loop():
             if queue_size > 0:
                 logger.info(f"Iteration {iteration}: Processing retry queue ({queue_size} items pending)")
                 
-                stats = process_retry_queue(max_items=BATCH_SIZE)
+                stats = drain_retry_queue(initial_batch=BATCH_SIZE, stop_event=_stop_event, owner=owner)
                 
                 if stats['success'] > 0 or stats['failed'] > 0:
                     remaining = get_queue_size()
                     logger.info(
-                        f"Batch complete: {stats['success']} synced, "
-                        f"{stats['failed']} failed, {stats['skipped']} skipped. "
-                        f"Remaining: {remaining}"
+                        f"Drain complete: {stats['success']} synced, "
+                        f"{stats['failed']} failed, {stats['skipped']} skipped in {stats['rounds']} rounds "
+                        f"(batch size now {stats['batch_size']}). Remaining: {remaining}"
                     )
             else:
                 if iteration % 10 == 1:  # Log every 10 iterations when idle
@@ -59,7 +77,7 @@ def _retry_worker_loop():
             logger.exception("Full traceback:")
         
         # Wait with ability to interrupt on shutdown
-        _stop_event.wait(RETRY_INTERVAL_SECONDS)
+        _stop_event.wait(_next_wait_seconds())
     
     logger.info("GraphQL Retry Worker stopped")
 
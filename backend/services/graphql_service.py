@@ -3,15 +3,136 @@
 import json
 import requests
 import logging
+import threading
 import time
 import urllib3
+from requests.adapters import HTTPAdapter
 from config import *
 from .db import strokes_coll
+from .stroke_decoder import iter_assets
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 logger = logging.getLogger(__name__)
 
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling GraphQL while the circuit breaker is open."""
+
+
+class CommitOutcomeUnknown(RuntimeError):
+    """
+    The request may have reached ResilientDB but no usable answer came back
+    (read timeout, dropped connection, 5xx or unreadable reply), so the
+    transaction may or may not have been committed.
+    """
+
+
+def _outcome_unknown(exc):
+    """True when ``exc`` was raised after the request may have been delivered."""
+    if isinstance(exc, (CircuitOpenError, requests.exceptions.ConnectTimeout)):
+        return False
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        reason = getattr(exc.args[0], "reason", None) if exc.args else None
+        return not isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return isinstance(exc, requests.exceptions.RequestException)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. After ``threshold`` transport failures or
+    5xx responses the circuit opens and calls fail fast for ``reset_secs``;
+    then a single probe is let through, which closes it again on success.
+    """
+
+    def __init__(self, threshold, reset_secs):
+        self.threshold = threshold
+        self.reset_secs = reset_secs
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None and (
+                self._probing or time.monotonic() - self._opened_at < self.reset_secs)
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_secs:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("GraphQL circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logger.warning(f"GraphQL circuit opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+    def reset(self):
+        self.record_success()
+
+
+_breaker = CircuitBreaker(GRAPHQL_BREAKER_THRESHOLD, GRAPHQL_BREAKER_RESET_SECS)
+_session = None
+_session_lock = threading.Lock()
+
+
+def graphql_circuit_open() -> bool:
+    """True while ResilientDB is considered down and commits should be queued for retry."""
+    return _breaker.is_open()
+
+
+def _get_session():
+    """Shared keep-alive session; the pool is sized for the commit workers plus request threads."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=GRAPHQL_POOL_SIZE, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({**HEADERS, "Content-Type": "application/json"})
+                session.verify = False
+                _session = session
+    return _session
+
+
+def _post(body: dict):
+    if not _breaker.allow():
+        raise CircuitOpenError("ResilientDB GraphQL circuit is open")
+    try:
+        resp = _get_session().post(
+            GRAPHQL_URL,
+            json=body,
+            timeout=(GRAPHQL_CONNECT_TIMEOUT, GRAPHQL_READ_TIMEOUT)
+        )
+    except Exception:
+        _breaker.record_failure()
+        raise
+    if resp.status_code >= 500:
+        _breaker.record_failure()
+    else:
+        _breaker.record_success()
+    return resp
+
+
 def commit_transaction_via_graphql(payload: dict) -> str:
     mutation = """
     mutation PostTransaction($data: PrepareAsset!) {
@@ -24,22 +145,23 @@ def commit_transaction_via_graphql(payload: dict) -> str:
         "operationName": "PostTransaction"
     }
 
-    resp = requests.post(
-        GRAPHQL_URL,
-        json=body,
-        headers={**HEADERS, "Content-Type": "application/json"},
-        verify=False
-    )
+    try:
+        resp = _post(body)
+    except Exception as e:
+        if _outcome_unknown(e):
+            raise CommitOutcomeUnknown(f"No reply from GraphQL: {e}") from e
+        raise
+    if resp.status_code >= 500:
+        raise CommitOutcomeUnknown(f"HTTP {resp.status_code} from GraphQL")
 
     result = {}
     try:
         result = resp.json()
     except ValueError:
-        logger.error("GraphQL did not return JSON: %s", resp.text)
+        logger.error("GraphQL did not return JSON: %s", resp.text[:500])
         resp.raise_for_status()
-    
-    logger.error(f"[GraphQL {resp.status_code}] response:")
-    logger.error(json.dumps(result, indent=2))
+
+    logger.debug(f"[GraphQL {resp.status_code}] postTransaction")
 
     if result.get("errors"):
         errs = result["errors"]
@@ -51,6 +173,60 @@ def commit_transaction_via_graphql(payload: dict) -> str:
     return result["data"]["postTransaction"]["id"]
 
 
+def commit_transactions_batch_via_graphql(payloads: list) -> list:
+    """
+    Commit several PrepareAsset payloads in one GraphQL request using
+    aliased postTransaction fields (t0, t1, ...). Returns one entry per
+    payload, in order: the txn id, or the exception for that item. A
+    transport or HTTP failure applies to every item; when the request may
+    have been delivered (timeout, dropped connection, 5xx, unreadable reply)
+    that exception is CommitOutcomeUnknown, since the whole batch may have
+    been committed.
+    """
+    if not payloads:
+        return []
+    var_defs = ", ".join(f"$d{i}: PrepareAsset!" for i in range(len(payloads)))
+    fields = " ".join(f"t{i}: postTransaction(data: $d{i}) {{ id }}" for i in range(len(payloads)))
+    body = {
+        "query": f"mutation PostTransactionBatch({var_defs}) {{ {fields} }}",
+        "variables": {f"d{i}": p for i, p in enumerate(payloads)},
+        "operationName": "PostTransactionBatch"
+    }
+
+    try:
+        resp = _post(body)
+    except Exception as e:
+        if _outcome_unknown(e):
+            e = CommitOutcomeUnknown(f"No reply from GraphQL: {e}")
+        return [e] * len(payloads)
+    if resp.status_code >= 500:
+        return [CommitOutcomeUnknown(f"HTTP {resp.status_code} from GraphQL")] * len(payloads)
+    if resp.status_code // 100 != 2:
+        return [RuntimeError(f"HTTP {resp.status_code} from GraphQL")] * len(payloads)
+    try:
+        result = resp.json()
+    except ValueError as e:
+        return [CommitOutcomeUnknown(f"GraphQL did not return JSON: {e}")] * len(payloads)
+
+    data = result.get("data") or {}
+    errors_by_alias = {}
+    for err in result.get("errors") or []:
+        path = err.get("path") or []
+        alias = path[0] if path else None
+        errors_by_alias.setdefault(alias, []).append(err)
+
+    out = []
+    for i in range(len(payloads)):
+        alias = f"t{i}"
+        node = data.get(alias)
+        if isinstance(node, dict) and node.get("id"):
+            out.append(node["id"])
+        else:
+            errs = errors_by_alias.get(alias) or errors_by_alias.get(None) or "no id returned"
+            out.append(RuntimeError(f"GraphQL errors: {errs}"))
+    return out
+
+
 class GraphQLService:
     """Helper class for undo/redo persistent state management (legacy compatibility)."""
     
@@ -106,16 +282,7 @@ class GraphQLService:
             markers = []
             
             for doc in docs:
-                for tx in doc.get('transactions', []):
-                    tx_value = tx.get('value', {})
-                    # Handle case where value might be a string (JSON serialized)
-                    if isinstance(tx_value, str):
-                        try:
-                            tx_value = json.loads(tx_value)
-                        except:
-                            continue
-                    
-                    asset_data = tx_value.get('asset', {}).get('data', {})
+                for asset_data in iter_assets({'transactions': doc.get('transactions')}):
                     marker_id = asset_data.get('id')
 
                     if marker_id and (marker_id.startswith('undo-') or marker_id.startswith('redo-')):
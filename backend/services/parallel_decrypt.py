@@ -0,0 +1,82 @@
+# services/parallel_decrypt.py
+"""
+Bounded thread-pool stage for decrypting private/secure room history.
+
+AES-GCM in ``cryptography`` releases the GIL while it works, so decrypting a
+long room history on a few threads scales with cores instead of running one
+stroke at a time on the request thread. Work is split into chunks of
+DECRYPT_CHUNK_SIZE items that run on a shared pool of DECRYPT_WORKERS
+threads; results always come back in input order. Small inputs (fewer than
+DECRYPT_MIN_PARALLEL items) are decoded inline, where the pool would only
+add overhead.
+
+The function passed in must not raise; an exception from it is logged and
+the item's result is None, matching how the read paths skip undecodable
+strokes.
+"""
+
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+DECRYPT_WORKERS = int(os.getenv("DECRYPT_WORKERS", str(min(8, os.cpu_count() or 1))))
+DECRYPT_CHUNK_SIZE = 256
+DECRYPT_MIN_PARALLEL = 64
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    pool = _pools.get(workers)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(workers)
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decrypt")
+                _pools[workers] = pool
+    return pool
+
+
+def _run_chunk(fn, chunk):
+    out = []
+    for item in chunk:
+        try:
+            out.append(fn(item))
+        except Exception:
+            logger.exception("parallel_decrypt: item failed")
+            out.append(None)
+    return out
+
+
+def parallel_map(fn, items, workers=None, chunk_size=DECRYPT_CHUNK_SIZE):
+    """Return ``[fn(item) for item in items]``, computed in chunks on the decrypt pool."""
+    items = items if isinstance(items, list) else list(items)
+    workers = workers or DECRYPT_WORKERS
+    if workers <= 1 or len(items) < DECRYPT_MIN_PARALLEL:
+        return _run_chunk(fn, items)
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    results = []
+    for chunk_result in _get_pool(workers).map(lambda chunk: _run_chunk(fn, chunk), chunks):
+        results.extend(chunk_result)
+    return results
+
+
+def iter_parallel_map(fn, iterable, workers=None, chunk_size=DECRYPT_CHUNK_SIZE):
+    """
+    Streaming parallel_map(): pulls ``workers * chunk_size`` items at a time
+    from ``iterable`` (on the calling thread, so cursors are never shared)
+    and yields results in input order.
+    """
+    workers = workers or DECRYPT_WORKERS
+    it = iter(iterable)
+    window = max(1, workers) * chunk_size
+    while True:
+        batch = list(islice(it, window))
+        if not batch:
+            return
+        yield from parallel_map(fn, batch, workers=workers, chunk_size=chunk_size)
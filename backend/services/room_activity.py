@@ -0,0 +1,125 @@
+# services/room_activity.py
+"""
+Debounced ``rooms.updatedAt`` tracking.
+
+Stroke writes used to $set ``updatedAt`` on the room document once per
+stroke, so an active room got one extra Mongo write per stroke on the same
+hot document. Writers now call touch_room(), which records the room's last
+activity in the Redis hash ACTIVITY_KEY (room _id -> epoch ms). A flusher
+thread takes the whole hash every ACTIVITY_FLUSH_SECONDS and applies it to
+Mongo as one unordered bulk_write of ``$max`` updates, so a late flush can
+never move ``updatedAt`` backwards. The dashboard sort in list_rooms is
+therefore at most one flush interval behind.
+"""
+
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+
+from services.db import redis_client, rooms_coll
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_KEY = "room-activity"
+ACTIVITY_FLUSH_SECONDS = 5
+
+# rooms.updatedAt holds naive UTC datetimes
+_EPOCH = datetime(1970, 1, 1)
+
+_flush_thread = None
+_stop_event = threading.Event()
+
+
+def _decode(v):
+    return v.decode("utf-8") if isinstance(v, (bytes, bytearray)) else v
+
+
+def _room_oid(room_id):
+    try:
+        return ObjectId(room_id)
+    except (InvalidId, TypeError):
+        return room_id
+
+
+def touch_room(room_oid, when=None):
+    """
+    Record activity on a room. One HSET; if Redis is unavailable the room
+    document is updated directly.
+    """
+    when = when or datetime.utcnow()
+    try:
+        redis_client.hset(ACTIVITY_KEY, str(room_oid), int((when - _EPOCH).total_seconds() * 1000))
+    except Exception as e:
+        logger.warning(f"room_activity: Redis unavailable, writing updatedAt directly: {e}")
+        rooms_coll.update_one({"_id": room_oid}, {"$max": {"updatedAt": when}})
+
+
+def flush_room_activity():
+    """Apply all pending activity to Mongo in one bulk write. Returns the number of rooms flushed."""
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hgetall(ACTIVITY_KEY)
+    pipe.delete(ACTIVITY_KEY)
+    pending = pipe.execute()[0] or {}
+    if not pending:
+        return 0
+
+    pending = {_decode(k): int(_decode(v)) for k, v in pending.items()}
+    ops = [
+        UpdateOne({"_id": _room_oid(room_id)},
+                  {"$max": {"updatedAt": _EPOCH + timedelta(milliseconds=ms)}})
+        for room_id, ms in pending.items()
+    ]
+    try:
+        rooms_coll.bulk_write(ops, ordered=False)
+    except Exception:
+        # Put the batch back for the next pass; newer activity recorded in
+        # the meantime wins
+        logger.exception("room_activity: bulk flush of %d rooms failed", len(ops))
+        pipe = redis_client.pipeline(transaction=False)
+        for room_id, ms in pending.items():
+            pipe.hsetnx(ACTIVITY_KEY, room_id, ms)
+        pipe.execute()
+        return 0
+    return len(ops)
+
+
+def _flush_loop():
+    logger.info(f"Room activity flusher started: INTERVAL={ACTIVITY_FLUSH_SECONDS}s")
+    while not _stop_event.wait(ACTIVITY_FLUSH_SECONDS):
+        try:
+            flush_room_activity()
+        except Exception as e:
+            logger.error(f"Error in room activity flusher: {e}")
+    logger.info("Room activity flusher stopped")
+
+
+def start_activity_flusher():
+    global _flush_thread
+    if _flush_thread is not None and _flush_thread.is_alive():
+        logger.warning("Room activity flusher already running")
+        return
+    _stop_event.clear()
+    _flush_thread = threading.Thread(
+        target=_flush_loop,
+        name="RoomActivityFlusher",
+        daemon=True
+    )
+    _flush_thread.start()
+
+
+def stop_activity_flusher():
+    """Stop the flusher and write out whatever is still pending."""
+    global _flush_thread
+    if _flush_thread is None or not _flush_thread.is_alive():
+        return
+    _stop_event.set()
+    _flush_thread.join(timeout=5)
+    _flush_thread = None
+    try:
+        flush_room_activity()
+    except Exception as e:
+        logger.error(f"room_activity: final flush failed: {e}")
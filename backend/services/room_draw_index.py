@@ -0,0 +1,133 @@
+# services/room_draw_index.py
+"""
+Room-scoped index of ``res-canvas-draw-{n}`` keys.
+
+The draw counter is global, so /getCanvasData used to pipeline a GET for
+every n in the counter range and only then filter by roomId. Each room now
+has a sorted set ``room-draw-ids:{roomId}`` of its draw keys scored by n,
+so a room read fetches just that room's keys with one ZRANGEBYSCORE.
+
+Writers add their key when they allocate it. Keys drawn before the index
+existed are picked up the first time a room is read through the legacy
+global scan: the scan indexes every drawing it decodes and then records in
+``room-draw-ids-from:{roomId}`` the lowest n it covered. The index is only
+trusted for ranges starting at or above that bound, so a key the scan could
+not decode or recover keeps the bound above it and is retried next read.
+"""
+
+import json
+import logging
+
+from services.db import redis_client
+
+logger = logging.getLogger(__name__)
+
+DRAW_KEY_PREFIX = "res-canvas-draw-"
+
+
+def _ids_key(room_id):
+    return f"room-draw-ids:{room_id}"
+
+
+def _covered_key(room_id):
+    return f"room-draw-ids-from:{room_id}"
+
+
+def _decode(v):
+    return v.decode("utf-8") if isinstance(v, (bytes, bytearray)) else str(v)
+
+
+def draw_number(key_id):
+    """Return n for ``res-canvas-draw-{n}``, or None for any other id."""
+    if not isinstance(key_id, str) or not key_id.startswith(DRAW_KEY_PREFIX):
+        return None
+    tail = key_id[len(DRAW_KEY_PREFIX):]
+    return int(tail) if tail.isdigit() else None
+
+
+def room_of_entry(entry, max_depth=4):
+    """Find the roomId of a cached draw entry, peeling nested ``value`` JSON."""
+    cur = entry
+    for _ in range(max_depth):
+        if isinstance(cur, (bytes, bytearray)):
+            cur = cur.decode("utf-8", errors="ignore")
+        if isinstance(cur, str):
+            try:
+                cur = json.loads(cur)
+            except Exception:
+                return None
+        if not isinstance(cur, dict):
+            return None
+        rid = cur.get("roomId")
+        if isinstance(rid, dict):
+            rid = rid.get("$oid") or rid.get("oid")
+        if rid:
+            return _decode(rid)
+        cur = cur.get("value")
+    return None
+
+
+def index_draw_keys(pairs):
+    """
+    Add ``(room_id, key_id)`` pairs to their rooms' indexes. Never raises;
+    returns False when the write failed.
+    """
+    pipe = None
+    try:
+        for room_id, key_id in pairs:
+            n = draw_number(key_id)
+            if not room_id or n is None:
+                continue
+            if pipe is None:
+                pipe = redis_client.pipeline(transaction=False)
+            pipe.zadd(_ids_key(room_id), {key_id: n})
+        if pipe is not None:
+            pipe.execute()
+        return True
+    except Exception:
+        logger.exception("room_draw_index: failed to index draw keys")
+        return False
+
+
+def index_draw_key(room_id, key_id):
+    index_draw_keys([(room_id, key_id)])
+
+
+def coverage_start(start_idx, failed_keys):
+    """
+    Lowest n a scan from ``start_idx`` can vouch for: just past the highest
+    key it failed to read, or ``start_idx`` when every key was indexed.
+    """
+    failed = [n for n in (draw_number(k) for k in failed_keys) if n is not None and n >= start_idx]
+    return max(failed) + 1 if failed else start_idx
+
+
+def mark_covered(room_id, start_idx):
+    """Record that the index holds every key of the room from ``start_idx`` on."""
+    try:
+        current = redis_client.get(_covered_key(room_id))
+        if current is None or int(current) > int(start_idx):
+            redis_client.set(_covered_key(room_id), int(start_idx))
+    except Exception:
+        logger.exception("room_draw_index: failed to mark room %s covered", room_id)
+
+
+def get_room_draw_keys(room_id, start_idx, end_idx):
+    """
+    Return the room's draw keys with start_idx <= n < end_idx ordered by n,
+    or None when the index does not cover the range yet.
+    """
+    try:
+        covered = redis_client.get(_covered_key(room_id))
+        if covered is None or int(covered) > int(start_idx):
+            return None
+        if end_idx <= start_idx:
+            return []
+        return [_decode(k) for k in redis_client.zrangebyscore(_ids_key(room_id), start_idx, end_idx - 1)]
+    except Exception as e:
+        logger.warning(f"room_draw_index: lookup failed for room {room_id}: {e}")
+        return None
+
+
+def drop(room_id):
+    redis_client.delete(_ids_key(room_id), _covered_key(room_id))
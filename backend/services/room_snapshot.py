@@ -0,0 +1,257 @@
+# services/room_snapshot.py
+"""
+Room snapshots: checkpoints of a room's resolved canvas state.
+
+Deciding which strokes are visible means combining the cut set, the room's
+undone index (services/undone_index.py) and the clear timestamp.
+A snapshot stores the result of that resolution for a room:
+
+    {"roomId", "epoch", "builtAt", "clearTs", "undoneIds": [...], "cutIds": [...],
+     "visibleIds": [...], "coveredTs", "coveredId"}
+
+``visibleIds`` are the room's post-clear strokes in the stroke index that are
+neither undone nor cut, up to and including the index row
+``(coveredTs, coveredId)``. The bound is the last row the snapshot resolved,
+taken from the index itself; rows within SNAPSHOT_SETTLE_MS of the newest
+row are left out so a writer still indexing a slightly older timestamp
+lands after the bound. A room read fetches the visible rows by id plus the
+rows after the bound (services.stroke_index), instead of every post-clear
+row. ``visibleIds`` is None when the room's index was not complete at build
+time. ``builtAt`` is only used to age snapshots out.
+
+Adding strokes never changes the resolved state, so a snapshot stays valid
+until an undo, redo, cut or clear bumps the room's epoch
+(``room-snapshot-epoch:{roomId}`` in Redis).
+
+Invalidated rooms are queued in ``room-snapshot:dirty`` and rebuilt by the
+checkpointer thread; a reader that finds a stale snapshot rebuilds it inline.
+"""
+
+import threading
+import time
+import logging
+
+from bson import ObjectId
+
+from services.db import redis_client, strokes_coll, rooms_coll, room_snapshots_coll
+from services.undone_index import get_undone_ids
+from services.stroke_index import READY_FIELD, find_room_stroke_keys
+
+logger = logging.getLogger(__name__)
+
+EPOCH_KEY_PREFIX = "room-snapshot-epoch:"
+DIRTY_SET_KEY = "room-snapshot:dirty"
+
+# Checkpointer configuration
+SNAPSHOT_INTERVAL_SECONDS = 15
+SNAPSHOT_BATCH_SIZE = 20
+# Rebuild regardless of epoch after this long, in case Redis state was lost
+SNAPSHOT_MAX_AGE_SECONDS = 300
+# Index rows this close to the room's newest row are read past the bound
+SNAPSHOT_SETTLE_MS = 5000
+
+_snapshot_thread = None
+_stop_event = threading.Event()
+
+
+def _decode(v):
+    return v.decode("utf-8") if isinstance(v, (bytes, bytearray)) else str(v)
+
+
+def current_epoch(room_id):
+    raw = redis_client.get(f"{EPOCH_KEY_PREFIX}{room_id}")
+    return int(_decode(raw)) if raw else 0
+
+
+def invalidate_snapshot(room_id, pipe=None):
+    """
+    Mark the room's snapshot stale after an undo, redo, cut or clear and
+    queue it for the checkpointer. Never raises on its own; with ``pipe`` the
+    writes are only queued and fail with the caller's execute().
+    """
+    if pipe is not None:
+        pipe.incr(f"{EPOCH_KEY_PREFIX}{room_id}")
+        pipe.sadd(DIRTY_SET_KEY, room_id)
+        return
+    try:
+        redis_client.incr(f"{EPOCH_KEY_PREFIX}{room_id}")
+        redis_client.sadd(DIRTY_SET_KEY, room_id)
+    except Exception:
+        logger.exception("room_snapshot: failed to invalidate snapshot for room %s", room_id)
+
+
+def _load_cut_ids(room_id):
+    try:
+        return set(_decode(x) for x in (redis_client.smembers(f"cut-stroke-ids:{room_id}") or set()))
+    except Exception as e:
+        logger.warning(f"Failed to get cut stroke IDs: {e}")
+        return set()
+
+
+def _load_clear_ts(room_id):
+    try:
+        raw = redis_client.get(f"last-clear-ts:{room_id}")
+    except Exception:
+        raw = None
+    if raw:
+        try:
+            return int(_decode(raw))
+        except Exception:
+            return 0
+    try:
+        blk = strokes_coll.find_one({"asset.data.type": "clear_marker", "asset.data.roomId": room_id}, sort=[("_id", -1)])
+        if blk:
+            asset = (blk.get("asset") or {}).get("data", {})
+            cand = asset.get("ts") or asset.get("timestamp") or asset.get("value")
+            return int(cand) if cand is not None else 0
+    except Exception:
+        pass
+    return 0
+
+
+def resolve_room_state(room_id):
+    """Resolve the visibility state of a room from Redis and Mongo markers."""
+    return {
+        "undoneIds": get_undone_ids(room_id),
+        "cutIds": _load_cut_ids(room_id),
+        "clearTs": _load_clear_ts(room_id),
+    }
+
+
+def _index_ready(room_id):
+    try:
+        room = rooms_coll.find_one({"_id": ObjectId(room_id)}, {READY_FIELD: 1})
+    except Exception:
+        return False
+    return bool(room and room.get(READY_FIELD))
+
+
+def resolve_visible_strokes(room_id, state):
+    """
+    Resolve the visible post-clear stroke ids of an indexed room. Returns
+    ``{"visibleIds", "coveredTs", "coveredId"}``, with ``visibleIds`` None
+    when the room's stroke index is not complete.
+    """
+    clear_ts = state["clearTs"]
+    if not _index_ready(room_id):
+        return {"visibleIds": None, "coveredTs": clear_ts, "coveredId": ""}
+    keys = find_room_stroke_keys(room_id, after_ts=clear_ts)
+    if keys:
+        settled = keys[-1][0] - SNAPSHOT_SETTLE_MS
+        keys = [k for k in keys if k[0] <= settled]
+    if not keys:
+        return {"visibleIds": [], "coveredTs": clear_ts, "coveredId": ""}
+    hidden = state["undoneIds"] | state["cutIds"]
+    covered_ts, covered_id = keys[-1]
+    return {
+        "visibleIds": [sid for _, sid in keys if sid not in hidden],
+        "coveredTs": covered_ts,
+        "coveredId": covered_id,
+    }
+
+
+def build_snapshot(room_id):
+    """Resolve the room's state, store it as the room snapshot and return it."""
+    epoch = current_epoch(room_id)
+    state = resolve_room_state(room_id)
+    try:
+        state.update(resolve_visible_strokes(room_id, state))
+    except Exception:
+        logger.exception("room_snapshot: failed to resolve visible strokes for room %s", room_id)
+        state.update({"visibleIds": None, "coveredTs": state["clearTs"], "coveredId": ""})
+    try:
+        room_snapshots_coll.replace_one(
+            {"roomId": room_id},
+            {
+                "roomId": room_id,
+                "epoch": epoch,
+                "builtAt": int(time.time() * 1000),
+                "clearTs": state["clearTs"],
+                "undoneIds": sorted(state["undoneIds"]),
+                "cutIds": sorted(state["cutIds"]),
+                "visibleIds": state["visibleIds"],
+                "coveredTs": state["coveredTs"],
+                "coveredId": state["coveredId"],
+            },
+            upsert=True
+        )
+    except Exception:
+        logger.exception("room_snapshot: failed to store snapshot for room %s", room_id)
+    return state
+
+
+def load_room_state(room_id):
+    """
+    Return ``{"undoneIds", "cutIds", "clearTs", "visibleIds", "coveredTs",
+    "coveredId"}`` for a room, served from its snapshot when the snapshot is
+    current and rebuilt otherwise.
+    """
+    try:
+        epoch = current_epoch(room_id)
+        snap = room_snapshots_coll.find_one({"roomId": room_id})
+    except Exception:
+        logger.warning("room_snapshot: snapshot lookup failed for room %s", room_id)
+        state = resolve_room_state(room_id)
+        state.update({"visibleIds": None, "coveredTs": state["clearTs"], "coveredId": ""})
+        return state
+    fresh = snap and (time.time() * 1000 - int(snap.get("builtAt") or 0)) < SNAPSHOT_MAX_AGE_SECONDS * 1000
+    if fresh and snap.get("epoch") == epoch:
+        clear_ts = int(snap.get("clearTs") or 0)
+        return {
+            "undoneIds": set(snap.get("undoneIds") or []),
+            "cutIds": set(snap.get("cutIds") or []),
+            "clearTs": clear_ts,
+            "visibleIds": snap.get("visibleIds"),
+            "coveredTs": int(snap.get("coveredTs") or clear_ts),
+            "coveredId": snap.get("coveredId") or "",
+        }
+    return build_snapshot(room_id)
+
+
+def delete_snapshot(room_id):
+    try:
+        room_snapshots_coll.delete_one({"roomId": room_id})
+        redis_client.delete(f"{EPOCH_KEY_PREFIX}{room_id}")
+        redis_client.srem(DIRTY_SET_KEY, room_id)
+    except Exception:
+        logger.exception("room_snapshot: failed to delete snapshot for room %s", room_id)
+
+
+def _snapshot_worker_loop():
+    """Rebuild snapshots for rooms invalidated since the last pass."""
+    time.sleep(2)
+    logger.info(f"Room snapshot checkpointer started: INTERVAL={SNAPSHOT_INTERVAL_SECONDS}s, BATCH_SIZE={SNAPSHOT_BATCH_SIZE}")
+    while not _stop_event.is_set():
+        try:
+            for _ in range(SNAPSHOT_BATCH_SIZE):
+                room_id = redis_client.spop(DIRTY_SET_KEY)
+                if not room_id:
+                    break
+                build_snapshot(_decode(room_id))
+        except Exception as e:
+            logger.error(f"Error in room snapshot checkpointer: {e}")
+        _stop_event.wait(SNAPSHOT_INTERVAL_SECONDS)
+    logger.info("Room snapshot checkpointer stopped")
+
+
+def start_snapshot_worker():
+    global _snapshot_thread
+    if _snapshot_thread is not None and _snapshot_thread.is_alive():
+        logger.warning("Room snapshot checkpointer already running")
+        return
+    _stop_event.clear()
+    _snapshot_thread = threading.Thread(
+        target=_snapshot_worker_loop,
+        name="RoomSnapshotCheckpointer",
+        daemon=True
+    )
+    _snapshot_thread.start()
+
+
+def stop_snapshot_worker():
+    global _snapshot_thread
+    if _snapshot_thread is None or not _snapshot_thread.is_alive():
+        return
+    _stop_event.set()
+    _snapshot_thread.join(timeout=5)
+    _snapshot_thread = None
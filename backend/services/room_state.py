@@ -0,0 +1,163 @@
+# services/room_state.py
+"""
+In-process cache of per-room canvas state, invalidated through Redis pub/sub.
+
+/getCanvasData needs, on every call, the room's effective clear timestamp,
+the draw count recorded at the last clear and the undo/redo marker state.
+Resolving those falls back to Mongo marker lookups whenever Redis misses.
+This module caches the resolved state per room in process memory:
+
+    {"version", "clearTs", "drawCountAtClear", "undoEpoch", "undoneIds"}
+
+``version`` is the sum of the room's and the global bump counters;
+``undoEpoch`` is the global counter, which legacy undo/redo (global
+``undo-*``/``redo-*`` markers) and global clears advance.
+
+Writers (clears, undo/redo) call bump_room_state(), which increments
+``room-state-version:{roomId}`` and publishes on ROOM_STATE_CHANNEL. Each
+process runs a listener thread that drops its cached entry when a bump is
+announced. A hot read costs one MGET of the two version counters: a cached
+entry is served only while its ``version`` still matches, so a bump whose
+message was lost is seen on the next read rather than after the TTL. Entries
+also expire after STATE_MAX_AGE_SECONDS, which bounds staleness when the
+counters cannot be read, and nothing is cached while the listener is down.
+"""
+
+import json
+import threading
+import time
+import logging
+
+from services.db import redis_client
+
+logger = logging.getLogger(__name__)
+
+ROOM_STATE_CHANNEL = "room-state-invalidate"
+VERSION_KEY_PREFIX = "room-state-version:"
+ALL_ROOMS = "*"
+STATE_MAX_AGE_SECONDS = 30
+
+_cache = {}
+_cache_lock = threading.Lock()
+_listener_thread = None
+_listener_ready = threading.Event()
+# Incremented on every drop so a load racing with a bump is not cached
+_generation = 0
+
+
+def _version_key(room_id):
+    return f"{VERSION_KEY_PREFIX}{room_id or ''}"
+
+
+def _read_versions(key):
+    """Return ``(room_version, global_version)``, or None when Redis fails."""
+    try:
+        room_version, global_version = redis_client.mget([_version_key(key), _version_key(ALL_ROOMS)])
+        return int(room_version or 0), int(global_version or 0)
+    except Exception as e:
+        logger.warning(f"room_state: failed to read version counters for {key}: {e}")
+        return None
+
+
+def _listen():
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(ROOM_STATE_CHANNEL)
+            _listener_ready.set()
+            for message in pubsub.listen():
+                try:
+                    data = json.loads(message["data"])
+                    _drop(data.get("roomId"))
+                except Exception:
+                    continue
+        except Exception as e:
+            logger.warning(f"room_state: invalidation listener disconnected: {e}")
+        # Anything cached may have missed an invalidation while disconnected
+        _listener_ready.clear()
+        _drop(ALL_ROOMS)
+        time.sleep(2)
+
+
+def _ensure_listener():
+    global _listener_thread
+    if _listener_thread is not None and _listener_thread.is_alive():
+        return
+    with _cache_lock:
+        if _listener_thread is not None and _listener_thread.is_alive():
+            return
+        _listener_thread = threading.Thread(target=_listen, name="RoomStateListener", daemon=True)
+        _listener_thread.start()
+
+
+def _drop(room_id):
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        if room_id == ALL_ROOMS:
+            _cache.clear()
+        else:
+            _cache.pop(room_id or "", None)
+
+
+def bump_room_state(room_id=None):
+    """
+    Announce that a room's state changed. ``room_id=None`` bumps every room
+    (global clears and legacy global undo/redo markers). Never raises.
+    """
+    target = room_id or ALL_ROOMS
+    try:
+        version = redis_client.incr(_version_key(target))
+        redis_client.publish(ROOM_STATE_CHANNEL, json.dumps({"roomId": target, "version": version}))
+    except Exception:
+        logger.exception("room_state: failed to publish state bump for %s", target)
+    _drop(target)
+
+
+def get_room_state(room_id, loader):
+    """
+    Return the cached state for ``room_id``, calling ``loader(room_id)`` to
+    resolve it on a miss. ``loader`` returns a dict of state fields.
+    """
+    _ensure_listener()
+    key = room_id or ""
+    now = time.time()
+    with _cache_lock:
+        entry = _cache.get(key)
+        generation = _generation
+
+    # Read the counters before loading so a bump racing with the load leaves
+    # the entry behind the counter and the next read reloads it
+    versions = _read_versions(key)
+    if entry and now - entry["cachedAt"] < STATE_MAX_AGE_SECONDS:
+        if versions is None or sum(versions) == entry["state"]["version"]:
+            return entry["state"]
+
+    room_version, global_version = versions or (0, 0)
+    state = dict(loader(room_id))
+    state["version"] = room_version + global_version
+    state["undoEpoch"] = global_version
+    if _listener_ready.is_set():
+        with _cache_lock:
+            if generation == _generation:
+                _cache[key] = {"cachedAt": now, "state": state}
+    return state
+
+
+_STATE_MARKER_PREFIXES = ("undo-", "redo-", "clear-canvas-timestamp", "draw_count_clear_canvas", "res-canvas-draw-count:")
+
+
+def bump_for_mirrored_blocks(blocks):
+    """Bump state when mirrored ResilientDB blocks carry clear or undo/redo markers."""
+    for block in blocks or []:
+        for txn in block.get("transactions") or []:
+            try:
+                value = txn.get("value")
+                if isinstance(value, str):
+                    value = json.loads(value)
+                aid = str(((value.get("asset") or {}).get("data") or {}).get("id") or "")
+            except Exception:
+                continue
+            if aid.startswith(_STATE_MARKER_PREFIXES):
+                bump_room_state()
+                return
@@ -0,0 +1,102 @@
+# services/stroke_cache.py
+"""
+Per-room Redis cache of recently posted strokes.
+
+Each stroke is stored under ``stroke:{roomId}:{strokeId}`` and its id is
+indexed in the room's sorted set ``stroke-ids:{roomId}`` scored by ts, so a
+reader fetches a room's cached strokes with one ZRANGE and one MGET instead
+of SCANning the whole keyspace. Entries expire after STROKE_CACHE_TTL_SECONDS,
+by which time the stroke is long persisted in Mongo; the sorted set is
+trimmed by score on read.
+"""
+
+import json
+import time
+import logging
+
+from services.db import redis_client
+
+logger = logging.getLogger(__name__)
+
+STROKE_CACHE_TTL_SECONDS = 3600
+
+
+def _ids_key(room_id):
+    return f"stroke-ids:{room_id}"
+
+
+def _stroke_key(room_id, stroke_id):
+    return f"stroke:{room_id}:{stroke_id}"
+
+
+def _entry(room_id, stroke):
+    return {
+        "id": stroke["id"],
+        "roomId": room_id,
+        "ts": stroke["ts"],
+        "user": stroke.get("user"),
+        "stroke": stroke,
+        "undone": False
+    }
+
+
+def cache_strokes(room_id, strokes, pipe=None):
+    """
+    Cache strokes and index them in the room's sorted set in one round trip.
+    When ``pipe`` is given the commands are queued on it for the caller to
+    execute.
+    """
+    if not strokes:
+        return
+    own_pipe = pipe is None
+    if own_pipe:
+        pipe = redis_client.pipeline(transaction=False)
+    for stroke in strokes:
+        pipe.set(_stroke_key(room_id, stroke["id"]), json.dumps(_entry(room_id, stroke)), ex=STROKE_CACHE_TTL_SECONDS)
+    pipe.zadd(_ids_key(room_id), {str(stroke["id"]): stroke["ts"] for stroke in strokes})
+    pipe.expire(_ids_key(room_id), STROKE_CACHE_TTL_SECONDS)
+    if own_pipe:
+        pipe.execute()
+
+
+def cache_stroke(room_id, stroke, pipe=None):
+    cache_strokes(room_id, [stroke], pipe=pipe)
+
+
+def get_cached_strokes(room_id):
+    """Return the room's cached stroke entries ordered by ts."""
+    ids_key = _ids_key(room_id)
+    cutoff_ms = int((time.time() - STROKE_CACHE_TTL_SECONDS) * 1000)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zremrangebyscore(ids_key, "-inf", cutoff_ms)
+    pipe.zrange(ids_key, 0, -1)
+    _, ids = pipe.execute()
+    if not ids:
+        return []
+    ids = [i.decode("utf-8") if isinstance(i, (bytes, bytearray)) else str(i) for i in ids]
+    values = redis_client.mget([_stroke_key(room_id, sid) for sid in ids])
+
+    entries = []
+    expired = []
+    for sid, raw in zip(ids, values):
+        if raw is None:
+            expired.append(sid)
+            continue
+        try:
+            entries.append(json.loads(raw if isinstance(raw, str) else raw.decode("utf-8")))
+        except Exception as e:
+            logger.warning(f"Failed to parse cached stroke {sid}: {e}")
+    if expired:
+        try:
+            redis_client.zrem(ids_key, *expired)
+        except Exception:
+            pass
+    return entries
+
+
+def drop_room_cache(room_id):
+    """Remove a room's cached strokes and their index."""
+    ids_key = _ids_key(room_id)
+    ids = redis_client.zrange(ids_key, 0, -1)
+    keys = [_stroke_key(room_id, i.decode("utf-8") if isinstance(i, (bytes, bytearray)) else str(i)) for i in ids]
+    redis_client.delete(ids_key, *keys)
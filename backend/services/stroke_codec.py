@@ -0,0 +1,236 @@
+# services/stroke_codec.py
+"""
+Compact binary plaintext for encrypted strokes.
+
+Encrypted strokes used to be ``json.dumps(stroke)``. With the binary blob
+envelope (see crypto_service.encrypt_stroke) the plaintext is a BSON
+document instead, encoded and decoded by pymongo's C extension, and a
+freehand ``pathData`` list of ``{"x", "y"}`` points is packed into one
+little-endian array: int32 pairs when every coordinate is integral,
+float64 pairs otherwise. Both are lossless; any other pathData shape (cut
+records, shapes, points with extra keys) is stored as-is.
+
+It also holds the packed ``pathData`` transport the room stroke API returns
+on ``?pathData=packed``:
+
+    {"enc": "d16" | "d32", "scale": S, "n": N, "o": [x0, y0], "data": b64}
+
+Coordinates are sent as ``round(v * S)`` with S the smallest power of ten up
+to MAX_PATHDATA_SCALE for which ``round(v * S) / S == v`` holds for every
+coordinate, so unpacking is exact; a path no such S reproduces is sent as
+plain points. The first point is kept in ``o`` and the remaining N-1 points
+are little-endian int16 (or int32) x/y deltas. Decoding, validation and
+bounding boxes run on ``array``/``itertools.accumulate`` over the whole
+buffer instead of walking point dicts. Stored strokes keep the pathData the
+client sent, which is what its wallet signature covers.
+"""
+
+import base64
+import math
+import struct
+import sys
+from array import array
+from itertools import accumulate
+
+import bson
+from bson.binary import Binary
+
+PACKED_POINTS_KEY = "_pts"
+PACKED_TYPE_KEY = "_t"
+
+_INT32_MIN, _INT32_MAX = -(2 ** 31), 2 ** 31 - 1
+_INT16_MIN, _INT16_MAX = -(2 ** 15), 2 ** 15 - 1
+
+MAX_PATHDATA_SCALE = 10 ** 6
+MAX_PATH_POINTS = 100000
+_PACKED_TYPECODES = {"d16": "h", "d32": "i"}
+
+
+def pack_points(path):
+    """Return ``{"_pts": Binary, "_t": "i"|"d"}`` for a list of x/y points, else None."""
+    if not isinstance(path, list) or not path:
+        return None
+    flat = []
+    integral = True
+    for p in path:
+        if not isinstance(p, dict) or len(p) != 2:
+            return None
+        x, y = p.get("x"), p.get("y")
+        for v in (x, y):
+            if isinstance(v, bool) or not isinstance(v, (int, float)):
+                return None
+            if integral and not (isinstance(v, int) and _INT32_MIN <= v <= _INT32_MAX):
+                integral = False
+        flat.append(x)
+        flat.append(y)
+    typecode = "i" if integral else "d"
+    return {PACKED_POINTS_KEY: Binary(struct.pack(f"<{len(flat)}{typecode}", *flat)), PACKED_TYPE_KEY: typecode}
+
+
+def unpack_points(packed):
+    """Inverse of pack_points()."""
+    typecode = packed.get(PACKED_TYPE_KEY, "d")
+    data = bytes(packed[PACKED_POINTS_KEY])
+    flat = struct.unpack(f"<{len(data) // struct.calcsize(typecode)}{typecode}", data)
+    return [{"x": flat[i], "y": flat[i + 1]} for i in range(0, len(flat), 2)]
+
+
+def encode_stroke(stroke):
+    """Serialize a stroke dict to compact BSON bytes."""
+    doc = dict(stroke)
+    packed = pack_points(doc.get("pathData"))
+    if packed is not None:
+        doc["pathData"] = packed
+    return bson.encode(doc)
+
+
+def decode_stroke_bytes(data):
+    """Inverse of encode_stroke()."""
+    doc = bson.decode(bytes(data))
+    path = doc.get("pathData")
+    if isinstance(path, dict) and PACKED_POINTS_KEY in path:
+        doc["pathData"] = unpack_points(path)
+    return doc
+
+
+def is_packed_path(path):
+    return isinstance(path, dict) and path.get("enc") in _PACKED_TYPECODES
+
+
+def _exact_scale(values):
+    """Smallest power-of-ten scale that represents every value exactly, else None."""
+    if not all(math.isfinite(v) for v in values):
+        return None
+    scale = 1
+    while scale <= MAX_PATHDATA_SCALE:
+        if all(round(v * scale) / scale == v for v in values):
+            return scale
+        scale *= 10
+    return None
+
+
+def pack_path(path):
+    """
+    Pack a list of ``{"x", "y"}`` points into the transport form above.
+    Returns None when ``path`` is not a plain point list or cannot be packed
+    without losing precision.
+    """
+    if not isinstance(path, list) or not path:
+        return None
+    xs, ys = [], []
+    for p in path:
+        if not isinstance(p, dict) or len(p) != 2:
+            return None
+        x, y = p.get("x"), p.get("y")
+        if isinstance(x, bool) or isinstance(y, bool) or not isinstance(x, (int, float)) or not isinstance(y, (int, float)):
+            return None
+        xs.append(x)
+        ys.append(y)
+    scale = _exact_scale(xs + ys)
+    if scale is None:
+        return None
+    qx = [round(v * scale) for v in xs]
+    qy = [round(v * scale) for v in ys]
+    deltas = []
+    for i in range(1, len(qx)):
+        deltas.append(qx[i] - qx[i - 1])
+        deltas.append(qy[i] - qy[i - 1])
+    enc = "d16" if all(_INT16_MIN <= d <= _INT16_MAX for d in deltas) else "d32"
+    if enc == "d32" and not all(_INT32_MIN <= d <= _INT32_MAX for d in deltas):
+        return None
+    buf = array(_PACKED_TYPECODES[enc], deltas)
+    if sys.byteorder == "big":
+        buf.byteswap()
+    return {"enc": enc, "scale": scale, "n": len(qx), "o": [qx[0], qy[0]],
+            "data": base64.b64encode(buf.tobytes()).decode("ascii")}
+
+
+def _packed_xy(packed):
+    """Quantized (xs, ys) of a packed path. Raises ValueError if malformed."""
+    try:
+        typecode = _PACKED_TYPECODES[packed["enc"]]
+        n = int(packed["n"])
+        x0, y0 = (int(v) for v in packed["o"])
+        raw = base64.b64decode(packed.get("data") or "", validate=True)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"malformed packed pathData: {e}")
+    if n < 1 or n > MAX_PATH_POINTS:
+        raise ValueError("packed pathData has an invalid point count")
+    deltas = array(typecode)
+    if len(raw) != (n - 1) * 2 * deltas.itemsize:
+        raise ValueError("packed pathData length does not match point count")
+    deltas.frombytes(raw)
+    if sys.byteorder == "big":
+        deltas.byteswap()
+    xs = list(accumulate(deltas[0::2], initial=x0))
+    ys = list(accumulate(deltas[1::2], initial=y0))
+    return xs, ys
+
+
+def path_arrays(path):
+    """Return (xs, ys) for a packed path or a list of ``{x, y}`` / ``[x, y]`` points, else ([], [])."""
+    if is_packed_path(path):
+        xs, ys = _packed_xy(path)
+        scale = path.get("scale") or 1
+        if scale != 1:
+            xs = [v / scale for v in xs]
+            ys = [v / scale for v in ys]
+        return xs, ys
+    if isinstance(path, list):
+        pts = [(p["x"], p["y"]) if isinstance(p, dict) else p for p in path
+               if (isinstance(p, dict) and "x" in p and "y" in p) or (isinstance(p, (list, tuple)) and len(p) >= 2)]
+        try:
+            return [float(p[0]) for p in pts], [float(p[1]) for p in pts]
+        except (TypeError, ValueError):
+            return [], []
+    return [], []
+
+
+def path_bbox(path):
+    """(min_x, min_y, max_x, max_y) of a packed or plain point path, or None."""
+    xs, ys = path_arrays(path)
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def unpack_path(packed):
+    """Inverse of pack_path(): the list of ``{"x", "y"}`` points."""
+    xs, ys = path_arrays(packed)
+    if (packed.get("scale") or 1) == 1:
+        return [{"x": int(x), "y": int(y)} for x, y in zip(xs, ys)]
+    return [{"x": x, "y": y} for x, y in zip(xs, ys)]
+
+
+def validate_path(path):
+    """Validate a packed path (whole buffer at once). Returns (ok, error)."""
+    if not is_packed_path(path):
+        return False, "pathData is not a packed path"
+    try:
+        _packed_xy(path)
+    except ValueError as e:
+        return False, str(e)
+    scale = path.get("scale")
+    if not isinstance(scale, int) or isinstance(scale, bool) or scale < 1:
+        return False, "packed pathData scale must be a positive integer"
+    return True, None
+
+
+def stroke_for_client(stroke, packed):
+    """
+    Return ``stroke`` with pathData in the caller's format: packed when
+    ``packed`` is true, plain points otherwise. The stored dict is not modified.
+    """
+    path = stroke.get("pathData")
+    if packed:
+        if isinstance(path, list):
+            packed_path = pack_path(path)
+            if packed_path is not None:
+                return {**stroke, "pathData": packed_path}
+        return stroke
+    if is_packed_path(path):
+        try:
+            return {**stroke, "pathData": unpack_path(path)}
+        except ValueError:
+            return stroke
+    return stroke
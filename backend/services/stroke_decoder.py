@@ -0,0 +1,182 @@
+# services/stroke_decoder.py
+"""
+Single-pass decoder for stroke documents in the strokes collection.
+
+Strokes are stored in five shapes:
+
+    {roomId, ts, stroke: {...}}                        plaintext room stroke
+    {roomId, ts, blob: {nonce, ct}}                    encrypted room stroke
+    {asset: {data: {stroke | encrypted | value}}}      direct asset
+    {transactions: [{value: {asset: {data: ...}}}]}    ResilientDB mirror block
+    {value: "<json>" | {...}}                          legacy string-encoded value
+
+decode_stroke() picks the decoder for the first shape key present and walks
+only that branch, parsing each nested JSON string once, so read paths no
+longer try every shape under a try/except cascade. Only the timestamp is
+normalized (coerce_ts); payloads are not deep-copied.
+"""
+
+import json
+
+
+def loads_json(value):
+    """Parse bytes/str JSON, peeling double-encoded strings. Returns None if not JSON."""
+    while isinstance(value, (bytes, bytearray, str)):
+        if isinstance(value, (bytes, bytearray)):
+            value = value.decode("utf-8")
+        try:
+            value = json.loads(value)
+        except (ValueError, TypeError):
+            return None
+    return value
+
+
+def coerce_ts(value):
+    """Return an int timestamp from int/float/str/bytes/{"$numberLong"} values, else None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    if isinstance(value, dict):
+        value = value.get("$numberLong", value.get("$numberInt"))
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8", errors="ignore")
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                return int(float(value))
+            except ValueError:
+                return None
+    return None
+
+
+def _decrypt(bundle, room_key):
+    if room_key is None or not isinstance(bundle, (dict, bytes, bytearray)):
+        return None
+    # Imported here so plaintext-only readers (analytics, marker lookups) do
+    # not resolve the room master key at import time.
+    from services.crypto_service import decrypt_stroke
+    try:
+        stroke = decrypt_stroke(room_key, bundle)
+    except Exception:
+        return None
+    return stroke if isinstance(stroke, dict) else None
+
+
+def decode_asset(data, room_key=None, allow_value=True):
+    """
+    Decode an ``asset.data`` dict into its stroke, or None. Marker assets
+    (undo/redo/clear/delete) never decode to a stroke. ``allow_value``
+    accepts a string-encoded ``value`` payload.
+    """
+    if not isinstance(data, dict):
+        return None
+    if str(data.get("type") or "").endswith("_marker"):
+        return None
+    stroke = data.get("stroke")
+    if isinstance(stroke, dict):
+        return stroke
+    if "encrypted" in data:
+        return _decrypt(data["encrypted"], room_key)
+    if allow_value and isinstance(data.get("value"), (str, bytes, bytearray)):
+        value = loads_json(data["value"])
+        return value if isinstance(value, dict) else None
+    return None
+
+
+def iter_assets(doc):
+    """Yield every ``asset.data`` dict carried by a document, in storage order."""
+    asset = doc.get("asset")
+    if isinstance(asset, dict) and isinstance(asset.get("data"), dict):
+        yield asset["data"]
+    for txn in doc.get("transactions") or ():
+        if not isinstance(txn, dict):
+            continue
+        value = txn.get("value")
+        if isinstance(value, (str, bytes, bytearray)):
+            value = loads_json(value)
+        if not isinstance(value, dict):
+            continue
+        asset = value.get("asset")
+        if isinstance(asset, dict) and isinstance(asset.get("data"), dict):
+            yield asset["data"]
+
+
+def _from_stroke(doc, room_key):
+    stroke = doc["stroke"]
+    return stroke if isinstance(stroke, dict) else None
+
+
+def _from_blob(doc, room_key):
+    return _decrypt(doc["blob"], room_key)
+
+
+def _from_transactions(doc, room_key):
+    txns = doc["transactions"]
+    if not txns or not isinstance(txns, list) or not isinstance(txns[0], dict):
+        return None
+    value = txns[0].get("value")
+    if isinstance(value, (str, bytes, bytearray)):
+        value = loads_json(value)
+    if not isinstance(value, dict):
+        return None
+    # Mirrored undo/redo markers carry the stroke as ``value``; only a
+    # ``stroke`` or ``encrypted`` payload is a stroke here.
+    stroke = decode_asset((value.get("asset") or {}).get("data"), room_key, allow_value=False)
+    if stroke is not None and "timestamp" in stroke:
+        stroke["ts"] = stroke["timestamp"]
+    return stroke
+
+
+def _from_asset(doc, room_key):
+    asset = doc["asset"]
+    return decode_asset(asset.get("data"), room_key) if isinstance(asset, dict) else None
+
+
+def _from_value(doc, room_key):
+    value = doc["value"]
+    if isinstance(value, (str, bytes, bytearray)):
+        value = loads_json(value)
+    if not isinstance(value, dict):
+        return None
+    if isinstance(value.get("asset"), dict):
+        return decode_asset(value["asset"].get("data"), room_key)
+    return value
+
+
+# Shape key -> decoder, in detection order
+_DECODERS = (
+    ("stroke", _from_stroke),
+    ("blob", _from_blob),
+    ("transactions", _from_transactions),
+    ("asset", _from_asset),
+    ("value", _from_value),
+)
+
+
+def detect_shape(doc):
+    """Return the storage shape key of a document, or None."""
+    for key, _ in _DECODERS:
+        if key in doc:
+            return key
+    return None
+
+
+def decode_stroke(doc, room_key=None):
+    """
+    Return the stroke dict stored in ``doc`` or None. Encrypted shapes are
+    decrypted with ``room_key`` and skipped without one. A shape that holds
+    no stroke (e.g. a mirrored marker) falls through to the next shape key.
+    """
+    if not isinstance(doc, dict):
+        return None
+    for key, decoder in _DECODERS:
+        if key in doc:
+            stroke = decoder(doc, room_key)
+            if stroke is not None:
+                return stroke
+    return None
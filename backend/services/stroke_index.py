@@ -0,0 +1,345 @@
+# services/stroke_index.py
+"""
+Per-room materialized stroke index.
+
+The ``strokes`` collection holds every shape a stroke can arrive in (direct
+inserts, encrypted blobs, ResilientDB mirror blocks with
+``transactions[].value.asset.data``), so loading a room from it needs an
+``$or`` that cannot use the ``(roomId, ts)`` index plus per-shape decoding.
+
+``stroke_index`` keeps one normalized row per ``(roomId, strokeId)``:
+
+    {"roomId", "strokeId", "ts", "user", "stroke": {...}}   # public rooms
+    {"roomId", "strokeId", "ts", "user", "blob": {...}}     # private/secure
+
+Encrypted rooms keep their ciphertext in the index; only the stroke id and
+timestamp are stored in the clear. Rows are written by the stroke routes and
+by the sync mirror, and a room is read back with a single range query on
+``(roomId, ts, strokeId)``. Rooms that predate the index are backfilled on
+first read and flagged with ``strokeIndexReady`` on their room document.
+If an API write cannot be indexed after INDEX_WRITE_ATTEMPTS tries, the
+flag is cleared so the next read backfills the room from ``strokes``.
+"""
+
+import json
+import time
+import logging
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from services.db import stroke_index_coll, strokes_coll, rooms_coll
+from services.crypto_service import unwrap_room_key, decrypt_stroke
+from services.commit_ledger import record_new_commits
+
+logger = logging.getLogger(__name__)
+
+READY_FIELD = "strokeIndexReady"
+INDEX_WRITE_ATTEMPTS = 3
+INDEX_RETRY_DELAY_SECONDS = 0.05
+
+
+def legacy_room_query(room_id):
+    """The pre-index query matching every stroke shape stored for a room."""
+    return {
+        "$or": [
+            {"roomId": room_id},
+            {"transactions.value.asset.data.roomId": room_id},
+            {"transactions.value.asset.data.roomId": [room_id]},
+            {"transactions.value.asset.data.roomId": {"$in": [room_id]}}
+        ]
+    }
+
+
+def _to_int(v):
+    try:
+        if isinstance(v, dict) and "$numberLong" in v:
+            return int(v["$numberLong"])
+        if isinstance(v, (bytes, bytearray)):
+            return int(v.decode())
+        return int(v) if v is not None else None
+    except Exception:
+        return None
+
+
+def make_row(room_id, stroke, blob=None):
+    """
+    Build an index row from a decoded stroke. When ``blob`` is given the row
+    stores the ciphertext instead of the stroke body.
+    """
+    if not isinstance(stroke, dict):
+        return None
+    stroke_id = stroke.get("id") or stroke.get("drawingId")
+    ts = _to_int(stroke.get("ts") or stroke.get("timestamp"))
+    if not stroke_id or ts is None:
+        return None
+    row = {"roomId": room_id, "strokeId": str(stroke_id), "ts": ts, "user": stroke.get("user")}
+    if blob is not None:
+        row["blob"] = blob
+    else:
+        row["stroke"] = stroke
+    return row
+
+
+def row_from_asset(room_id, asset_data, room_key=None):
+    """
+    Build an index row from a ResilientDB asset payload
+    (``{"roomId", "type", "stroke"}`` or ``{"roomId", "type", "encrypted"}``).
+    Encrypted payloads need ``room_key`` to recover the stroke id and ts.
+    """
+    if not isinstance(asset_data, dict):
+        return None
+    if "stroke" in asset_data:
+        return make_row(room_id, asset_data["stroke"])
+    if "encrypted" in asset_data:
+        if room_key is None:
+            return None
+        stroke = decrypt_stroke(room_key, asset_data["encrypted"])
+        return make_row(room_id, stroke, blob=asset_data["encrypted"])
+    return None
+
+
+def row_from_doc(doc, room_id, room_key=None):
+    """Build an index row from any stroke document shape in ``strokes``."""
+    if not isinstance(doc, dict):
+        return None
+    txns = doc.get("transactions")
+    if isinstance(txns, list) and txns:
+        try:
+            row = row_from_asset(room_id, txns[0]["value"]["asset"]["data"], room_key)
+            if row is not None:
+                return row
+        except (KeyError, IndexError, TypeError):
+            pass
+    if "blob" in doc:
+        if room_key is None:
+            return None
+        stroke = decrypt_stroke(room_key, doc["blob"])
+        if stroke.get("ts") is None:
+            stroke["ts"] = doc.get("ts")
+        return make_row(room_id, stroke, blob=doc["blob"])
+    if "stroke" in doc:
+        return make_row(room_id, doc["stroke"])
+    asset = (doc.get("asset") or {}).get("data")
+    if isinstance(asset, dict):
+        return row_from_asset(room_id, asset, room_key)
+    return None
+
+
+def _upsert_op(row):
+    # First writer wins: the write path indexes a stroke before its mirror
+    # block arrives, and the mirror must not overwrite the server timestamp.
+    body = {k: v for k, v in row.items() if k not in ("roomId", "strokeId")}
+    return UpdateOne(
+        {"roomId": row["roomId"], "strokeId": row["strokeId"]},
+        {"$setOnInsert": body},
+        upsert=True
+    )
+
+
+def index_rows(rows):
+    """Bulk upsert prepared rows. Returns the number of rows submitted."""
+    ops = [_upsert_op(r) for r in rows if r]
+    if not ops:
+        return 0
+    stroke_index_coll.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def index_room_rows(room_id, rows):
+    """
+    Index rows for strokes the API has already stored in ``strokes``. The
+    write is retried; if it still fails the room is flagged for backfill so
+    the strokes are not missing from room loads. Never raises.
+    """
+    for attempt in range(INDEX_WRITE_ATTEMPTS):
+        try:
+            return index_rows(rows)
+        except Exception:
+            if attempt + 1 < INDEX_WRITE_ATTEMPTS:
+                time.sleep(INDEX_RETRY_DELAY_SECONDS * (2 ** attempt))
+                continue
+            logger.exception("stroke_index: failed to index strokes for room %s, flagging for backfill", room_id)
+    try:
+        rooms_coll.update_one({"_id": ObjectId(room_id)}, {"$unset": {READY_FIELD: ""}})
+    except Exception:
+        logger.exception("stroke_index: failed to flag room %s for backfill", room_id)
+    return 0
+
+
+def index_stroke(room_id, stroke, blob=None):
+    """Index a single stroke written by the API. Never raises."""
+    return index_room_rows(room_id, [make_row(room_id, stroke, blob)])
+
+
+def _asset_room_id(asset_data):
+    rid = asset_data.get("roomId")
+    if isinstance(rid, list):
+        rid = rid[0] if rid else None
+    return rid
+
+
+def index_mirrored_blocks(blocks):
+    """
+    Index strokes carried by ResilientDB blocks written by the sync mirror.
+    Room keys are unwrapped once per room per call.
+    """
+    rows = []
+    decrypted_commits = {}
+    room_keys = {}
+    for block in blocks or []:
+        for txn in block.get("transactions") or []:
+            try:
+                value = txn.get("value")
+                if isinstance(value, str):
+                    value = json.loads(value)
+                asset_data = value["asset"]["data"]
+                room_id = _asset_room_id(asset_data)
+                if not room_id or not ("stroke" in asset_data or "encrypted" in asset_data):
+                    continue
+                rk = None
+                if "encrypted" in asset_data:
+                    if room_id not in room_keys:
+                        room_keys[room_id] = _load_room_key(room_id)
+                    rk = room_keys[room_id]
+                row = row_from_asset(room_id, asset_data, rk)
+                rows.append(row)
+                if rk is not None and row and txn.get("id"):
+                    decrypted_commits.setdefault(row["strokeId"], txn["id"])
+            except Exception:
+                continue
+    # Encrypted strokes only reveal their id here, so the commit ledger
+    # learns about them from this handler
+    record_new_commits(decrypted_commits)
+    try:
+        return index_rows(rows)
+    except Exception:
+        logger.exception("stroke_index: failed to index mirrored blocks")
+        return 0
+
+
+def _load_room_key(room_id):
+    try:
+        room = rooms_coll.find_one({"_id": ObjectId(room_id)}, {"wrappedKey": 1})
+        if room and room.get("wrappedKey"):
+            return unwrap_room_key(room["wrappedKey"])
+    except Exception:
+        logger.warning("stroke_index: could not load room key for %s", room_id)
+    return None
+
+
+def _is_encrypted_doc(doc):
+    if "blob" in doc or "encrypted" in ((doc.get("asset") or {}).get("data") or {}):
+        return True
+    try:
+        return "encrypted" in doc["transactions"][0]["value"]["asset"]["data"]
+    except (KeyError, IndexError, TypeError):
+        return False
+
+
+def ensure_room_indexed(room, room_key=None):
+    """
+    Backfill the index for ``room`` from ``strokes`` if it has not been done.
+    Returns True when the index is complete for the room and can be served.
+    """
+    if room.get(READY_FIELD):
+        return True
+    room_id = str(room["_id"])
+    try:
+        rows = []
+        skipped = 0
+        for doc in strokes_coll.find(legacy_room_query(room_id)):
+            try:
+                row = row_from_doc(doc, room_id, room_key)
+            except Exception:
+                row = None
+            if row is None:
+                if room_key is None and _is_encrypted_doc(doc):
+                    skipped += 1
+                continue
+            rows.append(row)
+        index_rows(rows)
+        if skipped:
+            # Without a room key some encrypted strokes could not be indexed;
+            # keep serving from the legacy path until the key is available.
+            logger.warning("stroke_index: %d encrypted strokes in room %s could not be indexed", skipped, room_id)
+            return False
+        rooms_coll.update_one({"_id": room["_id"]}, {"$set": {READY_FIELD: True}})
+        room[READY_FIELD] = True
+        logger.info("stroke_index: backfilled %d strokes for room %s", len(rows), room_id)
+        return True
+    except Exception:
+        logger.exception("stroke_index: backfill failed for room %s", room_id)
+        return False
+
+
+def find_room_strokes(room_id, start_ts=None, end_ts=None, after_ts=None):
+    """
+    Return index rows for a room ordered by ``(ts, strokeId)``.
+
+    ``start_ts``/``end_ts`` are inclusive history bounds; ``after_ts`` is an
+    exclusive lower bound (used for the clear timestamp).
+    """
+    ts_filter = {}
+    if start_ts is not None:
+        ts_filter["$gte"] = start_ts
+    if after_ts is not None and (start_ts is None or after_ts >= start_ts):
+        ts_filter.pop("$gte", None)
+        ts_filter["$gt"] = after_ts
+    if end_ts is not None:
+        ts_filter["$lte"] = end_ts
+    query = {"roomId": room_id}
+    if ts_filter:
+        query["ts"] = ts_filter
+    return list(stroke_index_coll.find(query, {"_id": 0}).sort([("ts", 1), ("strokeId", 1)]))
+
+
+def find_room_stroke_keys(room_id, after_ts=None):
+    """
+    Return ``(ts, strokeId)`` for a room's index rows ordered by
+    ``(ts, strokeId)``, without reading the stroke bodies.
+    """
+    query = {"roomId": room_id}
+    if after_ts is not None:
+        query["ts"] = {"$gt": after_ts}
+    cursor = stroke_index_coll.find(query, {"_id": 0, "ts": 1, "strokeId": 1}).sort([("ts", 1), ("strokeId", 1)])
+    return [(row["ts"], row["strokeId"]) for row in cursor]
+
+
+def find_room_strokes_by_id(room_id, stroke_ids):
+    """Return the index rows for ``stroke_ids`` ordered by ``(ts, strokeId)``."""
+    if not stroke_ids:
+        return []
+    query = {"roomId": room_id, "strokeId": {"$in": list(stroke_ids)}}
+    return list(stroke_index_coll.find(query, {"_id": 0}).sort([("ts", 1), ("strokeId", 1)]))
+
+
+def find_room_strokes_after(room_id, ts, stroke_id="", limit=None):
+    """
+    Return index rows strictly after the ``(ts, stroke_id)`` cursor, ordered
+    by ``(ts, strokeId)``; used for incremental catch-up.
+    """
+    query = {
+        "roomId": room_id,
+        "$or": [
+            {"ts": {"$gt": ts}},
+            {"ts": ts, "strokeId": {"$gt": stroke_id or ""}}
+        ]
+    }
+    cursor = stroke_index_coll.find(query, {"_id": 0}).sort([("ts", 1), ("strokeId", 1)])
+    if limit:
+        cursor = cursor.limit(limit)
+    return list(cursor)
+
+
+def reset_room_index(room_id, room_oid=None):
+    """
+    Drop a room's index rows (room deleted, or its strokes re-encoded by a
+    type change). When ``room_oid`` is given the room is flagged for backfill.
+    """
+    try:
+        stroke_index_coll.delete_many({"roomId": room_id})
+        if room_oid is not None:
+            rooms_coll.update_one({"_id": room_oid}, {"$unset": {READY_FIELD: ""}})
+    except Exception:
+        logger.exception("stroke_index: failed to reset index for room %s", room_id)
@@ -0,0 +1,150 @@
+# services/undone_index.py
+"""
+Authoritative per-room index of undone strokes.
+
+``room-undone:{roomId}`` is a Redis hash of strokeId -> ts of the undo marker
+that hid it. room_undo and mark_strokes_undone add entries, room_redo removes
+them, so a reader gets a room's undone set with a single HKEYS instead of
+scanning every user's ``room:{roomId}:*:undone_strokes`` set and replaying
+the undo/redo markers stored in Mongo.
+
+The hash carries a READY_FIELD sentinel once it has been built. If it is
+missing (new deployment, Redis flush) the index is rebuilt once from the
+per-user sets and the Mongo markers, the newest marker per stroke winning.
+"""
+
+import logging
+
+from services.db import redis_client, strokes_coll
+
+logger = logging.getLogger(__name__)
+
+READY_FIELD = "__ready__"
+
+
+def _key(room_id):
+    return f"room-undone:{room_id}"
+
+
+def _decode(v):
+    return v.decode("utf-8") if isinstance(v, (bytes, bytearray)) else str(v)
+
+
+def record_undo(room_id, stroke_ids, ts, pipe=None):
+    """
+    Add undone strokes to the room index. Never raises on its own; with
+    ``pipe`` the write is only queued and fails with the caller's execute().
+    """
+    ids = [str(s) for s in stroke_ids if s]
+    if not ids:
+        return
+    if pipe is not None:
+        pipe.hset(_key(room_id), mapping={sid: ts for sid in ids})
+        return
+    try:
+        redis_client.hset(_key(room_id), mapping={sid: ts for sid in ids})
+    except Exception:
+        logger.exception("undone_index: failed to record undo for room %s", room_id)
+
+
+def record_redo(room_id, stroke_ids, pipe=None):
+    """Remove redone strokes from the room index. ``pipe`` as for record_undo."""
+    ids = [str(s) for s in stroke_ids if s]
+    if not ids:
+        return
+    if pipe is not None:
+        pipe.hdel(_key(room_id), *ids)
+        return
+    try:
+        redis_client.hdel(_key(room_id), *ids)
+    except Exception:
+        logger.exception("undone_index: failed to record redo for room %s", room_id)
+
+
+def _replay_markers(room_id):
+    """Rebuild strokeId -> marker ts from per-user sets and Mongo markers."""
+    undone = {}
+    try:
+        for key in redis_client.scan_iter(match=f"room:{room_id}:*:undone_strokes"):
+            for stroke_key in redis_client.smembers(key):
+                undone[_decode(stroke_key)] = 0
+    except Exception as e:
+        logger.warning(f"Redis lookup for undone strokes failed: {e}")
+
+    try:
+        # Markers can be stored directly (asset.data) or as mirrored ResDB
+        # transactions; the newest marker per stroke wins.
+        pipeline = [
+            {
+                "$match": {
+                    "$or": [
+                        {
+                            "asset.data.roomId": room_id,
+                            "asset.data.type": {"$in": ["undo_marker", "redo_marker"]}
+                        },
+                        {
+                            "transactions.value.asset.data.roomId": room_id,
+                            "transactions.value.asset.data.type": {"$in": ["undo_marker", "redo_marker"]}
+                        }
+                    ]
+                }
+            },
+            {"$sort": {"_id": -1}}
+        ]
+        markers_found = {}
+        for doc in strokes_coll.aggregate(pipeline):
+            marker_data = None
+            if 'asset' in doc and 'data' in doc['asset']:
+                marker_data = doc['asset']['data']
+            elif 'transactions' in doc and isinstance(doc['transactions'], list):
+                for txn in doc['transactions']:
+                    if 'value' in txn and 'asset' in txn['value'] and 'data' in txn['value']['asset']:
+                        data = txn['value']['asset']['data']
+                        if data.get('type') in ['undo_marker', 'redo_marker'] and data.get('roomId') == room_id:
+                            marker_data = data
+                            break
+            if not marker_data:
+                continue
+            stroke_id = marker_data.get('strokeId')
+            if stroke_id and marker_data.get('type') and stroke_id not in markers_found:
+                markers_found[stroke_id] = marker_data
+
+        for stroke_id, marker in markers_found.items():
+            if marker.get("type") == "undo_marker":
+                undone[str(stroke_id)] = marker.get("ts") or 0
+            elif marker.get("type") == "redo_marker":
+                undone.pop(str(stroke_id), None)
+    except Exception as e:
+        logger.warning(f"MongoDB recovery of undo/redo state failed: {e}")
+    return undone
+
+
+def rebuild(room_id):
+    """Rebuild the room index from the legacy sources and return its ids."""
+    undone = _replay_markers(room_id)
+    try:
+        mapping = dict(undone)
+        mapping[READY_FIELD] = 1
+        redis_client.hset(_key(room_id), mapping=mapping)
+    except Exception:
+        logger.exception("undone_index: failed to store rebuilt index for room %s", room_id)
+    logger.info("undone_index: rebuilt index for room %s (%d undone)", room_id, len(undone))
+    return set(undone)
+
+
+def get_undone_ids(room_id):
+    """Return the set of undone stroke ids for a room."""
+    try:
+        fields = redis_client.hkeys(_key(room_id))
+    except Exception as e:
+        logger.warning(f"Redis lookup for undone index failed: {e}")
+        return set(_replay_markers(room_id))
+    ids = set(_decode(f) for f in fields)
+    if READY_FIELD not in ids:
+        return rebuild(room_id)
+    ids.discard(READY_FIELD)
+    return ids
+
+
+def drop(room_id):
+    redis_client.delete(_key(room_id))
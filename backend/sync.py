@@ -3,6 +3,9 @@
 import asyncio
 from resilient_python_cache import ResilientPythonCache, MongoConfig, ResilientDBConfig
 from config import MONGO_URI, DB_NAME, COLLECTION_NAME, RES_DB_BASE_URL
+from services.stroke_index import index_mirrored_blocks
+from services.room_state import bump_for_mirrored_blocks
+from services.commit_ledger import record_mirrored_blocks
 
 async def main():
     mongo_config = MongoConfig(
@@ -21,6 +24,11 @@ async def main():
 
     cache.on("connected", lambda: print("WebSocket connected."))
     cache.on("data", lambda new_blocks: print("Received new blocks:", new_blocks))
+    # Keep the per-room stroke index in step with mirrored blocks
+    cache.on("data", index_mirrored_blocks)
+    cache.on("data", bump_for_mirrored_blocks)
+    # Mark mirrored commits so outbox/retry paths never resubmit them
+    cache.on("data", record_mirrored_blocks)
     cache.on("error", lambda error: print("Error:", error))
     cache.on("closed", lambda: print("Connection closed."))
 
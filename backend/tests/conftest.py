@@ -33,6 +33,7 @@ def cleanup_modules():
         'routes.submit_room_line',
         'routes.undo_redo',
         'routes.clear_canvas',
+        'routes.export',
         'routes.socketio_handlers',
     ]
     for module_name in modules_to_delete:
@@ -76,6 +77,14 @@ class FakeRedis:
         self.kv = {}
         self.lists = {}
         self.sets = {}
+        self.zsets = {}
+        self.hashes = {}
+        self.streams = {}
+        self.acked = {}
+        self.ttls = {}
+
+    def _stores(self):
+        return (self.kv, self.lists, self.sets, self.zsets, self.hashes, self.streams)
     
     def set(self, key, value, ex=None, nx=False):
         if nx and key in self.kv:
@@ -87,23 +96,21 @@ class FakeRedis:
     
     def get(self, key):
         return self.kv.get(key)
+
+    def mget(self, keys):
+        return [self.kv.get(key) for key in keys]
     
     def delete(self, *keys):
         count = 0
         for key in keys:
-            if key in self.kv:
-                del self.kv[key]
-                count += 1
-            if key in self.lists:
-                del self.lists[key]
-                count += 1
-            if key in self.sets:
-                del self.sets[key]
-                count += 1
+            for store in self._stores():
+                if key in store:
+                    del store[key]
+                    count += 1
         return count
     
     def exists(self, key):
-        return 1 if key in self.kv or key in self.lists or key in self.sets else 0
+        return 1 if any(key in store for store in self._stores()) else 0
     
     def lpush(self, key, *values):
         if key not in self.lists:
@@ -136,6 +143,10 @@ class FakeRedis:
             return lst[start:]
         return lst[start:stop+1]
     
+    def lindex(self, key, index):
+        lst = self.lists.get(key, [])
+        return lst[index] if -len(lst) <= index < len(lst) else None
+
     def llen(self, key):
         return len(self.lists.get(key, []))
     
@@ -188,6 +199,11 @@ class FakeRedis:
     def smembers(self, key):
         return self.sets.get(key, set())
     
+    def spop(self, key):
+        if not self.sets.get(key):
+            return None
+        return self.sets[key].pop()
+
     def srem(self, key, *members):
         if key not in self.sets:
             return 0
@@ -195,6 +211,121 @@ class FakeRedis:
         self.sets[key].difference_update(members)
         return before - len(self.sets[key])
     
+    @staticmethod
+    def _encode(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        h = self.hashes.setdefault(key, {})
+        added = sum(1 for f in items if f not in h)
+        h.update({f: self._encode(v) for f, v in items.items()})
+        return added
+
+    def hsetnx(self, key, field, value):
+        h = self.hashes.setdefault(key, {})
+        if field in h:
+            return 0
+        h[field] = self._encode(value)
+        return 1
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hmget(self, key, fields):
+        h = self.hashes.get(key, {})
+        return [h.get(f) for f in fields]
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hkeys(self, key):
+        return list(self.hashes.get(key, {}))
+
+    def hdel(self, key, *fields):
+        h = self.hashes.get(key, {})
+        return sum(1 for f in fields if h.pop(f, None) is not None)
+
+    def hincrby(self, key, field, amount=1):
+        h = self.hashes.setdefault(key, {})
+        value = int(h.get(field, b'0')) + amount
+        h[field] = self._encode(value)
+        return value
+
+    def zadd(self, key, mapping, xx=False, nx=False):
+        zset = self.zsets.setdefault(key, {})
+        added = 0
+        for member, score in mapping.items():
+            if (xx and member not in zset) or (nx and member in zset):
+                continue
+            added += member not in zset
+            zset[member] = float(score)
+        return added
+
+    def _zsorted(self, key):
+        return sorted(self.zsets.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+
+    @staticmethod
+    def _score_bound(value):
+        return float(value) if value not in ('-inf', '+inf', 'inf') else float(value.replace('+', ''))
+
+    def zrange(self, key, start, stop, withscores=False):
+        items = self._zsorted(key)
+        items = items[start:] if stop == -1 else items[start:stop + 1]
+        return items if withscores else [member for member, _ in items]
+
+    def zrangebyscore(self, key, min, max, start=None, num=None, withscores=False):
+        lo, hi = self._score_bound(min), self._score_bound(max)
+        items = [(m, sc) for m, sc in self._zsorted(key) if lo <= sc <= hi]
+        if start is not None and num is not None:
+            items = items[start:start + num]
+        return items if withscores else [member for member, _ in items]
+
+    def zrem(self, key, *members):
+        zset = self.zsets.get(key, {})
+        return sum(1 for m in members if zset.pop(m, None) is not None)
+
+    def zremrangebyscore(self, key, min, max):
+        return self.zrem(key, *self.zrangebyscore(key, min, max))
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    # Streams are append-only here: consumer groups never deliver, so the
+    # background commit workers started by app.py stay idle during tests and
+    # enqueued entries remain visible in ``streams``.
+    def xadd(self, key, fields, id='*'):
+        stream = self.streams.setdefault(key, {})
+        entry_id = f"{len(stream) + 1}-0"
+        stream[entry_id] = dict(fields)
+        return entry_id
+
+    def xgroup_create(self, key, group, id='$', mkstream=False):
+        if mkstream:
+            self.streams.setdefault(key, {})
+        return True
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        if block:
+            time.sleep(block / 1000.0)
+        return []
+
+    def xautoclaim(self, key, group, consumer, min_idle_time, start_id='0-0', count=None):
+        return ['0-0', [], []]
+
+    def xack(self, key, group, *ids):
+        self.acked.setdefault(key, []).extend(ids)
+        return len(ids)
+
+    def xdel(self, key, *ids):
+        stream = self.streams.get(key, {})
+        return sum(1 for i in ids if stream.pop(i, None) is not None)
+
+    def xlen(self, key):
+        return len(self.streams.get(key, {}))
+
     def incr(self, key, amount=1):
         current = self.kv.get(key)
         if current is None:
@@ -205,24 +336,27 @@ class FakeRedis:
         return new_val
     
     def expire(self, key, seconds):
+        self.ttls[key] = seconds
         return True
-    
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
     def flushdb(self):
-        self.kv.clear()
-        self.lists.clear()
-        self.sets.clear()
+        for store in self._stores():
+            store.clear()
         return True
     
     def keys(self, pattern='*'):
         import fnmatch
-        all_keys = list(self.kv.keys()) + list(self.lists.keys()) + list(self.sets.keys())
+        all_keys = [key for store in self._stores() for key in store]
         if pattern == '*':
             return all_keys
         return [k for k in all_keys if fnmatch.fnmatch(k, pattern)]
     
     def scan_iter(self, match=None):
         """Iterate over keys matching pattern (for undo/redo scans)"""
-        all_keys = list(self.kv.keys()) + list(self.lists.keys()) + list(self.sets.keys())
+        all_keys = [key for store in self._stores() for key in store]
         if match is None or match == '*':
             return iter(all_keys)
         # Simple pattern matching: convert Redis pattern to fnmatch pattern
@@ -231,14 +365,79 @@ class FakeRedis:
         return iter([k for k in all_keys if fnmatch.fnmatch(k, pattern)])
 
 
+class FakePipeline:
+    """
+    Queues commands and replays them against the FakeRedis on execute().
+    Between watch() and multi() commands run immediately, as in redis-py;
+    nothing else writes concurrently, so a WATCH never fails.
+    """
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+        self.watching = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+        return False
+
+    def watch(self, *keys):
+        self.watching = True
+
+    def multi(self):
+        self.watching = False
+
+    def reset(self):
+        self.commands = []
+        self.watching = False
+
+    def __getattr__(self, name):
+        if self.watching:
+            return getattr(self.redis, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        self.watching = False
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+def patch_imported_services(fakes):
+    """
+    Patchers for services modules that copied ``services.db`` names at import
+    (``from services.db import redis_client``). Route modules are re-imported
+    per test, but services modules stay loaded and would keep the fakes of the
+    test that first imported them.
+    """
+    import sys
+    patchers = []
+    for mod_name, mod in list(sys.modules.items()):
+        if mod is None or not mod_name.startswith('services.') or mod_name == 'services.db':
+            continue
+        for name, fake in fakes.items():
+            if name in vars(mod):
+                patchers.append(patch.object(mod, name, fake))
+    return patchers
+
+
 @pytest.fixture
 def mock_redis():
     # Import services.db first to ensure the module exists and redis_client is defined
     import services.db
     
     fake_redis = FakeRedis()
-    with patch('services.db.redis_client', fake_redis):
-        yield fake_redis
+    patches = [patch('services.db.redis_client', fake_redis)] + patch_imported_services({'redis_client': fake_redis})
+    for p in patches:
+        p.start()
+    yield fake_redis
+    for p in patches:
+        p.stop()
 
 
 class FakeMongoDB:
@@ -303,18 +502,53 @@ class FakeCollection:
                 result.matched_count = 1
                 return result
         if upsert:
-            new_doc = {}
+            new_doc = {k: v for k, v in query.items() if not k.startswith('$') and not isinstance(v, dict)}
             if '$set' in update:
                 new_doc.update(update['$set'])
+            if '$setOnInsert' in update:
+                new_doc.update(update['$setOnInsert'])
             self.insert_one(new_doc)
             result = MagicMock()
             result.upserted_id = new_doc['_id']
+            result.modified_count = 0
+            result.matched_count = 0
             return result
         result = MagicMock()
         result.modified_count = 0
         result.matched_count = 0
         return result
     
+    def replace_one(self, query, replacement, upsert=False):
+        for i, doc in enumerate(self.docs):
+            if self._matches(doc, query):
+                new_doc = dict(replacement)
+                new_doc['_id'] = doc['_id']
+                self.docs[i] = new_doc
+                result = MagicMock()
+                result.matched_count = 1
+                result.modified_count = 1
+                return result
+        result = MagicMock()
+        result.matched_count = 0
+        result.modified_count = 0
+        if upsert:
+            result.upserted_id = self.insert_one(dict(replacement)).inserted_id
+        return result
+
+    def bulk_write(self, requests, ordered=True):
+        """UpdateOne-only bulk_write, applied in order."""
+        upserted = modified = 0
+        for op in requests:
+            res = self.update_one(op._filter, op._doc, upsert=op._upsert)
+            if res.matched_count:
+                modified += 1
+            elif op._upsert:
+                upserted += 1
+        result = MagicMock()
+        result.upserted_count = upserted
+        result.modified_count = modified
+        return result
+
     def update_many(self, query, update):
         count = 0
         for doc in self.docs:
@@ -567,7 +801,7 @@ def mock_mongodb():
     fake_db = FakeMongoDB()
     
     # Set parent DB reference for lookups in aggregate operations
-    for coll_name in ['users', 'rooms', 'shares', 'notifications', 'invites', 'refresh_tokens', 'strokes', 'settings', 'analytics_events', 'analytics_aggregates']:
+    for coll_name in ['users', 'rooms', 'shares', 'notifications', 'invites', 'refresh_tokens', 'strokes', 'stroke_index', 'room_snapshots', 'settings', 'analytics_events', 'analytics_aggregates']:
         fake_db[coll_name]._parent_db = fake_db
     
     # Only patch at the source (services.db) since all route modules import from there
@@ -578,12 +812,15 @@ def mock_mongodb():
         patch('services.db.shares_coll', fake_db['shares']),
         patch('services.db.refresh_tokens_coll', fake_db['refresh_tokens']),
         patch('services.db.strokes_coll', fake_db['strokes']),
+        patch('services.db.stroke_index_coll', fake_db['stroke_index']),
+        patch('services.db.room_snapshots_coll', fake_db['room_snapshots']),
         patch('services.db.settings_coll', fake_db['settings']),
         patch('services.db.invites_coll', fake_db['invites']),
         patch('services.db.notifications_coll', fake_db['notifications']),
         patch('services.db.analytics_coll', fake_db['analytics_events']),
         patch('services.db.analytics_aggregates_coll', fake_db['analytics_aggregates']),
     ]
+    patches += patch_imported_services({p.attribute: p.new for p in patches})
     
     # Start all patches
     for p in patches:
@@ -146,3 +146,54 @@ class TestStrokesAPI:
         assert response.status_code == 200
         data = response.get_json()
         assert 'strokes' in data
+
+    def test_strokes_since_returns_late_stored_stroke(self, client, mock_mongodb, mock_redis, auth_headers, test_room, test_stroke_data, mock_graphql_service):
+        room_id = str(test_room["_id"])
+        client.post(f'/rooms/{room_id}/strokes', json={'stroke': test_stroke_data}, headers=auth_headers)
+        load = client.get(f'/rooms/{room_id}/strokes', headers=auth_headers).get_json()
+        cursor_ts = int(load['cursor'].split(':')[0])
+        assert cursor_ts == max(s['ts'] for s in load['strokes'])
+
+        # Stamped before the load's newest stroke but stored after the load
+        late = dict(test_stroke_data, id='late-stroke', ts=cursor_ts - 1)
+        mock_mongodb['stroke_index'].insert_one(
+            {'roomId': room_id, 'strokeId': 'late-stroke', 'ts': late['ts'], 'user': 'testuser', 'stroke': late})
+
+        response = client.get(f'/rooms/{room_id}/strokes/since?cursor={load["cursor"]}', headers=auth_headers)
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert 'late-stroke' in [s['id'] for s in data['strokes']]
+        assert int(data['cursor'].split(':')[0]) == cursor_ts
+
+    def test_export_decrypts_binary_envelope_blobs(self, client, mock_mongodb, mock_redis, auth_headers, test_room):
+        import os
+        from services.crypto_service import wrap_room_key, encrypt_stroke
+        room_key = os.urandom(32)
+        room_id = str(test_room["_id"])
+        mock_mongodb['rooms'].update_one({"_id": test_room["_id"]},
+                                         {"$set": {"type": "private", "wrappedKey": wrap_room_key(room_key)}})
+        stroke = {'id': 'enc-1', 'user': 'testuser', 'color': '#123456', 'lineWidth': 3,
+                  'pathData': [{'x': 1.5, 'y': 2.25}], 'ts': 1700000000000}
+        mock_mongodb['strokes'].insert_one({'roomId': room_id, 'id': 'enc-1', 'user': 'testuser',
+                                            'ts': stroke['ts'], 'blob': encrypt_stroke(room_key, stroke, binary=True)})
+
+        response = client.get(f'/api/rooms/{room_id}/export', headers=auth_headers)
+
+        assert response.status_code == 200, response.get_data(as_text=True)
+        exported = response.get_json()['data']['strokes']
+        assert [(s['id'], s['color'], s['pathData']) for s in exported] == [('enc-1', '#123456', [{'x': 1.5, 'y': 2.25}])]
+
+    def test_fractional_path_is_stored_and_returned_exactly(self, client, mock_mongodb, mock_redis, auth_headers, test_room, test_stroke_data, mock_graphql_service):
+        room_id = str(test_room["_id"])
+        path = [{'x': 10.123456, 'y': 2.5}, {'x': 11.0, 'y': 0.1 + 0.2}]
+        client.post(f'/rooms/{room_id}/strokes',
+            json={'stroke': dict(test_stroke_data, pathData=path)},
+            headers=auth_headers)
+
+        plain = client.get(f'/rooms/{room_id}/strokes', headers=auth_headers).get_json()['strokes']
+        packed = client.get(f'/rooms/{room_id}/strokes?pathData=packed', headers=auth_headers).get_json()['strokes']
+
+        assert plain[0]['pathData'] == path
+        # 0.1 + 0.2 has no exact decimal scale, so the path is not packed
+        assert packed[0]['pathData'] == path
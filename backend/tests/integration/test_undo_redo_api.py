@@ -150,3 +150,22 @@ class TestUndoRedoAPI:
         # Redo the stroke - should succeed
         redo_response = client.post(f'/rooms/{room_id}/redo', headers=auth_headers)
         assert redo_response.status_code == 200
+
+    def test_failed_undo_leaves_stack_and_writes_no_marker(self, client, mock_mongodb, mock_redis, auth_headers, test_room, test_user, test_stroke_data, mock_graphql_service, monkeypatch):
+        from tests.conftest import FakePipeline
+        room_id = str(test_room["_id"])
+        client.post(f'/rooms/{room_id}/strokes',
+            json={'stroke': test_stroke_data},
+            headers=auth_headers)
+        undo_key = f"room:{room_id}:{test_user['_id']}:undo"
+        assert mock_redis.llen(undo_key) == 1
+
+        def fail(self):
+            raise ConnectionError("redis went away")
+        monkeypatch.setattr(FakePipeline, "execute", fail)
+
+        response = client.post(f'/rooms/{room_id}/undo', headers=auth_headers)
+
+        assert response.status_code == 500
+        assert mock_redis.llen(undo_key) == 1
+        assert mock_mongodb['strokes'].count_documents({"asset.data.type": "undo_marker"}) == 0
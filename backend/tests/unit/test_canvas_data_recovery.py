@@ -0,0 +1,90 @@
+import json
+import pytest
+
+import routes.get_canvas_data as gcd
+
+
+class DummyStrokes:
+    def __init__(self, blocks, room_docs=()):
+        self.blocks = blocks
+        self.room_docs = list(room_docs)
+        self.queries = []
+
+    def find(self, query, sort=None):
+        self.queries.append(query)
+        if "transactions.value.asset.data.id" in query:
+            return iter(self.blocks)
+        return iter(self.room_docs)
+
+
+def _block(*assets):
+    return {"transactions": [{"value": {"asset": {"data": a}}} for a in assets]}
+
+
+@pytest.mark.unit
+class TestDrawKeyRecovery:
+
+    def test_single_query_recovers_and_recaches(self, mock_redis, monkeypatch):
+        r = mock_redis
+        strokes = DummyStrokes([
+            _block({"id": "res-canvas-draw-1", "ts": 5, "value": json.dumps({"roomId": "r1", "color": "#000"})}),
+            _block({"id": "res-canvas-draw-2", "ts": {"$numberLong": "7"}, "roomId": "r1"},
+                   {"id": "res-canvas-draw-2", "ts": 9, "roomId": "r1"}),
+        ])
+        monkeypatch.setattr(gcd, "redis_client", r)
+        monkeypatch.setattr(gcd, "strokes_coll", strokes)
+
+        recovered = gcd._recover_draw_keys(["res-canvas-draw-1", "res-canvas-draw-2"])
+
+        assert len(strokes.queries) == 1
+        assert recovered["res-canvas-draw-1"]["roomId"] == "r1"
+        assert recovered["res-canvas-draw-1"]["color"] == "#000"
+        assert recovered["res-canvas-draw-2"]["ts"] == 9
+        assert set(r.kv) == {"res-canvas-draw-1", "res-canvas-draw-2"}
+
+    def test_room_strokes_fill_remaining_keys(self, mock_redis, monkeypatch):
+        r = mock_redis
+        strokes = DummyStrokes([], room_docs=[{"roomId": "r1", "stroke": {"id": "res-canvas-draw-3", "timestamp": 11, "user": "u"}}])
+        monkeypatch.setattr(gcd, "redis_client", r)
+        monkeypatch.setattr(gcd, "strokes_coll", strokes)
+        monkeypatch.setattr(gcd, "rooms_coll", type("Rooms", (), {"find_one": lambda self, q: None})())
+
+        recovered = gcd._recover_draw_keys(["res-canvas-draw-3", "res-canvas-draw-4"], "r1")
+
+        assert list(recovered) == ["res-canvas-draw-3"]
+        assert recovered["res-canvas-draw-3"]["ts"] == 11
+        assert recovered["res-canvas-draw-3"]["roomId"] == "r1"
+
+
+class DummyCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self.closed = False
+
+    def batch_size(self, n):
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.mark.unit
+class TestStrokesFromMongo:
+
+    def test_streams_from_shared_client(self, monkeypatch):
+        cursor = DummyCursor([
+            {"roomId": "r1", "ts": 20, "value": {"ts": 20, "id": "b", "user": "u"}},
+            {"roomId": "r1", "ts": 10, "value": {"ts": 10, "id": "a", "user": "u"}},
+        ])
+        coll = type("Coll", (), {"find": lambda self, q: cursor})()
+        monkeypatch.setattr(gcd, "mongo_client", {gcd.DB_NAME: {gcd.COLLECTION_NAME: coll}})
+        monkeypatch.setattr(gcd, "rooms_coll", type("Rooms", (), {"find_one": lambda self, q: None})())
+
+        items = gcd.get_strokes_from_mongo(None, None, "r1")
+
+        assert not isinstance(items, list)
+        assert [i["ts"] for i in items] == [20, 10]
+        assert cursor.closed
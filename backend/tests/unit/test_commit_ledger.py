@@ -0,0 +1,61 @@
+import json
+import pytest
+
+import services.commit_ledger as commit_ledger
+
+
+@pytest.fixture
+def r(mock_redis, monkeypatch):
+    monkeypatch.setattr(commit_ledger, "redis_client", mock_redis)
+    return mock_redis
+
+
+def _block(*assets):
+    return {"id": 1, "transactions": [{"id": f"txn-{i}", "value": json.dumps({"asset": {"data": a}})}
+                                      for i, a in enumerate(assets)]}
+
+
+@pytest.mark.unit
+class TestCommitLedger:
+
+    def test_record_and_lookup(self, r):
+        commit_ledger.record_commits({"s1": "txn-1"})
+
+        assert commit_ledger.committed_txns(["s1", "s2"]) == {"s1": "txn-1"}
+        assert commit_ledger.committed_txn("s2") is None
+        assert all(ttl == commit_ledger.LEDGER_RETENTION_DAYS * 86400 for ttl in r.ttls.values())
+
+    def test_older_buckets_are_still_found(self, r, monkeypatch):
+        monkeypatch.setattr(commit_ledger, "_day", lambda ts=None: 100)
+        commit_ledger.record_commit("s1", "txn-1")
+        monkeypatch.setattr(commit_ledger, "_day", lambda ts=None: 103)
+
+        assert commit_ledger.committed_txn("s1") == "txn-1"
+
+    def test_mirror_records_plaintext_ids_first_txn_wins(self, r):
+        commit_ledger.record_commit("s1", "txn-api")
+        blocks = [_block({"roomId": "r1", "stroke": {"id": "s1"}},
+                         {"roomId": "r1", "stroke": {"id": "s2"}},
+                         {"id": "undo-s2", "type": "undo_marker"},
+                         {"roomId": "r1", "encrypted": {"env": "x"}})]
+
+        assert commit_ledger.record_mirrored_blocks(blocks) == 2
+        assert commit_ledger.committed_txns(["s1", "s2", "undo-s2"]) == {
+            "s1": "txn-api", "s2": "txn-1", "undo-s2": "txn-2"}
+
+    def test_mirror_keys_on_the_outbox_id(self, r):
+        blocks = [_block({"type": "undo_marker", "strokeId": "s1", "commitId": "undo_marker_s1_5"},
+                         {"id": "s2", "type": "public", "value": "{}", "commitId": "res-canvas-draw-7"},
+                         {"roomId": "r1", "encrypted": {"env": "x"}, "commitId": "s3"})]
+
+        assert commit_ledger.record_mirrored_blocks(blocks) == 3
+        assert commit_ledger.committed_txns(["undo_marker_s1_5", "res-canvas-draw-7", "s3"]) == {
+            "undo_marker_s1_5": "txn-0", "res-canvas-draw-7": "txn-1", "s3": "txn-2"}
+
+    def test_lookup_failure_reads_as_uncommitted(self, r, monkeypatch):
+        def down(*a, **k):
+            raise ConnectionError("redis down")
+        monkeypatch.setattr(r, "pipeline", down)
+
+        assert commit_ledger.committed_txns(["s1"]) == {}
+        assert commit_ledger.record_commits({"s1": "t"}) == 0
@@ -0,0 +1,132 @@
+import json
+import pytest
+
+import services.commit_outbox as commit_outbox
+
+
+def _stream(r):
+    return r.streams.get(commit_outbox.OUTBOX_STREAM, {})
+
+
+def _acked(r):
+    return r.acked.get(commit_outbox.OUTBOX_STREAM, [])
+
+
+@pytest.fixture
+def env(mock_redis, monkeypatch):
+    r = mock_redis
+    r.delays = {}
+    retried = []
+    monkeypatch.setattr(commit_outbox, "redis_client", r)
+    monkeypatch.setattr(commit_outbox, "add_to_retry_queue",
+                        lambda i, a, delay_seconds=0: retried.append(i) or r.delays.update({i: delay_seconds}))
+    monkeypatch.setattr(commit_outbox, "_notify", lambda *a: None)
+    monkeypatch.setattr(commit_outbox, "graphql_circuit_open", lambda: False)
+    ledger = {}
+    monkeypatch.setattr(commit_outbox, "committed_txns", lambda ids: {i: ledger[i] for i in ids if i in ledger})
+    monkeypatch.setattr(commit_outbox, "record_commits", lambda mapping, pipe=None: ledger.update(mapping))
+    r.ledger = ledger
+    return r, retried
+
+
+@pytest.mark.unit
+class TestCommitOutbox:
+
+    def test_enqueue_then_commit_acks_entry(self, env, monkeypatch):
+        r, retried = env
+        committed = []
+        monkeypatch.setattr(commit_outbox, "commit_transaction_via_graphql",
+                            lambda prep: committed.append(prep["asset"]["data"]) or "txn-1")
+
+        commit_outbox.enqueue_commit("s1", {"roomId": "r1", "stroke": {"id": "s1"}}, "r1")
+        entry_id, fields = next(iter(_stream(r).items()))
+
+        assert commit_outbox.process_entry(entry_id, fields) is True
+        assert committed == [{"roomId": "r1", "stroke": {"id": "s1"}, "commitId": "s1"}]
+        assert _acked(r) == [entry_id] and _stream(r) == {}
+        assert retried == []
+
+    def test_failed_commit_moves_to_retry_queue(self, env, monkeypatch):
+        r, retried = env
+
+        def fail(prep):
+            raise RuntimeError("node down")
+        monkeypatch.setattr(commit_outbox, "commit_transaction_via_graphql", fail)
+
+        entry_id = r.xadd(commit_outbox.OUTBOX_STREAM, {b"id": b"s2", b"asset": json.dumps({"a": 1}).encode(), b"roomId": b""})
+
+        assert commit_outbox.process_entry(entry_id, _stream(r)[entry_id]) is False
+        assert retried == ["s2"]
+        assert _acked(r) == [entry_id]
+
+    def test_enqueue_falls_back_when_redis_is_down(self, env, monkeypatch):
+        r, retried = env
+
+        def down(*args, **kwargs):
+            raise ConnectionError("redis down")
+        monkeypatch.setattr(r, "xadd", down)
+
+        commit_outbox.enqueue_commit("s3", {"a": 1})
+        assert retried == ["s3"]
+
+    def test_batch_commits_in_one_request_and_retries_per_item(self, env, monkeypatch):
+        r, retried = env
+        batches = []
+
+        def commit_batch(preps):
+            batches.append([p["asset"]["data"]["n"] for p in preps])
+            return ["txn-0", RuntimeError("rejected"), "txn-2"]
+        monkeypatch.setattr(commit_outbox, "commit_transactions_batch_via_graphql", commit_batch)
+
+        for n in range(3):
+            commit_outbox.enqueue_commit(f"s{n}", {"n": n}, "r1")
+        entries = list(_stream(r).items())
+
+        assert commit_outbox.process_entries(entries) == [True, False, True]
+        assert batches == [[0, 1, 2]]
+        assert retried == ["s1"]
+        assert _acked(r) == [e for e, _ in entries] and _stream(r) == {}
+
+    def test_unknown_outcome_is_retried_after_recheck_delay(self, env, monkeypatch):
+        r, retried = env
+        monkeypatch.setattr(commit_outbox, "commit_transactions_batch_via_graphql",
+                            lambda preps: ["txn-0", commit_outbox.CommitOutcomeUnknown("read timed out")])
+
+        for n in range(2):
+            commit_outbox.enqueue_commit(f"s{n}", {"n": n}, "r1")
+
+        assert commit_outbox.process_entries(list(_stream(r).items())) == [True, False]
+        assert retried == ["s1"]
+        assert r.delays["s1"] == commit_outbox.UNKNOWN_OUTCOME_RECHECK_SECONDS > 0
+
+    def test_open_circuit_skips_outbox(self, env, monkeypatch):
+        r, retried = env
+        monkeypatch.setattr(commit_outbox, "graphql_circuit_open", lambda: True)
+
+        commit_outbox.enqueue_commit("s4", {"a": 1}, "r1")
+        assert retried == ["s4"] and _stream(r) == {}
+
+    def test_enqueue_commits_pipelines_every_item(self, env):
+        r, retried = env
+
+        commit_outbox.enqueue_commits([("s5", {"n": 5}), ("s6", {"n": 6})], "r1")
+
+        assert [f["id"] for f in _stream(r).values()] == ["s5", "s6"]
+        assert retried == []
+
+    def test_ledger_skips_resubmitting_committed_ids(self, env, monkeypatch):
+        r, retried = env
+        r.ledger["s7"] = "txn-old"
+        committed = []
+
+        def commit(prep):
+            committed.append(prep["asset"]["data"]["n"])
+            return "txn-new"
+        monkeypatch.setattr(commit_outbox, "commit_transaction_via_graphql", commit)
+
+        commit_outbox.enqueue_commits([("s7", {"n": 7}), ("s8", {"n": 8})], "r1")
+
+        assert commit_outbox.process_entries(list(_stream(r).items())) == [True, True]
+        assert committed == [8]
+        assert r.ledger == {"s7": "txn-old", "s8": "txn-new"}
+        assert _stream(r) == {} and retried == []
@@ -1,5 +1,6 @@
 import pytest
 import os
+import json
 from unittest.mock import patch
 
 from services.crypto_service import (
@@ -7,7 +8,12 @@ from services.crypto_service import (
     unwrap_room_key,
     encrypt_for_room,
     decrypt_for_room,
+    clear_room_key_cache,
+    encrypt_stroke,
+    decrypt_stroke,
+    bundle_for_json,
 )
+import services.crypto_service as crypto_service
 
 
 @pytest.mark.unit
@@ -91,3 +97,50 @@ class TestCryptoService:
         
         with pytest.raises(ValueError, match="room_key must be 32 bytes"):
             encrypt_for_room(room_key, plaintext)
+
+    def test_unwrap_is_cached_until_cleared(self):
+        wrapped = wrap_room_key(os.urandom(32))
+        first = unwrap_room_key(wrapped)
+
+        with patch.object(crypto_service, '_MASTER') as master:
+            assert unwrap_room_key(wrapped) == first
+            master.decrypt.assert_not_called()
+
+            clear_room_key_cache()
+            master.decrypt.return_value = b'k' * 32
+            assert unwrap_room_key(wrapped) == b'k' * 32
+            master.decrypt.assert_called_once()
+        clear_room_key_cache()
+
+    def test_cached_entries_expire(self, monkeypatch):
+        cache = crypto_service._TTLCache(maxsize=2, ttl=10)
+        now = [100.0]
+        monkeypatch.setattr(crypto_service.time, 'monotonic', lambda: now[0])
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.put('c', 3)
+
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+        now[0] += 11
+        assert cache.get('c') is None
+
+    def test_binary_stroke_envelope_roundtrip(self):
+        room_key = os.urandom(32)
+        stroke = {'id': 's1', 'ts': 1700000000000, 'color': '#000',
+                  'pathData': [{'x': i, 'y': i * 2} for i in range(100)]}
+
+        binary = encrypt_stroke(room_key, stroke, binary=True)
+        legacy = encrypt_stroke(room_key, stroke, binary=False)
+
+        assert decrypt_stroke(room_key, binary) == stroke
+        assert decrypt_stroke(room_key, legacy) == stroke
+        assert decrypt_stroke(room_key, bundle_for_json(binary)) == stroke
+        assert json.loads(decrypt_for_room(room_key, binary)) == stroke
+        assert len(binary) < len(legacy['ct']) / 2
+
+    def test_float_points_survive_the_envelope(self):
+        room_key = os.urandom(32)
+        stroke = {'id': 's2', 'pathData': [{'x': 0.1, 'y': 2.5}, {'x': 3, 'y': -4.75}]}
+
+        assert decrypt_stroke(room_key, encrypt_stroke(room_key, stroke, binary=True)) == stroke
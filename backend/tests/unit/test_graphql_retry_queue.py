@@ -0,0 +1,280 @@
+import json
+import time
+import pytest
+
+import services.graphql_retry_queue as retry_queue
+
+
+# The queue's Lua scripts run for real on fakeredis' Lua runtime (lupa)
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+
+def _due(r, queue=retry_queue.RETRY_QUEUE_KEY):
+    return {retry_queue._decode(m): score for m, score in r.zrange(queue, 0, -1, withscores=True)}
+
+
+def _lease(r, stroke_id):
+    return retry_queue._decode(r.hget(retry_queue.RETRY_LEASES_KEY, stroke_id))
+
+
+def _expire(r, stroke_id):
+    r.zadd(retry_queue.RETRY_QUEUE_KEY, {stroke_id: 0})
+
+
+@pytest.fixture
+def r(monkeypatch):
+    r = fakeredis.FakeRedis()
+    monkeypatch.setattr(retry_queue, "redis_client", r)
+    monkeypatch.setattr(retry_queue, "graphql_circuit_open", lambda: False)
+    monkeypatch.setattr(retry_queue, "_scripts", {})
+    r.ledger = {}
+    monkeypatch.setattr(retry_queue, "committed_txn", lambda i: r.ledger.get(i))
+    monkeypatch.setattr(retry_queue, "committed_txns", lambda ids: {i: r.ledger[i] for i in ids if i in r.ledger})
+    monkeypatch.setattr(retry_queue, "record_commits", lambda mapping: r.ledger.update(mapping))
+    return r
+
+
+def _queue(n):
+    for i in range(n):
+        retry_queue.add_to_retry_queue(f"s{i}", {"n": i})
+
+
+@pytest.mark.unit
+class TestRetryDrain:
+
+    def test_failed_items_back_off_instead_of_retrying_every_cycle(self, r, monkeypatch):
+        monkeypatch.setattr(retry_queue, "commit_transactions_batch_via_graphql",
+                            lambda preps: ["txn" if p["asset"]["data"]["n"] % 2 else RuntimeError("down") for p in preps])
+        _queue(4)
+
+        stats = retry_queue.process_retry_queue(max_items=10)
+
+        assert (stats["success"], stats["failed"]) == (2, 2)
+        assert r.zcard(retry_queue.RETRY_QUEUE_KEY) == 2
+        assert all(score > time.time() for score in _due(r).values())
+        assert retry_queue.get_due_retries(10) == []
+        assert 0 < retry_queue.seconds_until_next_retry() <= retry_queue.RETRY_BACKOFF_BASE_SECONDS * 1.2
+
+    def test_due_items_are_committed_in_concurrent_batches(self, r, monkeypatch):
+        batches = []
+
+        def commit_batch(preps):
+            batches.append(len(preps))
+            return ["txn"] * len(preps)
+        monkeypatch.setattr(retry_queue, "commit_transactions_batch_via_graphql", commit_batch)
+        monkeypatch.setattr(retry_queue, "RETRY_COMMIT_BATCH", 4)
+        _queue(10)
+
+        stats = retry_queue.process_retry_queue(max_items=10, concurrency=3)
+
+        assert stats["success"] == 10 and _due(r) == {}
+        assert sorted(batches) == [2, 4, 4]
+
+    def test_unknown_outcome_waits_for_the_ledger(self, r, monkeypatch):
+        monkeypatch.setattr(retry_queue, "commit_transactions_batch_via_graphql",
+                            lambda preps: [retry_queue.CommitOutcomeUnknown("read timed out")] * len(preps))
+        _queue(1)
+
+        stats = retry_queue.process_retry_queue(max_items=10)
+
+        assert stats["failed"] == 1
+        assert _due(r)["s0"] >= time.time() + retry_queue.UNKNOWN_OUTCOME_RECHECK_SECONDS - 1
+
+    def test_open_circuit_leaves_items_due(self, r, monkeypatch):
+        monkeypatch.setattr(retry_queue, "commit_transactions_batch_via_graphql",
+                            lambda preps: [retry_queue.CircuitOpenError("open")] * len(preps))
+        _queue(3)
+
+        stats = retry_queue.drain_retry_queue()
+
+        assert stats["failed"] == 0 and stats["rounds"] == 1
+        assert len(retry_queue.get_due_retries(10)) == 3
+
+    def test_drain_grows_rounds_while_healthy(self, r, monkeypatch):
+        monkeypatch.setattr(retry_queue, "commit_transactions_batch_via_graphql", lambda preps: ["txn"] * len(preps))
+        _queue(70)
+
+        stats = retry_queue.drain_retry_queue(initial_batch=10)
+
+        assert stats["success"] == 70 and _due(r) == {}
+        assert stats["rounds"] == 4  # 10, 20, 40, then an empty round
+        assert stats["batch_size"] == 80
+
+    def test_claimed_items_are_invisible_to_other_workers(self, r):
+        _queue(3)
+
+        first = retry_queue.claim_retries(10, owner="w1")
+        second = retry_queue.claim_retries(10, owner="w2")
+
+        assert [sid for sid, _, _ in first] == ["s0", "s1", "s2"]
+        assert second == []
+        assert first[0][1]["asset_data"] == {"n": 0}
+
+        retry_queue.remove_from_retry_queue("s0")
+        assert retry_queue.nack_retry("s1", "w1") == ("requeued", 1)
+        assert retry_queue.nack_retry("s2", "w2") == ("stale", 0)
+        assert retry_queue.get_queue_size() == 2
+        assert r.hget(retry_queue.RETRY_ITEMS_KEY, "s0") is None
+
+    def test_expired_lease_moves_to_the_next_claimer(self, r):
+        _queue(2)
+        retry_queue.claim_retries(10, owner="dead", lease_seconds=-1)
+
+        taken = retry_queue.claim_retries(10, owner="w2")
+        assert [sid for sid, _, _ in taken] == ["s0", "s1"]
+
+        # The old owner can neither extend nor give back what it lost
+        assert retry_queue.extend_leases("dead", ["s0", "s1"]) == 0
+        assert retry_queue.nack_retry("s0", "dead") == ("stale", 0)
+        assert retry_queue.extend_leases("w2", ["s0", "s1"]) == 2
+
+    def test_lost_lease_is_neither_committed_nor_acked(self, r, monkeypatch):
+        submitted = []
+
+        def commit_batch(preps):
+            submitted.extend(p["asset"]["data"]["n"] for p in preps)
+            return ["txn"] * len(preps)
+        monkeypatch.setattr(retry_queue, "commit_transactions_batch_via_graphql", commit_batch)
+        _queue(3)
+        real_claim = retry_queue.claim_retries
+
+        def claim_then_lose_s1(*args, **kwargs):
+            claimed = real_claim(*args, **kwargs)
+            # w1 stalls past its lease on s1 and w2 claims it
+            _expire(r, "s1")
+            assert [sid for sid, _, _ in real_claim(10, owner="w2")] == ["s1"]
+            return claimed
+        monkeypatch.setattr(retry_queue, "claim_retries", claim_then_lose_s1)
+
+        stats = retry_queue.process_retry_queue(max_items=10, owner="w1")
+
+        assert submitted == [0, 2]
+        assert (stats["success"], stats["skipped"]) == (2, 1)
+        assert list(_due(r)) == ["s1"] and _lease(r, "s1") == "w2"
+
+    def test_lease_lost_during_commit_is_not_acked_or_resubmitted(self, r, monkeypatch):
+        submitted = []
+
+        def commit_batch(preps):
+            submitted.extend(p["asset"]["data"]["n"] for p in preps)
+            if len(submitted) == 2:
+                # The request outlives w1's lease on s0 and w2 claims it
+                _expire(r, "s0")
+                assert [sid for sid, _, _ in retry_queue.claim_retries(10, owner="w2")] == ["s0"]
+            return ["txn-%d" % p["asset"]["data"]["n"] for p in preps]
+        monkeypatch.setattr(retry_queue, "commit_transactions_batch_via_graphql", commit_batch)
+        _queue(2)
+
+        retry_queue.process_retry_queue(max_items=10, owner="w1")
+
+        # w1's ack of s0 is refused by the ACK script; the commit is in the ledger
+        assert list(_due(r)) == ["s0"] and _lease(r, "s0") == "w2"
+        assert r.ledger == {"s0": "txn-0", "s1": "txn-1"}
+
+        # When w2 drains s0 it finds the ledger entry and acks without resubmitting
+        _expire(r, "s0")
+        stats = retry_queue.process_retry_queue(max_items=10, owner="w2")
+        assert submitted == [0, 1]
+        assert stats["skipped"] == 1 and _due(r) == {}
+
+    def test_ack_by_a_former_owner_leaves_the_item(self, r):
+        _queue(1)
+        retry_queue.claim_retries(1, owner="dead", lease_seconds=-1)
+        retry_queue.claim_retries(1, owner="w2")
+
+        retry_queue.remove_from_retry_queue("s0", owner="dead")
+        assert retry_queue.get_queue_size() == 1
+        assert _lease(r, "s0") == "w2"
+        assert r.hget(retry_queue.RETRY_ITEMS_KEY, "s0") is not None
+
+        retry_queue.remove_from_retry_queue("s0", owner="w2")
+        assert retry_queue.get_queue_size() == 0
+        assert _lease(r, "s0") is None
+
+    def test_nack_by_a_former_owner_leaves_the_new_lease(self, r):
+        _queue(1)
+        retry_queue.claim_retries(1, owner="dead", lease_seconds=-1)
+        retry_queue.claim_retries(1, owner="w2")
+        deadline = _due(r)["s0"]
+
+        assert retry_queue.nack_retry("s0", "dead") == ("stale", 0)
+        assert retry_queue.nack_retry("s0", "dead", count_attempt=False) == ("stale", 0)
+
+        assert _lease(r, "s0") == "w2" and _due(r)["s0"] == deadline
+        assert retry_queue.get_retry_attempts("s0") == 0
+        assert retry_queue.nack_retry("s0", "w2") == ("requeued", 1)
+
+    def test_heartbeat_keeps_leases_alive_during_commit(self, r, monkeypatch):
+        _queue(1)
+        retry_queue.claim_retries(1, owner="w1", lease_seconds=1)
+        deadline = _due(r)["s0"]
+
+        with retry_queue.LeaseHeartbeat("w1", ["s0"], interval=0.01):
+            time.sleep(0.1)
+
+        assert _due(r)["s0"] > deadline + 30
+
+    def test_pending_tuples_still_remove_by_original_json(self, r):
+        _queue(2)
+        retry_queue.add_to_retry_queue("s1", {"n": 1})
+
+        pending = retry_queue.get_pending_retries(10)
+        assert [item["stroke_id"] for _, item in pending] == ["s0", "s1"]
+
+        original_json, item = pending[0]
+        retry_queue.remove_from_retry_queue(item["stroke_id"], original_json)
+        assert [item["stroke_id"] for _, item in retry_queue.get_pending_retries(10)] == ["s1"]
+        assert b"s0" not in r.smembers(retry_queue.RETRY_DEDUP_KEY)
+
+    def test_ledger_prevents_double_commits(self, r, monkeypatch):
+        submitted = []
+
+        def commit_batch(preps):
+            submitted.extend(p["asset"]["data"]["n"] for p in preps)
+            return ["txn-%d" % p["asset"]["data"]["n"] for p in preps]
+        monkeypatch.setattr(retry_queue, "commit_transactions_batch_via_graphql", commit_batch)
+        r.ledger["s9"] = "txn-landed"
+        _queue(3)
+        retry_queue.add_to_retry_queue("s9", {"n": 9})
+        # Committed by the mirror after it was queued
+        r.ledger["s1"] = "txn-mirrored"
+
+        stats = retry_queue.process_retry_queue(max_items=10)
+
+        assert sorted(submitted) == [0, 2]
+        assert (stats["success"], stats["skipped"]) == (2, 1)
+        assert _due(r) == {} and r.ledger["s0"] == "txn-0"
+
+    def test_legacy_members_are_migrated(self, r):
+        legacy = json.dumps({"stroke_id": "old", "asset_data": {"n": 9}, "timestamp": 1, "attempts": 0}, sort_keys=True)
+        r.zadd(retry_queue.RETRY_QUEUE_KEY, {legacy: 123.0})
+        r.set(f"{retry_queue.RETRY_ATTEMPTS_KEY}:old", b"4")
+
+        assert retry_queue.migrate_legacy_retry_queue() == 1
+        assert _due(r) == {"old": 123.0}
+        assert retry_queue.get_retry_attempts("old") == 4
+        assert retry_queue.get_pending_retries(1)[0][1]["asset_data"] == {"n": 9}
+        assert retry_queue.migrate_legacy_retry_queue() == 0
+
+    def test_claim_migrates_legacy_members_enqueued_mid_deploy(self, r):
+        _queue(1)
+        legacy = json.dumps({"stroke_id": "old", "asset_data": {"n": 9}, "timestamp": 1, "attempts": 0}, sort_keys=True)
+        r.zadd(retry_queue.RETRY_QUEUE_KEY, {legacy: 1.0})
+
+        first = retry_queue.claim_retries(10, owner="w1")
+        assert [sid for sid, _, _ in first] == ["s0"]
+        assert legacy not in _due(r)
+
+        second = retry_queue.claim_retries(10, owner="w1")
+        assert [(sid, item["asset_data"]) for sid, item, _ in second] == [("old", {"n": 9})]
+
+    def test_adaptive_batch_size(self):
+        sizer = retry_queue.AdaptiveBatchSize(initial=100, minimum=10, maximum=400, target_latency_ms=1000)
+
+        assert sizer.update(100, 0, 200) == 200
+        assert sizer.update(100, 0, 200) == 400
+        assert sizer.update(100, 0, 200) == 400
+        assert sizer.update(90, 10, 200) == 300
+        assert sizer.update(10, 90, 200) == 150
+        assert sizer.update(100, 0, 5000) == 75
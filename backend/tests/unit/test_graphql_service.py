@@ -1,15 +1,27 @@
 import pytest
 from unittest.mock import patch, MagicMock
 import json
+import requests
 
-from services.graphql_service import commit_transaction_via_graphql
+import services.graphql_service as graphql_service
+from services.graphql_service import (
+    commit_transaction_via_graphql, commit_transactions_batch_via_graphql, CircuitOpenError,
+    CommitOutcomeUnknown
+)
+
+
+@pytest.fixture(autouse=True)
+def closed_breaker():
+    graphql_service._breaker.reset()
+    yield
+    graphql_service._breaker.reset()
 
 
 @pytest.mark.unit
 class TestGraphQLService:
     
-    @patch('services.graphql_service.requests')
-    def test_commit_transaction_success(self, mock_requests):
+    @patch('services.graphql_service._get_session')
+    def test_commit_transaction_success(self, mock_session):
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {
@@ -19,7 +31,7 @@ class TestGraphQLService:
                 }
             }
         }
-        mock_requests.post.return_value = mock_response
+        mock_session.return_value.post.return_value = mock_response
         
         payload = {
             'operation': 'CREATE',
@@ -32,33 +44,33 @@ class TestGraphQLService:
         result = commit_transaction_via_graphql(payload)
         
         assert result == 'txn-123'
-        mock_requests.post.assert_called_once()
+        mock_session.return_value.post.assert_called_once()
     
-    @patch('services.graphql_service.requests')
-    def test_commit_transaction_network_error(self, mock_requests):
-        mock_requests.post.side_effect = Exception('Network error')
+    @patch('services.graphql_service._get_session')
+    def test_commit_transaction_network_error(self, mock_session):
+        mock_session.return_value.post.side_effect = Exception('Network error')
         
         payload = {'operation': 'CREATE', 'asset': {}}
         
         with pytest.raises(Exception):
             commit_transaction_via_graphql(payload)
     
-    @patch('services.graphql_service.requests')
-    def test_commit_transaction_invalid_response(self, mock_requests):
+    @patch('services.graphql_service._get_session')
+    def test_commit_transaction_invalid_response(self, mock_session):
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {
             'errors': [{'message': 'Invalid transaction'}]
         }
-        mock_requests.post.return_value = mock_response
+        mock_session.return_value.post.return_value = mock_response
         
         payload = {'operation': 'CREATE', 'asset': {}}
         
         with pytest.raises(RuntimeError, match='GraphQL errors'):
             commit_transaction_via_graphql(payload)
     
-    @patch('services.graphql_service.requests')
-    def test_commit_transaction_with_signature(self, mock_requests):
+    @patch('services.graphql_service._get_session')
+    def test_commit_transaction_with_signature(self, mock_session):
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {
@@ -68,7 +80,7 @@ class TestGraphQLService:
                 }
             }
         }
-        mock_requests.post.return_value = mock_response
+        mock_session.return_value.post.return_value = mock_response
         
         payload = {
             'operation': 'CREATE',
@@ -81,3 +93,96 @@ class TestGraphQLService:
         result = commit_transaction_via_graphql(payload)
         
         assert result == 'signed-txn-67890'
+
+    @patch('services.graphql_service._get_session')
+    def test_batch_commit_maps_results_per_alias(self, mock_session):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            'data': {'t0': {'id': 'txn-a'}, 't1': None, 't2': {'id': 'txn-c'}},
+            'errors': [{'message': 'bad asset', 'path': ['t1']}]
+        }
+        mock_session.return_value.post.return_value = mock_response
+
+        results = commit_transactions_batch_via_graphql([{'asset': {'data': {'n': i}}} for i in range(3)])
+
+        assert results[0] == 'txn-a' and results[2] == 'txn-c'
+        assert isinstance(results[1], RuntimeError) and 'bad asset' in str(results[1])
+        body = mock_session.return_value.post.call_args.kwargs['json']
+        assert 't1: postTransaction(data: $d1)' in body['query']
+        assert body['variables']['d2'] == {'asset': {'data': {'n': 2}}}
+        mock_session.return_value.post.assert_called_once()
+
+    @patch('services.graphql_service._get_session')
+    def test_batch_commit_network_error_fails_every_item(self, mock_session):
+        mock_session.return_value.post.side_effect = Exception('Network error')
+
+        results = commit_transactions_batch_via_graphql([{'asset': {}}, {'asset': {}}])
+
+        assert len(results) == 2 and all(isinstance(r, Exception) for r in results)
+
+    @patch('services.graphql_service._get_session')
+    def test_batch_read_timeout_reports_unknown_outcome(self, mock_session):
+        mock_session.return_value.post.side_effect = requests.exceptions.ReadTimeout('read timed out')
+
+        results = commit_transactions_batch_via_graphql([{'asset': {}}, {'asset': {}}])
+
+        assert len(results) == 2 and all(isinstance(r, CommitOutcomeUnknown) for r in results)
+
+    @patch('services.graphql_service._get_session')
+    def test_connect_timeout_is_a_plain_failure(self, mock_session):
+        mock_session.return_value.post.side_effect = requests.exceptions.ConnectTimeout('connect timed out')
+
+        results = commit_transactions_batch_via_graphql([{'asset': {}}])
+
+        assert not isinstance(results[0], CommitOutcomeUnknown)
+
+    @patch('services.graphql_service._get_session')
+    def test_server_error_reports_unknown_outcome(self, mock_session):
+        mock_response = MagicMock()
+        mock_response.status_code = 502
+        mock_response.text = 'bad gateway'
+        mock_session.return_value.post.return_value = mock_response
+
+        with pytest.raises(CommitOutcomeUnknown):
+            commit_transaction_via_graphql({'asset': {}})
+
+    @patch('services.graphql_service._get_session')
+    def test_breaker_opens_after_consecutive_failures(self, mock_session):
+        mock_session.return_value.post.side_effect = ConnectionError('refused')
+        breaker = graphql_service._breaker
+
+        for _ in range(breaker.threshold):
+            with pytest.raises(ConnectionError):
+                commit_transaction_via_graphql({'asset': {}})
+
+        assert graphql_service.graphql_circuit_open()
+        with pytest.raises(CircuitOpenError):
+            commit_transaction_via_graphql({'asset': {}})
+        assert mock_session.return_value.post.call_count == breaker.threshold
+
+    @patch('services.graphql_service._get_session')
+    def test_breaker_probe_closes_circuit(self, mock_session):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'data': {'postTransaction': {'id': 'txn-1'}}}
+        mock_session.return_value.post.return_value = mock_response
+        breaker = graphql_service._breaker
+        for _ in range(breaker.threshold):
+            breaker.record_failure()
+        breaker._opened_at -= breaker.reset_secs
+
+        assert commit_transaction_via_graphql({'asset': {}}) == 'txn-1'
+        assert not graphql_service.graphql_circuit_open()
+
+    @patch('services.graphql_service._get_session')
+    def test_post_uses_connect_and_read_timeouts(self, mock_session):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'data': {'postTransaction': {'id': 'txn-1'}}}
+        mock_session.return_value.post.return_value = mock_response
+
+        commit_transaction_via_graphql({'asset': {}})
+
+        timeout = mock_session.return_value.post.call_args.kwargs['timeout']
+        assert timeout == (graphql_service.GRAPHQL_CONNECT_TIMEOUT, graphql_service.GRAPHQL_READ_TIMEOUT)
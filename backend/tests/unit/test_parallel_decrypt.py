@@ -0,0 +1,42 @@
+import pytest
+
+import services.parallel_decrypt as parallel_decrypt
+from services.parallel_decrypt import parallel_map, iter_parallel_map
+
+
+def _square_or_fail(n):
+    if n == 7:
+        raise ValueError("bad blob")
+    return n * n
+
+
+@pytest.mark.unit
+class TestParallelDecrypt:
+
+    def test_preserves_order_across_chunks(self):
+        items = list(range(1000))
+        out = parallel_map(_square_or_fail, items, workers=4, chunk_size=16)
+
+        assert len(out) == 1000
+        assert out[7] is None
+        assert out[:7] == [n * n for n in range(7)] and out[999] == 999 * 999
+
+    def test_small_inputs_run_inline(self, monkeypatch):
+        monkeypatch.setattr(parallel_decrypt, "_get_pool", lambda w: pytest.fail("pool used"))
+
+        assert parallel_map(_square_or_fail, [1, 2, 3], workers=4) == [1, 4, 9]
+
+    def test_streaming_pulls_bounded_windows(self):
+        pulled = []
+
+        def source():
+            for n in range(300):
+                pulled.append(n)
+                yield n
+
+        stream = iter_parallel_map(_square_or_fail, source(), workers=2, chunk_size=50)
+        first = next(stream)
+
+        assert first == 0
+        assert len(pulled) == 100
+        assert list(stream)[-1] == 299 * 299
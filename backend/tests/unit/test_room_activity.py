@@ -0,0 +1,47 @@
+import pytest
+from datetime import datetime
+from bson import ObjectId
+
+import services.room_activity as room_activity
+
+
+class DummyRooms:
+    def __init__(self, fail=False):
+        self.ops = []
+        self.fail = fail
+
+    def bulk_write(self, ops, ordered=True):
+        if self.fail:
+            raise RuntimeError("mongo down")
+        self.ops.extend(ops)
+
+
+@pytest.mark.unit
+class TestRoomActivity:
+
+    def test_touches_coalesce_into_one_max_update_per_room(self, mock_redis, monkeypatch):
+        r, rooms = mock_redis, DummyRooms()
+        monkeypatch.setattr(room_activity, "redis_client", r)
+        monkeypatch.setattr(room_activity, "rooms_coll", rooms)
+        oid = ObjectId()
+
+        for second in range(1, 4):
+            room_activity.touch_room(oid, datetime(2024, 1, 1, 0, 0, second))
+
+        assert room_activity.flush_room_activity() == 1
+        op = rooms.ops[0]
+        assert op._filter == {"_id": oid}
+        assert op._doc == {"$max": {"updatedAt": datetime(2024, 1, 1, 0, 0, 3)}}
+        assert r.hashes == {}
+        assert room_activity.flush_room_activity() == 0
+
+    def test_failed_flush_keeps_activity_for_next_pass(self, mock_redis, monkeypatch):
+        r = mock_redis
+        monkeypatch.setattr(room_activity, "redis_client", r)
+        monkeypatch.setattr(room_activity, "rooms_coll", DummyRooms(fail=True))
+        oid = ObjectId()
+
+        room_activity.touch_room(oid)
+
+        assert room_activity.flush_room_activity() == 0
+        assert list(r.hashes[room_activity.ACTIVITY_KEY]) == [str(oid)]
@@ -0,0 +1,89 @@
+import json
+import pytest
+
+import services.room_draw_index as room_draw_index
+
+
+class DummyPipeline:
+    def __init__(self, r):
+        self.r = r
+        self.calls = []
+
+    def zadd(self, key, mapping):
+        self.calls.append((key, mapping))
+        return self
+
+    def execute(self):
+        for key, mapping in self.calls:
+            self.r.zadd(key, mapping)
+
+
+class DummyRedis:
+    def __init__(self):
+        self.kv = {}
+        self.zsets = {}
+
+    def pipeline(self, transaction=True):
+        return DummyPipeline(self)
+
+    def get(self, key):
+        return self.kv.get(key)
+
+    def set(self, key, value):
+        self.kv[key] = str(value).encode()
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrangebyscore(self, key, lo, hi):
+        z = self.zsets.get(key, {})
+        return [m.encode() for m, sc in sorted(z.items(), key=lambda kv: kv[1]) if lo <= sc <= hi]
+
+
+@pytest.mark.unit
+class TestRoomDrawIndex:
+
+    def test_uncovered_until_scanned(self, monkeypatch):
+        r = DummyRedis()
+        monkeypatch.setattr(room_draw_index, "redis_client", r)
+        room_draw_index.index_draw_key("r1", "res-canvas-draw-7")
+
+        assert room_draw_index.get_room_draw_keys("r1", 0, 10) is None
+
+        room_draw_index.index_draw_keys([("r1", "res-canvas-draw-3"), ("r2", "res-canvas-draw-4"), (None, "res-canvas-draw-5")])
+        room_draw_index.mark_covered("r1", 0)
+
+        assert room_draw_index.get_room_draw_keys("r1", 0, 10) == ["res-canvas-draw-3", "res-canvas-draw-7"]
+        assert room_draw_index.get_room_draw_keys("r1", 4, 10) == ["res-canvas-draw-7"]
+
+    def test_range_below_coverage_is_not_trusted(self, monkeypatch):
+        r = DummyRedis()
+        monkeypatch.setattr(room_draw_index, "redis_client", r)
+        room_draw_index.mark_covered("r1", 50)
+        room_draw_index.mark_covered("r1", 80)
+
+        assert room_draw_index.get_room_draw_keys("r1", 50, 60) == []
+        assert room_draw_index.get_room_draw_keys("r1", 0, 60) is None
+
+    def test_failed_keys_keep_coverage_above_them(self):
+        failed = ["res-canvas-draw-4", "res-canvas-draw-7", "res-canvas-draw-1"]
+        assert room_draw_index.coverage_start(2, failed) == 8
+        assert room_draw_index.coverage_start(2, []) == 2
+
+    def test_failed_index_write_is_reported(self, monkeypatch):
+        class BrokenPipeline(DummyPipeline):
+            def execute(self):
+                raise ConnectionError("down")
+
+        r = DummyRedis()
+        r.pipeline = lambda transaction=True: BrokenPipeline(r)
+        monkeypatch.setattr(room_draw_index, "redis_client", r)
+
+        assert room_draw_index.index_draw_keys([("r1", "res-canvas-draw-3")]) is False
+        assert room_draw_index.index_draw_keys([]) is True
+
+    def test_room_of_entry_peels_nested_value(self):
+        entry = {"id": "res-canvas-draw-1", "value": json.dumps({"roomId": "r9", "pathData": []})}
+        assert room_draw_index.room_of_entry(entry) == "r9"
+        assert room_draw_index.room_of_entry({"roomId": {"$oid": "abc"}}) == "abc"
+        assert room_draw_index.room_of_entry({"value": "not json"}) is None
@@ -0,0 +1,116 @@
+import pytest
+from bson import ObjectId
+
+import services.room_snapshot as room_snapshot
+import services.stroke_index as stroke_index
+import services.undone_index as undone_index
+
+
+class DummySnapshots:
+    def __init__(self):
+        self.doc = None
+
+    def find_one(self, query):
+        return self.doc
+
+    def replace_one(self, query, doc, upsert=False):
+        self.doc = doc
+
+
+class DummyRooms:
+    def __init__(self, ready=()):
+        self.ready = set(ready)
+
+    def find_one(self, query, projection=None):
+        if str(query["_id"]) in self.ready:
+            return {"_id": query["_id"], stroke_index.READY_FIELD: True}
+        return None
+
+
+class DummyCursor(list):
+    def sort(self, keys):
+        return DummyCursor(sorted(self, key=lambda row: tuple(row[k] for k, _ in keys)))
+
+
+class DummyIndexColl:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def find(self, query, projection=None):
+        after = (query.get("ts") or {}).get("$gt")
+        return DummyCursor(r for r in self.rows if r["roomId"] == query["roomId"] and (after is None or r["ts"] > after))
+
+
+class DummyStrokes:
+    def aggregate(self, pipeline):
+        return []
+
+    def find_one(self, *args, **kwargs):
+        return None
+
+
+@pytest.fixture
+def env(mock_redis, monkeypatch):
+    r = mock_redis
+    snaps = DummySnapshots()
+    monkeypatch.setattr(room_snapshot, "redis_client", r)
+    monkeypatch.setattr(room_snapshot, "room_snapshots_coll", snaps)
+    monkeypatch.setattr(room_snapshot, "strokes_coll", DummyStrokes())
+    monkeypatch.setattr(room_snapshot, "rooms_coll", DummyRooms())
+    monkeypatch.setattr(undone_index, "redis_client", r)
+    monkeypatch.setattr(undone_index, "strokes_coll", DummyStrokes())
+    return r, snaps
+
+
+@pytest.mark.unit
+class TestRoomSnapshot:
+
+    def test_snapshot_served_until_invalidated(self, env):
+        r, snaps = env
+        r.sadd("room:r1:u1:undone_strokes", b"s1")
+        r.sadd("cut-stroke-ids:r1", b"s2")
+        r.set("last-clear-ts:r1", b"100")
+
+        state = room_snapshot.load_room_state("r1")
+        assert state == {
+            "undoneIds": {"s1"}, "cutIds": {"s2"}, "clearTs": 100,
+            "visibleIds": None, "coveredTs": 100, "coveredId": "",
+        }
+        assert snaps.doc["epoch"] == 0
+
+        # New undo without invalidation is not visible: the snapshot is served
+        undone_index.record_undo("r1", ["s3"], 200)
+        assert room_snapshot.load_room_state("r1")["undoneIds"] == {"s1"}
+
+        room_snapshot.invalidate_snapshot("r1")
+        assert "r1" in r.smembers(room_snapshot.DIRTY_SET_KEY)
+        state = room_snapshot.load_room_state("r1")
+        assert state["undoneIds"] == {"s1", "s3"}
+        assert snaps.doc["epoch"] == 1
+
+    def test_visible_ids_cover_settled_rows(self, env, monkeypatch):
+        r, snaps = env
+        room_id = str(ObjectId())
+        settle = room_snapshot.SNAPSHOT_SETTLE_MS
+        rows = [
+            {"roomId": room_id, "strokeId": "old", "ts": 50},
+            {"roomId": room_id, "strokeId": "a", "ts": 1000},
+            {"roomId": room_id, "strokeId": "b", "ts": 1000},
+            {"roomId": room_id, "strokeId": "undone", "ts": 2000},
+            {"roomId": room_id, "strokeId": "cut", "ts": 3000},
+            {"roomId": room_id, "strokeId": "recent", "ts": 3000 + settle},
+        ]
+        monkeypatch.setattr(room_snapshot, "rooms_coll", DummyRooms([room_id]))
+        monkeypatch.setattr(stroke_index, "stroke_index_coll", DummyIndexColl(rows))
+        r.set(f"last-clear-ts:{room_id}", b"100")
+        r.sadd(f"room:{room_id}:u1:undone_strokes", b"undone")
+        r.sadd(f"cut-stroke-ids:{room_id}", b"cut")
+
+        room_snapshot.load_room_state(room_id)
+        assert snaps.doc["visibleIds"] == ["a", "b"]
+        assert (snaps.doc["coveredTs"], snaps.doc["coveredId"]) == (3000, "cut")
+
+        # Served from the stored snapshot on the next read
+        state = room_snapshot.load_room_state(room_id)
+        assert state["visibleIds"] == ["a", "b"]
+        assert (state["coveredTs"], state["coveredId"]) == (3000, "cut")
@@ -0,0 +1,95 @@
+import json
+import pytest
+
+import services.room_state as room_state
+
+
+class DummyRedis:
+    def __init__(self):
+        self.kv = {}
+        self.published = []
+
+    def get(self, key):
+        return self.kv.get(key)
+
+    def mget(self, keys):
+        return [self.kv.get(k) for k in keys]
+
+    def incr(self, key):
+        self.kv[key] = int(self.kv.get(key) or 0) + 1
+        return self.kv[key]
+
+    def publish(self, channel, message):
+        self.published.append((channel, json.loads(message)))
+
+
+@pytest.fixture
+def env(monkeypatch):
+    r = DummyRedis()
+    monkeypatch.setattr(room_state, "redis_client", r)
+    monkeypatch.setattr(room_state, "_ensure_listener", lambda: None)
+    monkeypatch.setattr(room_state, "_cache", {})
+    room_state._listener_ready.set()
+    yield r
+    room_state._listener_ready.clear()
+
+
+@pytest.mark.unit
+class TestRoomState:
+
+    def test_cached_until_bumped(self, env):
+        calls = []
+
+        def loader(room_id):
+            calls.append(room_id)
+            return {"clearTs": len(calls)}
+
+        assert room_state.get_room_state("r1", loader)["clearTs"] == 1
+        assert room_state.get_room_state("r1", loader)["clearTs"] == 1
+        assert calls == ["r1"]
+
+        room_state.bump_room_state("r1")
+        state = room_state.get_room_state("r1", loader)
+        assert state["clearTs"] == 2
+        assert state["version"] == 1
+        assert env.published == [(room_state.ROOM_STATE_CHANNEL, {"roomId": "r1", "version": 1})]
+
+    def test_bump_with_lost_message_is_seen_on_next_read(self, env):
+        calls = []
+
+        def loader(room_id):
+            calls.append(room_id)
+            return {"clearTs": len(calls)}
+
+        room_state.get_room_state("r1", loader)
+        # Another process bumped the room and this one missed the message
+        env.incr(room_state._version_key("r1"))
+
+        assert room_state.get_room_state("r1", loader)["clearTs"] == 2
+        assert room_state.get_room_state("r1", loader)["clearTs"] == 2
+        assert calls == ["r1", "r1"]
+
+    def test_global_bump_drops_every_room(self, env):
+        loader = lambda room_id: {}
+        room_state.get_room_state("r1", loader)
+        room_state.get_room_state("r2", loader)
+
+        room_state.bump_room_state()
+
+        assert room_state._cache == {}
+        assert room_state.get_room_state("r2", loader)["undoEpoch"] == 1
+
+    def test_not_cached_without_listener(self, env):
+        room_state._listener_ready.clear()
+        calls = []
+        loader = lambda room_id: calls.append(room_id) or {}
+
+        room_state.get_room_state("r1", loader)
+        room_state.get_room_state("r1", loader)
+
+        assert calls == ["r1", "r1"]
+
+    def test_mirrored_undo_marker_bumps(self, env):
+        blocks = [{"transactions": [{"value": {"asset": {"data": {"id": "undo-abc"}}}}]}]
+        room_state.bump_for_mirrored_blocks(blocks)
+        assert env.kv[room_state._version_key(room_state.ALL_ROOMS)] == 1
@@ -0,0 +1,39 @@
+import time
+import pytest
+
+import services.stroke_cache as stroke_cache
+
+
+@pytest.fixture
+def r(mock_redis, monkeypatch):
+    monkeypatch.setattr(stroke_cache, "redis_client", mock_redis)
+    return mock_redis
+
+
+@pytest.mark.unit
+class TestStrokeCache:
+
+    def test_roundtrip_orders_by_ts_without_scan(self, r, monkeypatch):
+        monkeypatch.setattr(r, "scan_iter", lambda match=None: pytest.fail("cache read scanned keys"))
+        now = int(time.time() * 1000)
+        stroke_cache.cache_strokes("r1", [{"id": "b", "ts": now + 5}, {"id": "a", "ts": now}])
+
+        entries = stroke_cache.get_cached_strokes("r1")
+
+        assert [e["id"] for e in entries] == ["a", "b"]
+
+    def test_expired_entries_are_trimmed(self, r):
+        now = int(time.time() * 1000)
+        stroke_cache.cache_strokes("r1", [{"id": "old", "ts": 1}, {"id": "new", "ts": now}])
+        r.kv.pop("stroke:r1:new")  # key TTL elapsed
+
+        assert stroke_cache.get_cached_strokes("r1") == []
+        assert r.zsets["stroke-ids:r1"] == {}
+
+    def test_shared_pipeline_is_left_for_caller(self, r):
+        pipe = r.pipeline()
+        stroke_cache.cache_strokes("r1", [{"id": "a", "ts": 1}, {"id": "b", "ts": 2}], pipe=pipe)
+
+        assert r.kv == {}
+        pipe.execute()
+        assert set(r.zsets["stroke-ids:r1"]) == {"a", "b"}
@@ -0,0 +1,71 @@
+import pytest
+
+from services.stroke_codec import (
+    pack_path, unpack_path, is_packed_path, validate_path, path_arrays, path_bbox, stroke_for_client,
+)
+from middleware.validators import validate_stroke_payload
+
+
+@pytest.mark.unit
+class TestPackedPath:
+
+    def test_integer_path_round_trips_exactly(self):
+        path = [{"x": i * 3, "y": 500 - i} for i in range(50)]
+        packed = pack_path(path)
+
+        assert packed["enc"] == "d16" and packed["scale"] == 1 and packed["n"] == 50
+        assert unpack_path(packed) == path
+
+    def test_fractional_path_keeps_hundredths(self):
+        path = [{"x": 10.25, "y": 3.5}, {"x": 11.75, "y": 4.01}, {"x": 9.5, "y": 2.0}]
+        out = unpack_path(pack_path(path))
+
+        assert [(p["x"], p["y"]) for p in out] == [(10.25, 3.5), (11.75, 4.01), (9.5, 2.0)]
+
+    def test_packing_never_loses_precision(self):
+        path = [{"x": 10.125, "y": 3.5}, {"x": 0.1 + 0.2, "y": 4.0}]
+        assert unpack_path(pack_path(path[:1])) == path[:1]
+        assert pack_path(path) is None
+
+        stroke = {"id": "s1", "pathData": path}
+        assert stroke_for_client(stroke, True) == stroke
+
+    def test_large_jumps_use_int32_deltas(self):
+        packed = pack_path([{"x": 0, "y": 0}, {"x": 100000, "y": -100000}])
+        assert packed["enc"] == "d32"
+        assert unpack_path(packed) == [{"x": 0, "y": 0}, {"x": 100000, "y": -100000}]
+
+    def test_non_point_paths_are_not_packed(self):
+        assert pack_path({"tool": "cut", "rect": {}}) is None
+        assert pack_path([{"x": 1, "y": 2, "pressure": 0.5}]) is None
+        assert pack_path([]) is None
+
+    def test_validate_rejects_truncated_buffer(self):
+        packed = pack_path([{"x": i, "y": i} for i in range(10)])
+        assert validate_path(packed) == (True, None)
+
+        packed["n"] = 11
+        ok, err = validate_path(packed)
+        assert not ok and "length" in err
+
+    def test_bbox_matches_plain_points(self):
+        path = [{"x": 5, "y": 9}, {"x": -2, "y": 40}, {"x": 17, "y": 1}]
+        assert path_bbox(pack_path(path)) == path_bbox(path) == (-2, 1, 17, 40)
+        assert path_arrays([[1, 2], [3, 4]]) == ([1.0, 3.0], [2.0, 4.0])
+
+    def test_stroke_for_client_converts_either_way(self):
+        stroke = {"id": "s1", "pathData": [{"x": 1, "y": 2}, {"x": 3, "y": 4}]}
+        packed = stroke_for_client(stroke, True)
+
+        assert is_packed_path(packed["pathData"])
+        assert stroke_for_client(packed, False) == stroke
+        assert stroke["pathData"] == [{"x": 1, "y": 2}, {"x": 3, "y": 4}]
+
+    def test_stroke_payload_validates_packed_path(self):
+        packed = pack_path([{"x": 1, "y": 2}, {"x": 3, "y": 4}])
+        payload = {"stroke": {"color": "#000000", "lineWidth": 2, "pathData": packed}}
+        assert validate_stroke_payload(payload) == (True, None)
+
+        payload["stroke"]["pathData"] = dict(packed, data="!!")
+        ok, err = validate_stroke_payload(payload)
+        assert not ok and "pathData" in err
@@ -0,0 +1,37 @@
+import json
+import pytest
+
+from services.stroke_decoder import decode_stroke, detect_shape, coerce_ts, iter_assets
+
+
+STROKE = {"id": "s1", "timestamp": 5, "color": "#000"}
+
+
+@pytest.mark.unit
+class TestStrokeDecoder:
+
+    @pytest.mark.parametrize("doc,shape", [
+        ({"roomId": "r1", "stroke": dict(STROKE)}, "stroke"),
+        ({"transactions": [{"value": {"asset": {"data": {"stroke": dict(STROKE)}}}}]}, "transactions"),
+        ({"asset": {"data": {"value": json.dumps(STROKE)}}}, "asset"),
+        ({"value": json.dumps(json.dumps(STROKE))}, "value"),
+    ])
+    def test_plaintext_shapes(self, doc, shape):
+        assert detect_shape(doc) == shape
+        assert decode_stroke(doc)["id"] == "s1"
+
+    def test_encrypted_without_key_is_skipped(self):
+        assert decode_stroke({"roomId": "r1", "blob": {"nonce": "n", "ct": "c"}}) is None
+
+    def test_mirrored_marker_is_not_a_stroke(self):
+        marker = {"transactions": [{"value": {"asset": {"data": {
+            "id": "undo-s1", "type": "undo_marker", "value": json.dumps(STROKE)}}}}]}
+        assert decode_stroke(marker) is None
+        assert [a["id"] for a in iter_assets(marker)] == ["undo-s1"]
+
+    def test_coerce_ts(self):
+        assert coerce_ts({"$numberLong": "12"}) == 12
+        assert coerce_ts(b"7") == 7
+        assert coerce_ts("3.0") == 3
+        assert coerce_ts(None) is None
+        assert coerce_ts("abc") is None
@@ -0,0 +1,115 @@
+import json
+import os
+import pytest
+
+import services.stroke_index as stroke_index
+from services.crypto_service import encrypt_for_room
+
+
+class DummyCursor(list):
+    def sort(self, keys):
+        self.sort_keys = keys
+        return self
+
+
+class DummyIndexColl:
+    def __init__(self):
+        self.ops = []
+        self.queries = []
+
+    def bulk_write(self, ops, ordered=True):
+        self.ops.extend(ops)
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return DummyCursor()
+
+
+@pytest.mark.unit
+class TestStrokeIndex:
+
+    def test_make_row_public(self):
+        row = stroke_index.make_row("r1", {"id": "s1", "ts": 10, "user": "u"})
+        assert row["strokeId"] == "s1"
+        assert row["ts"] == 10
+        assert row["stroke"]["id"] == "s1"
+        assert "blob" not in row
+
+    def test_make_row_requires_id_and_ts(self):
+        assert stroke_index.make_row("r1", {"ts": 10}) is None
+        assert stroke_index.make_row("r1", {"id": "s1"}) is None
+
+    def test_row_from_mirror_doc(self):
+        doc = {"transactions": [{"value": {"asset": {"data": {
+            "roomId": "r1", "type": "public",
+            "stroke": {"drawingId": "s2", "timestamp": {"$numberLong": "42"}}
+        }}}}]}
+        row = stroke_index.row_from_doc(doc, "r1")
+        assert row["strokeId"] == "s2"
+        assert row["ts"] == 42
+
+    def test_row_from_encrypted_doc_keeps_ciphertext(self):
+        rk = os.urandom(32)
+        blob = encrypt_for_room(rk, json.dumps({"id": "s3", "ts": 7}).encode())
+        doc = {"roomId": "r1", "ts": 7, "blob": blob}
+        assert stroke_index.row_from_doc(doc, "r1") is None
+        row = stroke_index.row_from_doc(doc, "r1", rk)
+        assert row["strokeId"] == "s3"
+        assert row["blob"] == blob
+        assert "stroke" not in row
+
+    def test_index_mirrored_blocks(self, monkeypatch):
+        coll = DummyIndexColl()
+        monkeypatch.setattr(stroke_index, "stroke_index_coll", coll)
+        blocks = [{"id": 1, "transactions": [
+            {"value": {"asset": {"data": {"roomId": ["r1"], "stroke": {"id": "a", "ts": 1}}}}},
+            {"value": {"asset": {"data": {"type": "undo_marker", "roomId": "r1", "strokeId": "a"}}}},
+        ]}]
+        assert stroke_index.index_mirrored_blocks(blocks) == 1
+        assert coll.ops[0]._filter == {"roomId": "r1", "strokeId": "a"}
+
+    def test_find_room_strokes_range(self, monkeypatch):
+        coll = DummyIndexColl()
+        monkeypatch.setattr(stroke_index, "stroke_index_coll", coll)
+        stroke_index.find_room_strokes("r1", after_ts=100)
+        stroke_index.find_room_strokes("r1", start_ts=5, end_ts=9)
+        assert coll.queries[0] == {"roomId": "r1", "ts": {"$gt": 100}}
+        assert coll.queries[1] == {"roomId": "r1", "ts": {"$gte": 5, "$lte": 9}}
+
+    def test_find_room_strokes_by_id(self, monkeypatch):
+        coll = DummyIndexColl()
+        monkeypatch.setattr(stroke_index, "stroke_index_coll", coll)
+        assert stroke_index.find_room_strokes_by_id("r1", []) == []
+        stroke_index.find_room_strokes_by_id("r1", ["a", "b"])
+        assert coll.queries == [{"roomId": "r1", "strokeId": {"$in": ["a", "b"]}}]
+
+    def test_find_room_strokes_after_cursor(self, monkeypatch):
+        coll = DummyIndexColl()
+        monkeypatch.setattr(stroke_index, "stroke_index_coll", coll)
+        stroke_index.find_room_strokes_after("r1", 100, "s5")
+        assert coll.queries[0] == {
+            "roomId": "r1",
+            "$or": [{"ts": {"$gt": 100}}, {"ts": 100, "strokeId": {"$gt": "s5"}}]
+        }
+
+    def test_failed_index_write_flags_room_for_backfill(self, monkeypatch):
+        attempts = []
+        updates = []
+
+        class DownColl:
+            def bulk_write(self, ops, ordered=True):
+                attempts.append(len(ops))
+                raise RuntimeError("mongo blip")
+
+        class Rooms:
+            def update_one(self, query, update):
+                updates.append((query, update))
+
+        monkeypatch.setattr(stroke_index, "stroke_index_coll", DownColl())
+        monkeypatch.setattr(stroke_index, "rooms_coll", Rooms())
+        monkeypatch.setattr(stroke_index, "INDEX_RETRY_DELAY_SECONDS", 0)
+        room_id = "0123456789abcdef01234567"
+
+        assert stroke_index.index_stroke(room_id, {"id": "s1", "ts": 1}) == 0
+        assert attempts == [1] * stroke_index.INDEX_WRITE_ATTEMPTS
+        assert updates == [({"_id": stroke_index.ObjectId(room_id)}, {"$unset": {stroke_index.READY_FIELD: ""}})]
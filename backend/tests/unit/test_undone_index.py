@@ -0,0 +1,70 @@
+import pytest
+from bson import ObjectId
+
+import services.undone_index as undone_index
+
+
+class DummyRedis:
+    def __init__(self):
+        self.hashes = {}
+        self.sets = {}
+        self.scans = 0
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+
+    def hdel(self, key, *fields):
+        for f in fields:
+            self.hashes.get(key, {}).pop(f, None)
+
+    def hkeys(self, key):
+        return [k.encode() for k in self.hashes.get(key, {})]
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    def scan_iter(self, match=None):
+        self.scans += 1
+        prefix, suffix = match.split("*")[0], match.split("*")[-1]
+        return [k for k in self.sets if k.startswith(prefix) and k.endswith(suffix)]
+
+
+class DummyStrokes:
+    def __init__(self, docs):
+        self.docs = docs
+        self.aggregations = 0
+
+    def aggregate(self, pipeline):
+        self.aggregations += 1
+        return sorted(self.docs, key=lambda d: d["_id"], reverse=True)
+
+
+def _marker(mtype, sid, ts):
+    return {"_id": ObjectId(), "asset": {"data": {"type": mtype, "roomId": "r1", "strokeId": sid, "ts": ts}}}
+
+
+@pytest.mark.unit
+class TestUndoneIndex:
+
+    def test_rebuild_once_then_single_lookup(self, monkeypatch):
+        r = DummyRedis()
+        r.sets["room:r1:u1:undone_strokes"] = {b"a"}
+        coll = DummyStrokes([_marker("undo_marker", "b", 1), _marker("undo_marker", "c", 2), _marker("redo_marker", "c", 3)])
+        monkeypatch.setattr(undone_index, "redis_client", r)
+        monkeypatch.setattr(undone_index, "strokes_coll", coll)
+
+        assert undone_index.get_undone_ids("r1") == {"a", "b"}
+        assert undone_index.get_undone_ids("r1") == {"a", "b"}
+        assert coll.aggregations == 1
+        assert r.scans == 1
+
+    def test_undo_and_redo_maintain_index(self, monkeypatch):
+        r = DummyRedis()
+        monkeypatch.setattr(undone_index, "redis_client", r)
+        monkeypatch.setattr(undone_index, "strokes_coll", DummyStrokes([]))
+        assert undone_index.get_undone_ids("r1") == set()
+
+        undone_index.record_undo("r1", ["x", "y"], 10)
+        undone_index.record_redo("r1", ["x"])
+
+        assert undone_index.get_undone_ids("r1") == {"y"}
@@ -20,6 +20,8 @@ def extract_stroke_data(room_id):
     try:
         from collections import Counter, defaultdict
         from services.db import mongo_client
+        from services.stroke_decoder import decode_stroke
+        from services.stroke_codec import path_arrays
         
         actual_stroke_count = 0
         color_counter = Counter()
@@ -40,9 +42,7 @@ def extract_stroke_data(room_id):
         
         for doc in cursor:
             try:
-                tx = doc.get('transactions', [{}])[0]
-                asset_data = tx.get('value', {}).get('asset', {}).get('data', {})
-                stroke = asset_data.get('stroke', {})
+                stroke = decode_stroke(doc) or {}
                 
                 actual_stroke_count += 1
                 
@@ -57,20 +57,15 @@ def extract_stroke_data(room_id):
                     users.add(user)
                 
                 # Extract coordinates
-                path_data = stroke.get('pathData', [])
-                if path_data and len(path_data) > 0:
-                    for point in path_data:
-                        if len(point) >= 2:
-                            try:
-                                x, y = float(point[0]), float(point[1])
-                                all_points.append((x, y))
-                                min_x = min(min_x, x)
-                                min_y = min(min_y, y)
-                                max_x = max(max_x, x)
-                                max_y = max(max_y, y)
-                            except (ValueError, TypeError):
-                                # Skip points with invalid coordinates
-                                continue
+                # Packed and plain paths both come back as coordinate
+                # columns, so the bbox is a min/max over each column
+                xs, ys = path_arrays(stroke.get('pathData'))
+                if xs:
+                    all_points.extend(zip(xs, ys))
+                    min_x = min(min_x, min(xs))
+                    min_y = min(min_y, min(ys))
+                    max_x = max(max_x, max(xs))
+                    max_y = max(max_y, max(ys))
             except Exception as e:
                 logger.warning(f"Error extracting data from stroke: {e}")
                 continue
@@ -10,17 +10,25 @@ Run this in a separate process:
     
 Or in a screen session:
     screen -S rescanvas_retry_worker -dm python3 workers/graphql_retry_worker.py
+
+To drain a large backlog faster, run several worker processes (here, or on
+other hosts next to the in-app worker threads). Items are leased to one
+worker at a time, so the backlog is shared rather than retried N times:
+    RETRY_WORKER_PROCESSES=4 python3 workers/graphql_retry_worker.py
 """
 
 import time
 import logging
+import multiprocessing
 import sys
 import os
 
 # Add parent directory to path to import from backend
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from services.graphql_retry_queue import process_retry_queue, get_queue_size
+from services.graphql_retry_queue import (
+    drain_retry_queue, get_queue_size, seconds_until_next_retry, migrate_legacy_retry_queue, default_worker_id
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,14 +37,19 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Configuration
-RETRY_INTERVAL_SECONDS = 60  # Process queue every 60 seconds
-BATCH_SIZE = 50  # Process up to 50 items per batch
+RETRY_INTERVAL_SECONDS = 60  # Longest idle wait; sooner if a backed-off item comes due
+BATCH_SIZE = 50  # First drain round; later rounds adapt (see drain_retry_queue)
+WORKER_PROCESSES = int(os.getenv("RETRY_WORKER_PROCESSES", "1"))
 
-def main():
+def run_worker():
     """Main worker loop."""
-    logger.info("GraphQL Retry Worker starting...")
+    owner = default_worker_id()
+    logger.info(f"GraphQL Retry Worker {owner} starting...")
     logger.info(f"Configuration: RETRY_INTERVAL={RETRY_INTERVAL_SECONDS}s, BATCH_SIZE={BATCH_SIZE}")
     
+    # Items queued before the id + hash layout
+    migrate_legacy_retry_queue()
+    
     iteration = 0
     
     try:
@@ -50,15 +63,15 @@ def main():
                 if queue_size > 0:
                     logger.info(f"Iteration {iteration}: Processing retry queue ({queue_size} items pending)")
                     
-                    # Process batch
-                    stats = process_retry_queue(max_items=BATCH_SIZE)
+                    # Drain everything that is due
+                    stats = drain_retry_queue(initial_batch=BATCH_SIZE, owner=owner)
                     
                     if stats['success'] > 0 or stats['failed'] > 0:
                         remaining = get_queue_size()
                         logger.info(
-                            f"Batch complete: {stats['success']} synced, "
-                            f"{stats['failed']} failed, {stats['skipped']} skipped. "
-                            f"Remaining: {remaining}"
+                            f"Drain complete: {stats['success']} synced, "
+                            f"{stats['failed']} failed, {stats['skipped']} skipped in {stats['rounds']} rounds "
+                            f"(batch size now {stats['batch_size']}). Remaining: {remaining}"
                         )
                 else:
                     if iteration % 10 == 1:  # Log every 10 iterations when idle
@@ -70,8 +83,9 @@ def main():
                 logger.error(f"Error in worker iteration {iteration}: {e}")
                 logger.exception("Full traceback:")
             
-            # Wait before next iteration
-            time.sleep(RETRY_INTERVAL_SECONDS)
+            # Wait until the next item is due (at most RETRY_INTERVAL_SECONDS)
+            due_in = seconds_until_next_retry()
+            time.sleep(RETRY_INTERVAL_SECONDS if due_in is None else max(1.0, min(RETRY_INTERVAL_SECONDS, due_in)))
             
     except KeyboardInterrupt:
         logger.info("Worker stopped by user (Ctrl+C)")
@@ -80,5 +94,26 @@ def main():
         logger.exception("Full traceback:")
         sys.exit(1)
 
+def main():
+    """Run one worker loop, or WORKER_PROCESSES of them as child processes."""
+    if WORKER_PROCESSES <= 1:
+        run_worker()
+        return
+    
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=run_worker, name=f"graphql-retry-worker-{i}") for i in range(WORKER_PROCESSES)]
+    for proc in procs:
+        proc.start()
+    logger.info(f"Started {len(procs)} retry worker processes")
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        logger.info("Stopping retry worker processes...")
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.join(timeout=5)
+
 if __name__ == "__main__":
     main()
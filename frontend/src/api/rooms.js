@@ -15,6 +15,7 @@
 import { authFetch, getAuthToken } from '../utils/authUtils';
 import { API_BASE } from '../config/apiConfig';
 import { handleApiResponse } from '../utils/errorHandling';
+import { unpackStroke } from '../utils/packedPath';
 
 const withTK = (headers = {}) => {
   const tk = getAuthToken();
@@ -128,12 +129,14 @@ export async function getRoomStrokes(token, roomId, opts = {}) {
   const params = new URLSearchParams();
   if (opts.start !== undefined && opts.start !== null && opts.start !== '') params.set('start', String(opts.start));
   if (opts.end !== undefined && opts.end !== null && opts.end !== '') params.set('end', String(opts.end));
+  // Freehand paths come back packed (delta-encoded, exact) and are expanded here
+  params.set('pathData', 'packed');
   const q = params.toString();
   const url = `${API_BASE}/rooms/${roomId}/strokes${q ? `?${q}` : ''}`;
   const headers = withTK({ ...(token ? { Authorization: `Bearer ${token}` } : {}) });
   const r = await authFetch(url, { headers });
   const j = await handleApiResponse(r);
-  return j.strokes || [];
+  return (j.strokes || []).map(unpackStroke);
 }
 
 export async function postRoomStroke(token, roomId, stroke, signature, signerPubKey) {
@@ -151,7 +154,7 @@ export async function postRoomStroke(token, roomId, stroke, signature, signerPub
  * Backend: POST /rooms/{id}/strokes/batch
  * Middleware: @require_auth + @require_room_access
  * Optimized for paste operations to reduce network overhead
- * Max 200 strokes per batch
+ * Max 2000 strokes per batch (MAX_STROKES_PER_BATCH on the backend)
  */
 export async function postRoomStrokesBatch(token, roomId, strokes, options = {}) {
   const headers = withTK({ "Content-Type": "application/json", ...(token ? { Authorization: `Bearer ${token}` } : {}) });
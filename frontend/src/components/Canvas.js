@@ -44,6 +44,7 @@ import { getSocket, setSocketToken } from '../services/socket';
 import { handleAuthError } from '../utils/authUtils';
 import { getUsername } from '../utils/getUsername';
 import { getAuthUser } from '../utils/getAuthUser';
+import { unpackPathData } from '../utils/packedPath';
 import { resetMyStacks } from '../api/rooms';
 import { TEMPLATE_LIBRARY } from '../data/templates';
 
@@ -471,7 +472,7 @@ function Canvas({
         `remote_${Date.now()}_${Math.random().toString(36).substr(2, 5)}`,
         stroke.color || "#000000",
         stroke.lineWidth || 5,
-        stroke.pathData || [],
+        unpackPathData(stroke.pathData) || [],
         stroke.ts || stroke.timestamp || Date.now(),
         stroke.user || "Unknown",
         metadata
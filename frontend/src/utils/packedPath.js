@@ -0,0 +1,30 @@
+// Decoder for the packed pathData form (backend services/stroke_codec.py):
+// { enc: "d16" | "d32", scale, n, o: [x0, y0], data: base64 } where data holds
+// n - 1 little-endian int16/int32 x/y deltas after the first point.
+export function isPackedPath(pathData) {
+  return !!pathData && (pathData.enc === 'd16' || pathData.enc === 'd32');
+}
+
+export function unpackPathData(pathData) {
+  if (!isPackedPath(pathData)) return pathData;
+  const raw = atob(pathData.data || '');
+  const bytes = new Uint8Array(raw.length);
+  for (let i = 0; i < raw.length; i++) bytes[i] = raw.charCodeAt(i);
+  const view = new DataView(bytes.buffer);
+  const size = pathData.enc === 'd16' ? 2 : 4;
+  const scale = pathData.scale || 1;
+  let x = pathData.o[0];
+  let y = pathData.o[1];
+  const points = [{ x: x / scale, y: y / scale }];
+  for (let off = 0; off + 2 * size <= bytes.length; off += 2 * size) {
+    x += size === 2 ? view.getInt16(off, true) : view.getInt32(off, true);
+    y += size === 2 ? view.getInt16(off + size, true) : view.getInt32(off + size, true);
+    points.push({ x: x / scale, y: y / scale });
+  }
+  return points;
+}
+
+export function unpackStroke(stroke) {
+  if (!stroke || !isPackedPath(stroke.pathData)) return stroke;
+  return { ...stroke, pathData: unpackPathData(stroke.pathData) };
+}